@@ -1,26 +1,60 @@
-﻿import json
+﻿import copy
+import json
 import sys
 import os
+import threading
+import time
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-try:
-    from simple_agent import SimpleTaara
-    agent = SimpleTaara()
-except Exception as e:
-    agent = None
-    print(f"Agent import error: {e}")
+import metrics
+import singleflight
+from singleflight import IdempotencyConflict, IdempotencyStore, SingleFlight, flight_key
+
+# The agent is built on the first request that needs it, so a cold start
+# only pays for what that request uses
+agent = None
+agent_error = None
+_agent_lock = threading.Lock()
+
+# Coalescing and idempotency only cover requests reaching this warm instance
+flights = SingleFlight() if singleflight.enabled() else None
+idempotency = IdempotencyStore.from_env()
+
+def get_agent():
+    """Create the agent once per instance; None if it failed to start"""
+    global agent, agent_error
+    if agent is None and agent_error is None:
+        with _agent_lock:
+            if agent is None and agent_error is None:
+                try:
+                    from simple_agent import SimpleTaara
+                    # No banners or colours in function logs
+                    agent = SimpleTaara(server_mode=True)
+                except Exception as e:
+                    agent_error = e
+                    print(f"Agent import error: {e}")
+    return agent
 
 def handler(event, context):
     """Vercel Python serverless function with ARMORIQ"""
+    timings = metrics.start_request()
+    start = time.perf_counter()
+    response = _route(event)
+    response['headers']['Server-Timing'] = metrics.server_timing(timings, time.perf_counter() - start)
+    return response
+
+def _route(event):
     
     # CORS headers
     headers = {
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, X-ARMORIQ-SIGNATURE, X-VERCEL-BYPASS'
+        'Access-Control-Allow-Headers': 'Content-Type, X-ARMORIQ-SIGNATURE, X-VERCEL-BYPASS, X-User-Id, Idempotency-Key',
+        'Access-Control-Expose-Headers': 'Server-Timing, Idempotent-Replayed, X-Coalesced',
+        'Timing-Allow-Origin': '*'
     }
     
     # Handle OPTIONS request (CORS preflight)
@@ -41,11 +75,16 @@ def handler(event, context):
                 'message': 'Taara API with ARMORIQ is running',
                 'armoriq': 'connected',
                 'endpoints': {
-                    'POST /api/process': 'Send commands with ARMORIQ verification'
+                    'POST /api/process': 'Send commands with ARMORIQ verification',
+                    'POST /api/process/batch': 'Send a JSON array or NDJSON batch of commands'
                 }
             })
         }
     
+    # Handle batch POST request
+    if event['requestContext']['http']['method'] == 'POST' and _is_batch(event):
+        return _handle_batch(event, headers)
+    
     # Handle POST request
     if event['requestContext']['http']['method'] == 'POST':
         try:
@@ -60,28 +99,8 @@ def handler(event, context):
             }
             
             # Process with agent if available
-            if agent:
-                # Parse with ARMORIQ verification
-                action, params, verification = agent.parse_input(command)
-                
-                # Add ARMORIQ info to response
-                if verification:
-                    response['armoriq_verified'] = verification.get('verified', False)
-                    response['risk_score'] = verification.get('risk_score', 0)
-                    response['verification_id'] = verification.get('verification_id', '')
-                
-                # Check policies
-                allowed, reason = agent.check_policies(action, params)
-                response['allowed'] = allowed
-                response['action'] = action
-                
-                if allowed:
-                    result = agent.execute_action(action, params)
-                    response['message'] = result.get('message', 'Command executed')
-                    response['result'] = result
-                else:
-                    response['message'] = f"Blocked: {reason}"
-                    response['reason'] = reason
+            if get_agent():
+                response = _process(command, _user_id(event), _header(event, 'idempotency-key'), headers)
             else:
                 response['message'] = 'Agent not available'
                 response['error'] = 'Agent initialization failed'
@@ -92,6 +111,12 @@ def handler(event, context):
                 'body': json.dumps(response)
             }
             
+        except IdempotencyConflict as e:
+            return {
+                'statusCode': 422,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
         except Exception as e:
             return {
                 'statusCode': 500,
@@ -109,3 +134,72 @@ def handler(event, context):
         'headers': headers,
         'body': json.dumps({'error': 'Method not allowed'})
     }
+
+def _process(command, user_id, idempotency_key, headers):
+    """Run a command, replaying stored results and sharing in-flight duplicates"""
+    call = None
+    if idempotency_key and idempotency:
+        # Reserved before running, so a retry racing this request waits for it
+        call, owner = idempotency.begin(user_id, idempotency_key, command)
+        if not owner:
+            response = idempotency.wait(call)
+            metrics.REGISTRY.inc('taara_idempotent_replays_total')
+            headers['Idempotent-Replayed'] = 'true'
+            return response
+    
+    try:
+        if flights:
+            response, shared = flights.do(flight_key(user_id, command), lambda: agent.process(command, user_id))
+            if shared:
+                response = copy.deepcopy(response)
+                metrics.REGISTRY.inc('taara_coalesced_requests_total')
+                headers['X-Coalesced'] = 'true'
+        else:
+            response = agent.process(command, user_id)
+    except BaseException as e:
+        if call is not None:
+            idempotency.abandon(user_id, idempotency_key, call, e)
+        raise
+    
+    if call is not None:
+        idempotency.finish(user_id, idempotency_key, call, response)
+    return response
+
+def _header(event, name):
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return headers.get(name)
+
+def _user_id(event):
+    """Caller's calendar shard from the X-User-Id header"""
+    return _header(event, 'x-user-id') or 'anonymous'
+
+def _is_batch(event):
+    path = event.get('rawPath') or event['requestContext']['http'].get('path', '')
+    return path.rstrip('/').endswith('/batch')
+
+def _handle_batch(event, headers):
+    """Batch commands; the results are returned as one NDJSON body"""
+    if not get_agent():
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': 'Agent initialization failed'})
+        }
+    
+    from simple_agent import parse_batch
+    
+    try:
+        texts = parse_batch(event.get('body') or '')
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    lines = [json.dumps(result) for result in agent.process_batch(texts, _user_id(event))]
+    return {
+        'statusCode': 200,
+        'headers': dict(headers, **{'Content-Type': 'application/x-ndjson'}),
+        'body': '\n'.join(lines) + '\n'
+    }
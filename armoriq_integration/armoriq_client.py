@@ -2,30 +2,157 @@
 import hmac
 import json
 import os
+import random
+import threading
+import time
 from datetime import datetime
-import requests
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
+
+from armoriq_integration.batcher import VerificationBatcher
+from armoriq_integration.circuit_breaker import CircuitBreaker
+from armoriq_integration.verification_cache import VerificationCache
+
+# Upstream statuses worth retrying; anything else is returned as-is
+RETRYABLE_STATUS = frozenset([429, 502, 503, 504])
+
+if TYPE_CHECKING:
+    import requests
+    from armoriq_integration.audit_writer import AuditWriter
+
+DEFAULT_AUDIT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audit.log')
 
 class ArmoriqClient:
     """ARMORIQ security integration for Taara agent"""
     
-    def __init__(self):
+    # Local risk scoring rules, shared with armoriq_integration.batch_scoring
+    RISKY_TYPE_WORDS = ('delete', 'clear')
+    DANGEROUS_WORDS = ('delete', 'remove', 'clear', 'erase', 'destroy')
+    
+    def __init__(self, pool_size: Optional[int] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 time_budget: Optional[float] = None, cache: Optional[VerificationCache] = None,
+                 breaker: Optional[CircuitBreaker] = None, audit_path: Optional[str] = None,
+                 batch_window: Optional[float] = None, batch_max: Optional[int] = None):
         self.api_key = os.getenv('ARMORIQ_API_KEY', '')
         self.api_secret = os.getenv('ARMORIQ_SECRET', '')
         self.api_endpoint = os.getenv('ARMORIQ_ENDPOINT', 'https://api.armoriq.io/v1')
         self.bypass_secret = os.getenv('VERCEL_AUTOMATION_BYPASS_SECRET', '')
         
-    def verify_intent(self, intent_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Verify intent with ARMORIQ security layer"""
+        # Connection pool and retry settings
+        self.pool_size = pool_size or int(os.getenv('ARMORIQ_POOL_SIZE', '10'))
+        self.connect_timeout = connect_timeout or float(os.getenv('ARMORIQ_CONNECT_TIMEOUT', '1.0'))
+        self.read_timeout = read_timeout or float(os.getenv('ARMORIQ_READ_TIMEOUT', '3.0'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('ARMORIQ_MAX_RETRIES', '2'))
+        self.time_budget = time_budget or float(os.getenv('ARMORIQ_TIME_BUDGET', '5.0'))
+        self.backoff_base = 0.05
+        self.backoff_cap = 1.0
+        self._session = None
+        self._session_lock = threading.Lock()
+        
+        # Opt-in verification cache (ARMORIQ_CACHE_TTL or an explicit cache)
+        self.cache = cache if cache is not None else VerificationCache.from_env()
+        
+        # Circuit breaker around the remote call (ARMORIQ_BREAKER=0 disables it)
+        self.breaker = breaker if breaker is not None else CircuitBreaker.from_env()
+        
+        # Opt-in micro-batching of concurrent verifications (ARMORIQ_BATCH_WINDOW_MS)
+        if batch_window:
+            self.batcher = VerificationBatcher(self, batch_window, batch_max or 32)
+        else:
+            self.batcher = VerificationBatcher.from_env(self)
+        
+        # Audit entries are written by a background thread, started on first use
+        self.audit_path = audit_path or os.getenv('ARMORIQ_AUDIT_LOG', DEFAULT_AUDIT_LOG)
+        self._audit_writer = None
+        self._audit_lock = threading.Lock()
+    
+    @property
+    def session(self) -> 'requests.Session':
+        """Keep-alive session, created (and requests imported) on the first call"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+    
+    def _create_session(self) -> 'requests.Session':
+        """Keep-alive session shared by all threads using this client"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    def close(self):
+        if self._session:
+            self._session.close()
+        if self._audit_writer:
+            self._audit_writer.close()
+    
+    @property
+    def audit_writer(self) -> 'AuditWriter':
+        if self._audit_writer is None:
+            with self._audit_lock:
+                if self._audit_writer is None:
+                    from armoriq_integration.audit_writer import AuditWriter
+
+                    self._audit_writer = AuditWriter.from_env(self.audit_path)
+        return self._audit_writer
+    
+    @property
+    def audit_index(self):
+        """Query index over the audit log, or None when ARMORIQ_AUDIT_INDEX=0"""
+        return self.audit_writer.index
+    
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+    
+    def _post(self, url: str, payload: Dict, headers: Dict) -> 'requests.Response':
+        """POST with bounded retries inside the per-request time budget"""
+        import requests
+        
+        deadline = time.monotonic() + self.time_budget
+        attempt = 0
         
+        while True:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            timeout = (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+            error = None
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=timeout)
+                if response.status_code not in RETRYABLE_STATUS:
+                    return response
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            
+            delay = self._backoff(attempt)
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                if error:
+                    raise error
+                return response
+            time.sleep(delay)
+    
+    def _build_request(self, intent_data: Dict[str, Any]) -> Tuple[Dict, str, Dict]:
+        """Signed verification payload and headers"""
+        return self._signed({'intent': intent_data})
+    
+    def _build_batch_request(self, intents: List[Dict[str, Any]]) -> Tuple[Dict, str, Dict]:
+        """One signed payload covering several intents, for /verify/batch"""
+        return self._signed({'intents': intents})
+    
+    def _signed(self, payload: Dict[str, Any]) -> Tuple[Dict, str, Dict]:
         # Create verification payload
         timestamp = datetime.utcnow().isoformat()
-        payload = {
-            'intent': intent_data,
+        payload.update({
             'timestamp': timestamp,
             'source': 'taara-agent',
             'version': '1.0.0'
-        }
+        })
         
         # Generate signature
         signature = hmac.new(
@@ -42,33 +169,80 @@ class ArmoriqClient:
             'X-VERCEL-BYPASS': self.bypass_secret,
             'Content-Type': 'application/json'
         }
+        return payload, signature, headers
+    
+    def verify_intent(self, intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Verify intent with ARMORIQ security layer"""
+        if self.cache:
+            cached = self.cache.get(intent_data)
+            if cached:
+                return cached
+        
+        if self.batcher:
+            result = self.batcher.verify(intent_data)
+        else:
+            result = self._verify_uncached(intent_data)
+        if self.cache:
+            self.cache.put(intent_data, result)
+        return result
+    
+    def _verify_uncached(self, intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        payload, signature, headers = self._build_request(intent_data)
+        if self.breaker and not self.breaker.allow_request():
+            # Open circuit: score locally without touching the network
+            return self._with_circuit(self._local_verification(intent_data, signature))
         
+        started = time.monotonic()
         try:
             # Call ARMORIQ verification API
-            response = requests.post(
-                f"{self.api_endpoint}/verify",
-                json=payload,
-                headers=headers,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                return {
-                    'verified': True,
-                    'risk_score': response.json().get('risk_score', 0),
-                    'verification_id': response.json().get('verification_id'),
-                    'signature': signature
-                }
-            else:
-                return {
-                    'verified': False,
-                    'error': response.json().get('error', 'Verification failed'),
-                    'status_code': response.status_code
-                }
+            response = self._post(f"{self.api_endpoint}/verify", payload, headers)
+            result = self._verification_result(response.status_code, response.json(), signature)
+            self._record_call(started, failed=self._failed_status(response.status_code))
                 
         except Exception as e:
             # Fallback to local verification
-            return self._local_verification(intent_data, signature)
+            self._record_call(started, failed=True)
+            result = self._local_verification(intent_data, signature)
+        
+        return self._with_circuit(result)
+    
+    @staticmethod
+    def _failed_status(status_code: int) -> bool:
+        """Whether a final response is a failed call for the breaker
+
+        Retryable statuses (429 included) only come back once retries are exhausted.
+        """
+        return status_code >= 500 or status_code in RETRYABLE_STATUS
+
+    def _record_call(self, started: float, failed: bool):
+        """Feed the outcome and latency of a remote call to the breaker"""
+        if self.breaker:
+            latency = time.monotonic() - started
+            if failed:
+                self.breaker.record_failure(latency)
+            else:
+                self.breaker.record_success(latency)
+    
+    def _with_circuit(self, result: Dict) -> Dict:
+        if self.breaker:
+            result['circuit'] = self.breaker.state
+        return result
+    
+    def _verification_result(self, status_code: int, body: Dict, signature: str) -> Dict:
+        """Turn an ARMORIQ /verify response into a verification result"""
+        if status_code == 200:
+            return {
+                'verified': True,
+                'risk_score': body.get('risk_score', 0),
+                'verification_id': body.get('verification_id'),
+                'signature': signature
+            }
+        else:
+            return {
+                'verified': False,
+                'error': body.get('error', 'Verification failed'),
+                'status_code': status_code
+            }
     
     def _local_verification(self, intent_data: Dict, signature: str) -> Dict:
         """Local fallback verification"""
@@ -90,23 +264,27 @@ class ArmoriqClient:
         params = intent_data.get('parameters', {})
         
         # High risk operations
-        if 'delete' in intent_type or 'clear' in intent_type:
+        if any(word in intent_type for word in self.RISKY_TYPE_WORDS):
             score += 0.5
             if params.get('scope') == 'all':
                 score += 0.3
         
         # Check for dangerous patterns
         command = intent_data.get('raw_input', '').lower()
-        dangerous_words = ['delete', 'remove', 'clear', 'erase', 'destroy']
-        for word in dangerous_words:
+        for word in self.DANGEROUS_WORDS:
             if word in command and 'everything' in command:
                 score += 0.4
                 break
         
         return min(score, 1.0)
     
-    def create_audit_log(self, action: str, result: Dict, user: str = 'anonymous'):
-        """Create audit trail entry"""
+    def create_audit_log(self, action: str, result: Dict, user: str = 'anonymous',
+                         intent: Optional[Dict] = None):
+        """Create audit trail entry
+
+        ``intent`` is the verified intent (type, parameters, raw_input), kept
+        so the log can be re-scored offline (batch_scoring --audit-log).
+        """
         audit_entry = {
             'timestamp': datetime.utcnow().isoformat(),
             'action': action,
@@ -114,16 +292,23 @@ class ArmoriqClient:
             'user': user,
             'environment': os.getenv('VERCEL_ENV', 'development')
         }
+        if intent is not None:
+            # A copy: the command's params keep changing after this call, and
+            # the writer serialises the entry later
+            audit_entry['intent'] = {
+                'type': intent.get('type'),
+                'parameters': dict(intent.get('parameters') or {}),
+                'raw_input': intent.get('raw_input')
+            }
         
-        # Hash the entry for tamper-proof audit
+        # Content digest; the writer links entries into a hash chain
         entry_hash = hashlib.sha256(
             json.dumps(audit_entry, sort_keys=True).encode()
         ).hexdigest()
         
-        audit_entry['hash'] = entry_hash
+        audit_entry['digest'] = entry_hash
         
-        # Store in file (in production, send to ARMORIQ)
-        with open('armoriq_integration/audit.log', 'a') as f:
-            f.write(json.dumps(audit_entry) + '\n')
+        # Queue for the background writer (in production, send to ARMORIQ)
+        self.audit_writer.write(audit_entry)
         
-        return entry_hash
+        return entry_hash
\ No newline at end of file
@@ -0,0 +1,198 @@
+﻿import asyncio
+import time
+from typing import Dict, Any, List, Optional
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from armoriq_integration.armoriq_client import ArmoriqClient, RETRYABLE_STATUS
+from armoriq_integration.batcher import BATCH_PATH, UNSUPPORTED_STATUS, Batch, BatcherBase
+
+
+class AsyncArmoriqClient:
+    """asyncio front end for ArmoriqClient
+
+    Signing, response handling, local scoring and configuration come from
+    the wrapped sync client. Verification calls go through a pooled
+    httpx.AsyncClient so they never block the event loop; without httpx
+    they run the sync client in a worker thread instead.
+    """
+
+    def __init__(self, client: Optional[ArmoriqClient] = None):
+        self.client = client or ArmoriqClient()
+        self._http = None
+        self._loop = None
+        # Same batching settings as the sync client
+        batcher = self.client.batcher
+        self.batcher = AsyncVerificationBatcher(self, batcher.window, batcher.max_batch) if batcher else None
+
+    def _http_client(self):
+        # httpx pools belong to the event loop that created them
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.client.read_timeout, connect=self.client.connect_timeout),
+                limits=httpx.Limits(max_connections=self.client.pool_size,
+                                    max_keepalive_connections=self.client.pool_size)
+            )
+            self._loop = loop
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None and self._loop is asyncio.get_running_loop():
+            await self._http.aclose()
+        self._http = None
+        self._loop = None
+
+    async def _post(self, url: str, payload: Dict, headers: Dict):
+        """Async twin of ArmoriqClient._post with the same retry budget"""
+        http = self._http_client()
+        deadline = time.monotonic() + self.client.time_budget
+        attempt = 0
+
+        while True:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            timeout = httpx.Timeout(min(self.client.read_timeout, remaining),
+                                    connect=min(self.client.connect_timeout, remaining))
+            error = None
+            try:
+                response = await http.post(url, json=payload, headers=headers, timeout=timeout)
+                if response.status_code not in RETRYABLE_STATUS:
+                    return response
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                error = e
+
+            delay = self.client._backoff(attempt)
+            attempt += 1
+            if attempt > self.client.max_retries or time.monotonic() + delay >= deadline:
+                if error:
+                    raise error
+                return response
+            await asyncio.sleep(delay)
+
+    async def verify_intent(self, intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Verify intent with ARMORIQ without blocking the event loop"""
+        if httpx is None:
+            return await asyncio.to_thread(self.client.verify_intent, intent_data)
+
+        cache = self.client.cache
+        if cache:
+            cached = cache.get(intent_data)
+            if cached:
+                return cached
+
+        if self.batcher:
+            result = await self.batcher.verify(intent_data)
+        else:
+            result = await self._verify_uncached(intent_data)
+        if cache:
+            cache.put(intent_data, result)
+        return result
+
+    async def _verify_uncached(self, intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        client = self.client
+        payload, signature, headers = client._build_request(intent_data)
+        if client.breaker and not client.breaker.allow_request():
+            # Open circuit: score locally without touching the network
+            return client._with_circuit(client._local_verification(intent_data, signature))
+
+        started = time.monotonic()
+        try:
+            response = await self._post(f"{client.api_endpoint}/verify", payload, headers)
+            result = client._verification_result(response.status_code, response.json(), signature)
+            client._record_call(started, failed=client._failed_status(response.status_code))
+        except Exception:
+            # Fallback to local verification
+            client._record_call(started, failed=True)
+            result = client._local_verification(intent_data, signature)
+
+        return client._with_circuit(result)
+
+    async def create_audit_log(self, action: str, result: Dict, user: str = 'anonymous',
+                               intent: Optional[Dict] = None):
+        """Write the audit entry from a worker thread"""
+        return await asyncio.to_thread(self.client.create_audit_log, action, result, user, intent)
+
+
+class AsyncVerificationBatcher(BatcherBase):
+    """asyncio micro-batcher in front of AsyncArmoriqClient
+
+    The first intent into an empty batch schedules a flush task; callers
+    only await their own future, so a cancelled caller never strands the
+    rest of its batch.
+    """
+
+    def __init__(self, async_client: 'AsyncArmoriqClient', window: float = 0.005, max_batch: int = 32):
+        super().__init__(async_client.client, window, max_batch)
+        self.async_client = async_client
+        self._open = None
+        self._tasks = set()
+
+    async def verify(self, intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.supported:
+            return await self.async_client._verify_uncached(intent_data)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._open is None:
+            self._open = Batch(asyncio.Event())
+            task = loop.create_task(self._flush_after(self._open))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        batch = self._open
+        batch.items.append((intent_data, future))
+        if len(batch.items) >= self.max_batch:
+            self._open = None
+            batch.full.set()
+        return await future
+
+    async def _flush_after(self, batch):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        if self._open is batch:
+            self._open = None
+
+        items = [(intent, future) for intent, future in batch.items if not future.done()]
+        if not items:
+            return
+        try:
+            results = await self._send([intent for intent, _ in items])
+        except Exception as e:
+            results = [e] * len(items)
+        for (_, future), result in zip(items, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _verify_each(self, intents: List[Dict]) -> List[Dict]:
+        return list(await asyncio.gather(*(self.async_client._verify_uncached(intent) for intent in intents)))
+
+    async def _send(self, intents: List[Dict]) -> List[Dict]:
+        client = self.client
+        if len(intents) == 1 or not self.supported:
+            return await self._verify_each(intents)
+
+        payload, signature, headers = client._build_batch_request(intents)
+        if client.breaker and not client.breaker.allow_request():
+            return [client._with_circuit(r) for r in self._fallback(intents, signature)]
+
+        self._count(intents)
+        started = time.monotonic()
+        try:
+            response = await self.async_client._post(f"{client.api_endpoint}{BATCH_PATH}", payload, headers)
+            if response.status_code in UNSUPPORTED_STATUS:
+                self.supported = False
+                return await self._verify_each(intents)
+            results = self._results(intents, response.status_code, response.json(), signature)
+            client._record_call(started, failed=client._failed_status(response.status_code))
+        except Exception:
+            client._record_call(started, failed=True)
+            results = self._fallback(intents, signature)
+        return [client._with_circuit(result) for result in results]
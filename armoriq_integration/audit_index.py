@@ -0,0 +1,275 @@
+﻿"""Secondary index and query API over the segmented audit log"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from armoriq_integration.audit_log import SegmentedAuditLog
+
+OUTCOMES = ('allowed', 'blocked')
+
+
+def hour_bucket(timestamp: str) -> str:
+    """'2026-03-02T14:05:09.123' -> '2026-03-02T14'"""
+    return timestamp[:13]
+
+
+def encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([seq]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        seq, = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(seq)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+class AuditIndex:
+    """SQLite index of audit entries by user, action, outcome and hour
+
+    Rows only point at entries: (segment, offset, length) locate the JSON
+    line in the active file or in its rotated segment, so the log stays
+    the single source of truth and the index can be rebuilt from it at
+    any time. ``seq`` follows write order and doubles as the cursor.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            hour TEXT NOT NULL,
+            user TEXT NOT NULL,
+            action TEXT NOT NULL,
+            blocked INTEGER NOT NULL,
+            segment INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            hash TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_user ON entries (user, hour, seq);
+        CREATE INDEX IF NOT EXISTS idx_entries_action ON entries (action, hour, seq);
+        CREATE INDEX IF NOT EXISTS idx_entries_blocked ON entries (blocked, hour, seq);
+        CREATE INDEX IF NOT EXISTS idx_entries_hour ON entries (hour, seq);
+    """
+
+    def __init__(self, log: SegmentedAuditLog, path: Optional[str] = None):
+        self.log = log
+        self.path = path or os.path.splitext(log.path)[0] + '.index.db'
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+
+    @classmethod
+    def from_env(cls, log: SegmentedAuditLog) -> Optional['AuditIndex']:
+        """Index next to the log; ARMORIQ_AUDIT_INDEX=0 disables it"""
+        if os.getenv('ARMORIQ_AUDIT_INDEX', '1') == '0':
+            return None
+        return cls(log, os.getenv('ARMORIQ_AUDIT_INDEX_PATH') or None)
+
+    @staticmethod
+    def _row(entry: Dict[str, Any], location: Tuple[int, int, int]) -> Tuple:
+        timestamp = str(entry.get('timestamp', ''))
+        result = entry.get('result')
+        blocked = isinstance(result, dict) and bool(result.get('blocked'))
+        return (timestamp, hour_bucket(timestamp), str(entry.get('user', 'anonymous')),
+                str(entry.get('action', '')), int(blocked)) + tuple(location) + (entry['hash'],)
+
+    def add(self, entries: List[Dict[str, Any]], locations: List[Tuple[int, int, int]]):
+        """Index a batch just written by SegmentedAuditLog.write_batch"""
+        rows = [self._row(entry, location) for entry, location in zip(entries, locations)]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO entries (ts, hour, user, action, blocked, segment, offset, length, hash) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows
+                )
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def rebuild(self) -> int:
+        """Re-create the index by scanning every segment and the active file"""
+        files = [(number, path) for number, path in self.log.segments()]
+        files.append((self.log.active_number(), self.log.path))
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM entries')
+            count = 0
+            for number, path in files:
+                if not os.path.exists(path):
+                    continue
+                offset = 0
+                with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        if 'hash' in entry:
+                            self._conn.execute(
+                                'INSERT INTO entries (ts, hour, user, action, blocked, segment, offset, length, hash) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                self._row(entry, (number, offset, len(line)))
+                            )
+                            count += 1
+                        offset += len(line)
+            self._conn.execute('COMMIT')
+        return count
+
+    def _select(self, user=None, action=None, outcome=None, since=None, until=None,
+                after: int = 0, limit: Optional[int] = None) -> Tuple[str, List]:
+        clauses = ['seq > ?']
+        args = [after]
+        if user is not None:
+            clauses.append('user = ?')
+            args.append(user)
+        if action is not None:
+            clauses.append('action = ?')
+            args.append(action)
+        if outcome is not None:
+            if outcome not in OUTCOMES:
+                raise ValueError(f"outcome must be one of {OUTCOMES}, got {outcome!r}")
+            clauses.append('blocked = ?')
+            args.append(int(outcome == 'blocked'))
+        # The hour bucket narrows the index range, ts makes the bound exact
+        if since:
+            clauses.append('hour >= ? AND ts >= ?')
+            args += [hour_bucket(since), since]
+        if until:
+            clauses.append('hour <= ? AND ts < ?')
+            args += [hour_bucket(until), until]
+        sql = ('SELECT seq, segment, offset, length, hash FROM entries WHERE '
+               + ' AND '.join(clauses) + ' ORDER BY seq')
+        if limit:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        return sql, args
+
+    def locate(self, user=None, action=None, outcome=None, since=None, until=None,
+               cursor: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple]:
+        """Matching (seq, segment, offset, length, hash) rows in write order"""
+        after = decode_cursor(cursor) if cursor else 0
+        sql, args = self._select(user, action, outcome, since, until, after, limit)
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def query(self, user=None, action=None, outcome=None, since=None, until=None,
+              cursor: Optional[str] = None, limit: int = 100) -> Iterator[Tuple[str, Any]]:
+        """Stream one page as ('entry', entry) items followed by ('next_cursor', cursor)
+
+        ``since`` is inclusive and ``until`` exclusive; both are ISO
+        timestamps or dates. Entries are read from the log one at a time,
+        so a page never has to fit in memory.
+        """
+        rows = self.locate(user, action, outcome, since, until, cursor, limit + 1)
+        return self._stream(rows, limit)
+
+    def _stream(self, rows: List[Tuple], limit: int) -> Iterator[Tuple[str, Any]]:
+        reader = _EntryReader(self.log)
+        try:
+            for row in rows[:limit]:
+                entry = reader.read(*row[1:])
+                if entry is not None:
+                    yield 'entry', entry
+        finally:
+            reader.close()
+        yield 'next_cursor', encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class _EntryReader:
+    """Reads indexed entries, keeping the current segment file open"""
+
+    def __init__(self, log: SegmentedAuditLog):
+        self.log = log
+        self.active = log.active_number()
+        self._number = None
+        self._file = None
+
+    def _open(self, number: int, rotated: bool):
+        self.close()
+        path = self.log.path
+        if rotated:
+            path = self.log.segment_path(number)
+            if not os.path.exists(path):
+                path = self.log.segment_path(number, compressed=not self.log.compress)
+            if not os.path.exists(path):
+                return None
+        self._file = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+        self._number = (number, rotated)
+        return self._file
+
+    def _read_from(self, number: int, rotated: bool, offset: int, length: int, digest: str):
+        try:
+            f = self._file if self._number == (number, rotated) else self._open(number, rotated)
+            if f is None:
+                return None
+            f.seek(offset)
+            entry = json.loads(f.read(length))
+        except (OSError, ValueError, EOFError):
+            return None
+        return entry if entry.get('hash') == digest else None
+
+    def read(self, number: int, offset: int, length: int, digest: str) -> Optional[Dict[str, Any]]:
+        # Older segments are rotated; the newest may be the active file, or
+        # may have been rotated after the reader started
+        rotated = number < self.active
+        for rotated in (rotated, not rotated):
+            entry = self._read_from(number, rotated, offset, length, digest)
+            if entry is not None:
+                return entry
+        return None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._number = None
+
+
+def main(argv=None):
+    from armoriq_integration.armoriq_client import DEFAULT_AUDIT_LOG
+
+    parser = argparse.ArgumentParser(description="ARMORIQ audit index")
+    parser.add_argument('command', choices=['rebuild', 'query'])
+    parser.add_argument('--log', default=os.getenv('ARMORIQ_AUDIT_LOG', DEFAULT_AUDIT_LOG))
+    parser.add_argument('--user')
+    parser.add_argument('--action')
+    parser.add_argument('--outcome', choices=OUTCOMES)
+    parser.add_argument('--since')
+    parser.add_argument('--until')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    index = AuditIndex(SegmentedAuditLog(args.log))
+    if args.command == 'rebuild':
+        print(f"Indexed {index.rebuild()} entries")
+        return 0
+
+    for kind, value in index.query(args.user, args.action, args.outcome, args.since, args.until,
+                                   limit=args.limit):
+        if kind == 'entry':
+            print(json.dumps(value))
+        elif value:
+            print(f"# next cursor: {value}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+﻿"""Hash-chained, segmented audit log and its parallel verifier"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single writer per file
+    fcntl = None
+
+GENESIS_HASH = '0' * 64
+INDEX_EVERY = 256
+
+
+def canonical(entry: Dict[str, Any]) -> str:
+    return json.dumps(entry, sort_keys=True, separators=(',', ':'))
+
+
+def chain_hash(entry: Dict[str, Any]) -> str:
+    """Hash of an entry including its prev_hash link, excluding its own hash"""
+    body = {k: v for k, v in entry.items() if k != 'hash'}
+    return hashlib.sha256(canonical(body).encode()).hexdigest()
+
+
+def legacy_hash(entry: Dict[str, Any]) -> str:
+    """Content digest of an entry written before chaining (no prev_hash)"""
+    body = {k: v for k, v in entry.items() if k != 'hash'}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+
+def _open_segment(path: str):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def _read_last_line(path: str, chunk: int = 4096) -> Optional[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b''
+        while end > 0:
+            start = max(end - chunk, 0)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            lines = data.rstrip(b'\n').split(b'\n')
+            if len(lines) > 1 or start == 0:
+                return lines[-1] or None
+    return None
+
+
+class SegmentedAuditLog:
+    """Append-only audit log whose entries form one hash chain
+
+    Every entry stores the previous entry's hash in ``prev_hash`` and its
+    own ``hash`` covers that link, so deleting or editing a line breaks
+    the chain. The active file (``audit.log``) is rotated once it reaches
+    ``max_segment_bytes`` into ``audit-000001.log.gz`` plus a sidecar
+    ``audit-000001.idx.json`` holding the first/last hash, time range,
+    entry count and sparse byte offsets of the segment.
+    """
+
+    def __init__(self, path: str, max_segment_bytes: int = 64 * 1024 * 1024, compress: bool = True):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.prefix = os.path.splitext(os.path.basename(path))[0]
+        self.max_segment_bytes = max_segment_bytes
+        self.compress = compress
+
+    @classmethod
+    def from_env(cls, path: str) -> 'SegmentedAuditLog':
+        return cls(
+            path,
+            max_segment_bytes=int(os.getenv('ARMORIQ_AUDIT_SEGMENT_BYTES', str(64 * 1024 * 1024))),
+            compress=os.getenv('ARMORIQ_AUDIT_COMPRESS', '1') != '0'
+        )
+
+    # Segment layout
+
+    def segment_path(self, number: int, compressed: Optional[bool] = None) -> str:
+        compressed = self.compress if compressed is None else compressed
+        suffix = '.log.gz' if compressed else '.log'
+        return os.path.join(self.directory, f"{self.prefix}-{number:06d}{suffix}")
+
+    def index_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{self.prefix}-{number:06d}.idx.json")
+
+    def segments(self) -> List[Tuple[int, str]]:
+        """Rotated segments as (number, path), oldest first"""
+        pattern = re.compile(re.escape(self.prefix) + r'-(\d{6})\.log(\.gz)?$')
+        found = []
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(self.prefix)}-*.log*")):
+            match = pattern.search(os.path.basename(path))
+            if match:
+                found.append((int(match.group(1)), path))
+        return sorted(found)
+
+    def read_index(self, number: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.index_path(number)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def active_number(self) -> int:
+        """Segment number the active file will get when it is rotated"""
+        segments = self.segments()
+        return segments[-1][0] + 1 if segments else 1
+
+    # Writing
+
+    def _tail_hash(self) -> str:
+        """Hash of the newest entry, from the active file or the last segment"""
+        if os.path.exists(self.path):
+            line = _read_last_line(self.path)
+            if line:
+                return json.loads(line)['hash']
+        segments = self.segments()
+        if segments:
+            index = self.read_index(segments[-1][0])
+            if index:
+                return index['last_hash']
+        return GENESIS_HASH
+
+    def write_batch(self, entries: List[Dict[str, Any]], fsync: str = 'batch') -> List[Tuple[int, int, int]]:
+        """Chain and append entries; returns (segment, offset, length) for each"""
+        if not entries:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+
+        with open(self.path, 'ab') as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                # Other processes may have appended or rotated since our
+                # last batch, so the chain always continues from the file
+                last_hash = self._tail_hash()
+                offset = os.fstat(f.fileno()).st_size
+                number = self.active_number()
+                locations = []
+                data = []
+                for entry in entries:
+                    entry['prev_hash'] = last_hash
+                    entry['hash'] = chain_hash(entry)
+                    last_hash = entry['hash']
+                    line = (json.dumps(entry) + '\n').encode()
+                    locations.append((number, offset, len(line)))
+                    offset += len(line)
+                    data.append(line)
+
+                if fsync == 'entry':
+                    for line in data:
+                        f.write(line)
+                        f.flush()
+                        os.fsync(f.fileno())
+                else:
+                    f.write(b''.join(data))
+                    f.flush()
+                    if fsync == 'batch':
+                        os.fsync(f.fileno())
+
+                if offset >= self.max_segment_bytes:
+                    self._rotate(f, number)
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return locations
+
+    def _rotate(self, f, number: int):
+        """Move the active file into a numbered segment; caller holds the lock"""
+        index = {
+            'segment': number,
+            'count': 0,
+            'first_prev_hash': None,
+            'first_hash': None,
+            'last_hash': None,
+            'first_timestamp': None,
+            'last_timestamp': None,
+            'offsets': []
+        }
+        offset = 0
+        with open(self.path, 'rb') as src:
+            for line in src:
+                entry = json.loads(line)
+                if index['count'] == 0:
+                    index['first_prev_hash'] = entry.get('prev_hash')
+                    index['first_hash'] = entry['hash']
+                    index['first_timestamp'] = entry.get('timestamp')
+                if index['count'] % INDEX_EVERY == 0:
+                    index['offsets'].append([index['count'], offset, entry.get('timestamp')])
+                index['last_hash'] = entry['hash']
+                index['last_timestamp'] = entry.get('timestamp')
+                index['count'] += 1
+                offset += len(line)
+
+        target = self.segment_path(number)
+        temp = target + '.tmp'
+        with open(self.path, 'rb') as src:
+            with (gzip.open(temp, 'wb') if self.compress else open(temp, 'wb')) as dst:
+                shutil.copyfileobj(src, dst)
+        os.replace(temp, target)
+
+        temp = self.index_path(number) + '.tmp'
+        with open(temp, 'w') as idx:
+            json.dump(index, idx)
+        os.replace(temp, self.index_path(number))
+
+        f.truncate(0)
+        os.fsync(f.fileno())
+
+
+# Verification
+
+def verify_segment(path: str) -> Dict[str, Any]:
+    """Check the hash chain inside one segment file"""
+    report = {'path': path, 'ok': True, 'count': 0, 'legacy': 0,
+              'first_prev_hash': None, 'last_hash': None, 'error': None}
+    prev = None
+    try:
+        with _open_segment(path) as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+
+                # Entries written before chaining carry only a content hash;
+                # they may only open the log, and the chain then links to the last one
+                if 'prev_hash' not in entry:
+                    if report['count']:
+                        raise ValueError(f"unchained entry after chained ones at line {number}")
+                    if legacy_hash(entry) != entry.get('hash'):
+                        raise ValueError(f"hash mismatch at line {number}")
+                    report['legacy'] += 1
+                    prev = entry['hash']
+                    continue
+
+                if report['count'] == 0:
+                    report['first_prev_hash'] = entry['prev_hash']
+                if (report['count'] or report['legacy']) and entry['prev_hash'] != prev:
+                    raise ValueError(f"chain broken at line {number}")
+                if chain_hash(entry) != entry.get('hash'):
+                    raise ValueError(f"hash mismatch at line {number}")
+                prev = entry['hash']
+                report['count'] += 1
+    except (OSError, ValueError, KeyError) as e:
+        report['ok'] = False
+        report['error'] = str(e)
+    report['last_hash'] = prev
+    return report
+
+
+def verify_log(path: str, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Verify every segment in parallel, then check the links between them"""
+    log = SegmentedAuditLog(path)
+    paths = [segment for _, segment in log.segments()]
+    if os.path.exists(path):
+        paths.append(path)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        reports = list(pool.map(verify_segment, paths))
+
+    errors = [f"{r['path']}: {r['error']}" for r in reports if not r['ok']]
+    expected = GENESIS_HASH
+    started = False
+    for report in reports:
+        if not report['ok'] or report['count'] == 0 and not report['legacy']:
+            continue
+        if report['legacy']:
+            # Legacy entries are only valid at the very start of the log; the
+            # chained entries after them were linked inside the segment
+            if started:
+                errors.append(f"{report['path']}: unchained entries after chained ones")
+        elif report['first_prev_hash'] != expected:
+            errors.append(f"{report['path']}: does not continue the previous segment"
+                          if started else f"{report['path']}: does not start at the genesis hash")
+        started = True
+        expected = report['last_hash']
+
+    # A sidecar index counts every line of its segment, legacy ones included
+    for (number, segment), report in zip(log.segments(), reports):
+        index = log.read_index(number)
+        lines = report['count'] + report['legacy']
+        if index and report['ok'] and (index['last_hash'], index['count']) != (report['last_hash'], lines):
+            errors.append(f"{segment}: does not match its index")
+
+    return {
+        'ok': not errors,
+        'segments': len(reports),
+        'entries': sum(r['count'] + r['legacy'] for r in reports),
+        'last_hash': expected,
+        'errors': errors
+    }
+
+
+def main(argv=None):
+    from armoriq_integration.armoriq_client import DEFAULT_AUDIT_LOG
+
+    parser = argparse.ArgumentParser(description="ARMORIQ audit log tools")
+    parser.add_argument('command', choices=['verify'])
+    parser.add_argument('--log', default=os.getenv('ARMORIQ_AUDIT_LOG', DEFAULT_AUDIT_LOG))
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    report = verify_log(args.log, args.workers)
+    print(f"{report['entries']} entries in {report['segments']} segment(s)")
+    for error in report['errors']:
+        print(f"✗ {error}")
+    print("✓ Audit chain intact" if report['ok'] else "✗ Audit chain BROKEN")
+    return 0 if report['ok'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+﻿import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from armoriq_integration.audit_index import AuditIndex
+from armoriq_integration.audit_log import SegmentedAuditLog
+
+FSYNC_MODES = ('none', 'batch', 'entry')
+
+_STOP = object()
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class AuditWriter:
+    """Group-commit writer for the audit log
+
+    Callers enqueue entries and return immediately; a background thread
+    chains and appends them to a SegmentedAuditLog in batches once ``batch_size`` entries
+    are pending or the oldest has waited ``flush_interval`` seconds. The
+    queue is bounded, so producers block (or time out with queue.Full)
+    instead of growing memory when the disk falls behind. ``fsync`` is
+    'none', 'batch' (one fsync per batch) or 'entry' (one per entry).
+    When an AuditIndex is given, each committed batch is indexed too.
+    """
+
+    def __init__(self, path: str, batch_size: int = 100, flush_interval: float = 0.5,
+                 fsync: str = 'batch', max_queue: int = 10000, put_timeout: Optional[float] = None,
+                 log: Optional[SegmentedAuditLog] = None, index: Optional[AuditIndex] = None):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {FSYNC_MODES}, got {fsync!r}")
+        self.path = path
+        self.log = log or SegmentedAuditLog(path)
+        self.index = index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.put_timeout = put_timeout
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, path: str) -> 'AuditWriter':
+        log = SegmentedAuditLog.from_env(path)
+        return cls(
+            path,
+            batch_size=int(os.getenv('ARMORIQ_AUDIT_BATCH', '100')),
+            flush_interval=float(os.getenv('ARMORIQ_AUDIT_FLUSH_INTERVAL', '0.5')),
+            fsync=os.getenv('ARMORIQ_AUDIT_FSYNC', 'batch'),
+            max_queue=int(os.getenv('ARMORIQ_AUDIT_QUEUE', '10000')),
+            log=log,
+            index=AuditIndex.from_env(log)
+        )
+
+    def write(self, entry: Dict[str, Any], timeout: Optional[float] = None):
+        """Queue one entry, blocking while the queue is full"""
+        if self._closed:
+            raise RuntimeError("AuditWriter is closed")
+        if not self._thread.is_alive():
+            raise RuntimeError("AuditWriter thread has stopped")
+        self._queue.put(entry, timeout=timeout if timeout is not None else self.put_timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is on disk; False if ``timeout`` runs out first"""
+        if self._closed:
+            return True
+        if not self._thread.is_alive():
+            raise RuntimeError("AuditWriter thread has stopped")
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        marker = _Flush()
+        try:
+            # A full queue counts against the same timeout
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        return marker.done.wait(remaining)
+
+    def close(self, timeout: float = 5.0):
+        """Stop accepting entries and drain the queue"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+
+    def _run(self):
+        batch = []
+        deadline = 0.0
+        while True:
+            wait = max(deadline - time.monotonic(), 0) if batch else None
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if item is None or item is _STOP or isinstance(item, _Flush):
+                self._commit(batch)
+                batch = []
+                if item is _STOP:
+                    return
+                if item is not None:
+                    item.done.set()
+                continue
+
+            batch.append(item)
+            if len(batch) == 1:
+                deadline = time.monotonic() + self.flush_interval
+            if len(batch) >= self.batch_size:
+                self._commit(batch)
+                batch = []
+
+    def _commit(self, entries: List[Dict[str, Any]]):
+        if not entries:
+            return
+        try:
+            locations = self.log.write_batch(entries, self.fsync)
+            self.written += len(entries)
+            self.batches += 1
+        except Exception as e:
+            # Lines are serialised before anything is written, so a bad entry
+            # (say, a result that isn't JSON) can be retried alone
+            if len(entries) > 1 and not isinstance(e, OSError):
+                for entry in entries:
+                    self._commit([entry])
+                return
+            self.errors += 1
+            print(f"Audit write failed, {len(entries)} entries lost: {e!r}", file=sys.stderr)
+            return
+        if self.index:
+            try:
+                self.index.add(entries, locations)
+            except Exception as e:
+                self.errors += 1
+                print(f"Audit index update failed, run 'audit_index rebuild': {e}", file=sys.stderr)
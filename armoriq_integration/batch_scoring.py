@@ -0,0 +1,256 @@
+﻿"""Bulk risk scoring for offline re-scoring of logs and corpora
+
+``score_columns`` applies the local scoring rules of
+``ArmoriqClient._calculate_risk_score`` to whole columns at once (intent
+types, "scope is all" flags and raw commands). With NumPy installed each
+rule is a vectorized substring mask over the column; without it a
+column-wise Python loop is used. Both give exactly the scalar scores, since
+the same float additions happen in the same order.
+
+The CLI streams JSONL (corpora such as benchmarks/corpus.jsonl, request
+logs, audit segments, plain or .gz) through fixed-size chunks, so memory
+stays flat however long the input is:
+
+    python -m armoriq_integration.batch_scoring benchmarks/corpus.jsonl --output scores.jsonl
+    python -m armoriq_integration.batch_scoring --audit-log armoriq_integration/audit.log
+
+A record is scored from its ``intent`` object (audit entries carry the
+intent they were verified with), from intent fields
+(``type``/``raw_input``) at its top level, or from a ``text``/``command``
+string matched the way SimpleTaara does. Anything else is counted as
+unscorable.
+"""
+
+import argparse
+import bisect
+import gzip
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from armoriq_integration.armoriq_client import ArmoriqClient
+
+DEFAULT_CHUNK_SIZE = 50000
+ENGINES = ('auto', 'numpy', 'python')
+
+# Score histogram buckets for the CLI summary (upper bounds)
+SUMMARY_BUCKETS = (0.0, 0.3, 0.5, 0.7, 0.9, 1.0)
+
+
+def intent_columns(intents: Iterable[Dict[str, Any]]) -> Tuple[List[str], List[bool], List[str]]:
+    """Split intents into (types, scope_all, raw_inputs) columns"""
+    types, scope_all, commands = [], [], []
+    for intent in intents:
+        types.append(intent.get('type', ''))
+        scope_all.append(intent.get('parameters', {}).get('scope') == 'all')
+        commands.append(intent.get('raw_input', ''))
+    return types, scope_all, commands
+
+
+def _contains_any(column, words):
+    mask = np.zeros(column.shape, dtype=bool)
+    for word in words:
+        mask |= np.char.find(column, word) >= 0
+    return mask
+
+
+def _score_numpy(types: Sequence[str], scope_all: Sequence[bool], commands: Sequence[str]) -> List[float]:
+    # Intent types take a handful of values: test each distinct one once
+    risky_words = ArmoriqClient.RISKY_TYPE_WORDS
+    risky_type = {t: any(word in t for word in risky_words) for t in set(types)}
+    risky = np.fromiter(map(risky_type.__getitem__, types), dtype=bool, count=len(types))
+
+    # Logged commands repeat a lot: mask the distinct ones, then gather.
+    # str.lower in Python is also several times faster than np.char.lower.
+    distinct = {}
+    inverse = np.fromiter((distinct.setdefault(command, len(distinct)) for command in commands),
+                          dtype=np.intp, count=len(commands))
+    lowered = np.asarray([command.lower() for command in distinct], dtype=str)
+    dangerous = (np.char.find(lowered, 'everything') >= 0) & _contains_any(lowered, ArmoriqClient.DANGEROUS_WORDS)
+    dangerous = dangerous[inverse]
+
+    score = np.zeros(len(types))
+    score += np.where(risky, 0.5, 0.0)
+    score += np.where(risky & np.asarray(scope_all, dtype=bool), 0.3, 0.0)
+    score += np.where(dangerous, 0.4, 0.0)
+    return np.minimum(score, 1.0).tolist()
+
+
+def _score_python(types: Sequence[str], scope_all: Sequence[bool], commands: Sequence[str]) -> List[float]:
+    risky_words = ArmoriqClient.RISKY_TYPE_WORDS
+    dangerous_words = ArmoriqClient.DANGEROUS_WORDS
+    scores = []
+    for intent_type, all_scope, command in zip(types, scope_all, commands):
+        score = 0.0
+        if any(word in intent_type for word in risky_words):
+            score += 0.5
+            if all_scope:
+                score += 0.3
+        command = command.lower()
+        if 'everything' in command and any(word in command for word in dangerous_words):
+            score += 0.4
+        scores.append(min(score, 1.0))
+    return scores
+
+
+def resolve_engine(engine: str = 'auto') -> str:
+    if engine == 'auto':
+        return 'numpy' if np is not None else 'python'
+    if engine == 'numpy' and np is None:
+        raise RuntimeError("NumPy is not installed; use --engine python")
+    return engine
+
+
+def score_columns(types: Sequence[str], scope_all: Sequence[bool], commands: Sequence[str],
+                  engine: str = 'auto') -> List[float]:
+    """Risk score per row of the three columns"""
+    if not len(types):
+        return []
+    if resolve_engine(engine) == 'numpy':
+        return _score_numpy(types, scope_all, commands)
+    return _score_python(types, scope_all, commands)
+
+
+def score_intents(intents: Iterable[Dict[str, Any]], engine: str = 'auto') -> List[float]:
+    return score_columns(*intent_columns(intents), engine=engine)
+
+
+class RecordIntents:
+    """Intent for a corpus or log record, matching commands like SimpleTaara"""
+
+    def __init__(self):
+        self._matcher = None
+        self._payload = None
+
+    def __call__(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if isinstance(record.get('intent'), dict):
+            return record['intent']
+        if 'type' in record and 'raw_input' in record:
+            return record
+        text = record.get('text') or record.get('command')
+        if not isinstance(text, str):
+            return None
+        if self._matcher is None:
+            from intent_matcher import IntentMatcher, intent_payload
+
+            self._matcher = IntentMatcher()
+            self._payload = intent_payload
+
+        text = text.lower().strip()
+        return self._payload(self._matcher.match(text), text)
+
+
+def score_records(records: Iterable[Dict[str, Any]], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  engine: str = 'auto') -> Iterator[Tuple[Dict[str, Any], Optional[float]]]:
+    """Yield (record, score) in input order, one chunk in memory at a time
+
+    Records without a scorable intent get None.
+    """
+    to_intent = RecordIntents()
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        intents = [to_intent(record) for record in chunk]
+        scores = iter(score_intents([intent for intent in intents if intent is not None], engine))
+        for record, intent in zip(chunk, intents):
+            yield record, (next(scores) if intent is not None else None)
+
+
+def _open_text(path: str):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def read_jsonl(paths: Iterable[str], stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """JSON objects from JSONL files in order; bad lines are skipped and counted in stats"""
+    for path in paths:
+        with _open_text(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if isinstance(record, dict):
+                    yield record
+                elif stats is not None:
+                    stats['bad_lines'] = stats.get('bad_lines', 0) + 1
+
+
+def audit_log_paths(path: str) -> List[str]:
+    """Rotated segments of an audit log, oldest first, then the active file"""
+    from armoriq_integration.audit_log import SegmentedAuditLog
+
+    paths = [segment for _, segment in SegmentedAuditLog(path).segments()]
+    if os.path.exists(path):
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score intents in bulk with the local ARMORIQ rules")
+    parser.add_argument('inputs', nargs='*', help="JSONL files (.gz allowed, - for stdin)")
+    parser.add_argument('--audit-log', help="score every segment of this audit log")
+    parser.add_argument('--output', help="write {id, record, risk_score} JSONL here")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--engine', choices=ENGINES, default='auto')
+    args = parser.parse_args(argv)
+
+    paths = list(args.inputs)
+    if args.audit_log:
+        paths.extend(audit_log_paths(args.audit_log))
+    if not paths:
+        parser.error("no input: give JSONL files or --audit-log")
+    try:
+        engine = resolve_engine(args.engine)
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    stats = {'bad_lines': 0}
+    buckets = [0] * len(SUMMARY_BUCKETS)
+    scored = unscorable = 0
+    total = 0.0
+    out = open(args.output, 'w') if args.output else None
+    start = time.perf_counter()
+    try:
+        for number, (record, score) in enumerate(score_records(read_jsonl(paths, stats), args.chunk_size, engine), 1):
+            if score is None:
+                unscorable += 1
+                continue
+            scored += 1
+            total += score
+            buckets[bisect.bisect_left(SUMMARY_BUCKETS, score)] += 1
+            if out:
+                out.write(json.dumps({'id': record.get('id'), 'record': number, 'risk_score': score}) + '\n')
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"Scored {scored} intents in {elapsed:.2f}s with {engine} "
+          f"({scored / elapsed if elapsed else 0:.0f}/s); {unscorable} unscorable, {stats['bad_lines']} bad lines",
+          file=sys.stderr)
+    if scored:
+        print(f"  mean risk {total / scored:.3f}", file=sys.stderr)
+        for bound, count in zip(SUMMARY_BUCKETS, buckets):
+            print(f"  <= {bound:.1f}: {count}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+﻿"""Micro-batching of ARMORIQ verification calls
+
+Intents that arrive within ``window`` seconds of each other (or until
+``max_batch`` are waiting) are signed once and sent together as one
+``POST /verify/batch``:
+
+    {"intents": [...], "timestamp": ..., "source": ..., "version": ...}
+    -> {"results": [{"risk_score": ..., "verification_id": ...} | {"error": ...}, ...]}
+
+Results come back in request order and every caller gets its own. An item
+the server rejects, or the whole batch when the call fails, falls back to
+local scoring per intent. A lone intent goes to the plain ``/verify``
+endpoint, and a server without the batch endpoint (404/405) switches the
+batcher to per-intent calls for good.
+
+AsyncVerificationBatcher (in async_client) is the asyncio twin.
+"""
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
+
+if TYPE_CHECKING:
+    from armoriq_integration.armoriq_client import ArmoriqClient
+
+BATCH_PATH = '/verify/batch'
+UNSUPPORTED_STATUS = frozenset([404, 405])
+
+
+class _Pending:
+    """One caller's slot in a sync batch; lighter than concurrent.futures.Future"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self) -> Dict[str, Any]:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Batch:
+    """Intents waiting to be sent, with a future each"""
+
+    def __init__(self, full):
+        self.items = []
+        self.full = full
+
+
+class BatcherBase:
+    """Payload and result handling shared by the sync and async batchers"""
+
+    def __init__(self, client: 'ArmoriqClient', window: float, max_batch: int):
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self.supported = True
+        self.batches = 0
+        self.batched_intents = 0
+
+    def _results(self, intents: List[Dict], status_code: int, body: Dict, signature: str) -> List[Dict]:
+        """Split a /verify/batch response into one result per intent"""
+        client = self.client
+        if status_code != 200:
+            return [client._verification_result(status_code, body, signature) for _ in intents]
+
+        items = body.get('results') or []
+        results = []
+        for position, intent in enumerate(intents):
+            item = items[position] if position < len(items) else {'error': 'Missing from batch response'}
+            if 'error' in item:
+                results.append(client._local_verification(intent, signature))
+            else:
+                results.append(client._verification_result(200, item, signature))
+        return results
+
+    def _fallback(self, intents: List[Dict], signature: str) -> List[Dict]:
+        return [self.client._local_verification(intent, signature) for intent in intents]
+
+    def _count(self, intents: List[Dict]):
+        self.batches += 1
+        self.batched_intents += len(intents)
+
+
+class VerificationBatcher(BatcherBase):
+    """Thread-safe micro-batcher in front of ArmoriqClient
+
+    The first caller into an empty batch leads it: it waits out the
+    window (or until the batch fills), sends the batch and hands every
+    waiting caller its result.
+    """
+
+    def __init__(self, client: 'ArmoriqClient', window: float = 0.005, max_batch: int = 32):
+        super().__init__(client, window, max_batch)
+        self._lock = threading.Lock()
+        self._open = None
+
+    @classmethod
+    def from_env(cls, client: 'ArmoriqClient') -> Optional['VerificationBatcher']:
+        """Batcher configured by ARMORIQ_BATCH_* variables; None unless a window is set"""
+        window_ms = float(os.getenv('ARMORIQ_BATCH_WINDOW_MS', '0'))
+        if window_ms <= 0:
+            return None
+        return cls(client, window=window_ms / 1000, max_batch=int(os.getenv('ARMORIQ_BATCH_MAX', '32')))
+
+    def verify(self, intent_data: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.supported:
+            return self.client._verify_uncached(intent_data)
+
+        pending = _Pending()
+        with self._lock:
+            leader = self._open is None
+            if leader:
+                self._open = Batch(threading.Event())
+            batch = self._open
+            batch.items.append((intent_data, pending))
+            if len(batch.items) >= self.max_batch:
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._dispatch(batch.items)
+        return pending.wait()
+
+    def _dispatch(self, items):
+        try:
+            results = self._send([intent for intent, _ in items])
+        except BaseException as e:
+            results = None
+            for _, pending in items:
+                pending.error = e
+            raise
+        finally:
+            for position, (_, pending) in enumerate(items):
+                if results is not None:
+                    pending.result = results[position]
+                pending.done.set()
+
+    def _send(self, intents: List[Dict]) -> List[Dict]:
+        client = self.client
+        if len(intents) == 1 or not self.supported:
+            return [client._verify_uncached(intent) for intent in intents]
+
+        payload, signature, headers = client._build_batch_request(intents)
+        if client.breaker and not client.breaker.allow_request():
+            return [client._with_circuit(r) for r in self._fallback(intents, signature)]
+
+        self._count(intents)
+        started = time.monotonic()
+        try:
+            response = client._post(f"{client.api_endpoint}{BATCH_PATH}", payload, headers)
+            if response.status_code in UNSUPPORTED_STATUS:
+                self.supported = False
+                return [client._verify_uncached(intent) for intent in intents]
+            results = self._results(intents, response.status_code, response.json(), signature)
+            client._record_call(started, failed=client._failed_status(response.status_code))
+        except Exception:
+            client._record_call(started, failed=True)
+            results = self._fallback(intents, signature)
+        return [client._with_circuit(result) for result in results]
@@ -0,0 +1,137 @@
+﻿import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Circuit breaker around the remote ARMORIQ call
+
+    While closed, the outcome of every call goes into a sliding window;
+    once the window holds ``min_calls`` outcomes and the failure rate or
+    the slow-call rate reaches its threshold, the breaker opens. An open
+    breaker rejects calls for ``open_seconds``, then lets up to
+    ``half_open_probes`` probe calls through: if they all succeed quickly
+    it closes again, otherwise it reopens.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, slow_call_seconds: float = 2.0,
+                 slow_call_rate: float = 0.8, window_size: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30.0, half_open_probes: int = 1, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=window_size)
+        self._failures = 0
+        self._slow = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self.trips = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['CircuitBreaker']:
+        """Breaker configured by ARMORIQ_BREAKER_* variables; ARMORIQ_BREAKER=0 disables it"""
+        if os.getenv('ARMORIQ_BREAKER', '1') == '0':
+            return None
+        return cls(
+            failure_rate=float(os.getenv('ARMORIQ_BREAKER_FAILURE_RATE', '0.5')),
+            slow_call_seconds=float(os.getenv('ARMORIQ_BREAKER_SLOW_SECONDS', '2.0')),
+            min_calls=int(os.getenv('ARMORIQ_BREAKER_MIN_CALLS', '5')),
+            open_seconds=float(os.getenv('ARMORIQ_BREAKER_OPEN_SECONDS', '30'))
+        )
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() >= self._opened_at + self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self) -> bool:
+        """Whether a remote call may be made now"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, latency: float = 0.0):
+        self._record(False, latency)
+
+    def record_failure(self, latency: float = 0.0):
+        self._record(True, latency)
+
+    def _record(self, failed: bool, latency: float):
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if failed or slow:
+                    self._trip()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        self._reset(CLOSED)
+                return
+            if state == OPEN:
+                return
+
+            if len(self._window) == self._window.maxlen:
+                old_failed, old_slow = self._window[0]
+                self._failures -= old_failed
+                self._slow -= old_slow
+            self._window.append((failed, slow))
+            self._failures += failed
+            self._slow += slow
+
+            calls = len(self._window)
+            if calls >= self.min_calls and (
+                    self._failures / calls >= self.failure_rate or self._slow / calls >= self.slow_call_rate):
+                self._trip()
+
+    def _reset(self, state: str):
+        self._state = state
+        self._window.clear()
+        self._failures = 0
+        self._slow = 0
+        self._probes = 0
+        self._probe_successes = 0
+
+    def _trip(self):
+        self._reset(OPEN)
+        self._opened_at = self._clock()
+        self.trips += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._window)
+            return {
+                'state': self._current_state(),
+                'calls': calls,
+                'failure_rate': self._failures / calls if calls else 0.0,
+                'slow_call_rate': self._slow / calls if calls else 0.0,
+                'trips': self.trips,
+                'rejected': self.rejected
+            }
@@ -0,0 +1,155 @@
+﻿"""Local stand-in for the ARMORIQ verification API, for tests and benchmarks"""
+
+import argparse
+import hashlib
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Any, Optional
+
+from armoriq_integration.armoriq_client import ArmoriqClient
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out and hang up are expected here
+        pass
+
+
+class StubArmoriqServer:
+    """Serves POST /verify and /verify/batch with local risk scores over keep-alive HTTP/1.1
+
+    ``latency`` delays every response, and the first ``fail_first``
+    requests are answered with ``fail_status``. ``batch=False`` leaves out
+    the batch endpoint, like an older server, and ``reject`` picks intents
+    whose batch item comes back as an error. The server counts requests,
+    verified intents and accepted TCP connections so connection reuse and
+    batching can be measured.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 fail_first: int = 0, fail_status: int = 503, batch: bool = True,
+                 reject: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.batch = batch
+        self.reject = reject
+        self.requests = 0
+        self.intents = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._scorer = ArmoriqClient()
+        self._thread = None
+        self.httpd = _QuietHTTPServer((host, port), self._handler_class())
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubArmoriqServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, attribute: str) -> int:
+        with self._lock:
+            value = getattr(self, attribute) + 1
+            setattr(self, attribute, value)
+            return value
+
+    def verify(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return self._score(payload.get('intent', {}))
+
+    def verify_batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        results = []
+        for intent in payload.get('intents', []):
+            if self.reject and self.reject(intent):
+                self._count('intents')
+                results.append({'error': 'Rejected by stub'})
+            else:
+                results.append(self._score(intent))
+        return {'results': results}
+
+    def _score(self, intent: Dict[str, Any]) -> Dict[str, Any]:
+        self._count('intents')
+        digest = hashlib.sha256(json.dumps(intent, sort_keys=True).encode()).hexdigest()
+        return {
+            'risk_score': self._scorer._calculate_risk_score(intent),
+            'verification_id': f"stub_{digest[:16]}"
+        }
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stub._count('connections')
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                number = stub._count('requests')
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                path = self.path.rstrip('/')
+                if number <= stub.fail_first:
+                    self._send(stub.fail_status, {'error': 'Stub failure'})
+                elif path.endswith('/verify/batch') and stub.batch:
+                    self._send(200, stub.verify_batch(payload))
+                elif path.endswith('/verify'):
+                    self._send(200, stub.verify(payload))
+                else:
+                    self._send(404, {'error': 'Not found'})
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local ARMORIQ stub server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to each response")
+    args = parser.parse_args(argv)
+
+    server = StubArmoriqServer(args.host, args.port, latency=args.latency)
+    print(f"ARMORIQ stub listening on {server.url} (set ARMORIQ_ENDPOINT to this)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
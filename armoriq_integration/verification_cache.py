@@ -0,0 +1,111 @@
+﻿import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+class VerificationCache:
+    """Bounded TTL/LRU cache of ARMORIQ verification results
+
+    Entries are keyed on a canonical hash of the intent without its
+    timestamp, so the same command from different requests shares one
+    verification. Remote and local fallback results have separate TTLs
+    (a TTL of 0 disables caching for that kind), failed verifications are
+    never stored and dangerous intents always go to ARMORIQ.
+    """
+
+    UNCACHEABLE_TYPES = frozenset(['dangerous'])
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 1024, fallback_ttl: float = 0.0,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.fallback_ttl = fallback_ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['VerificationCache']:
+        """Cache configured by ARMORIQ_CACHE_* variables; None unless a TTL is set"""
+        ttl = float(os.getenv('ARMORIQ_CACHE_TTL', '0'))
+        if ttl <= 0:
+            return None
+        return cls(
+            ttl=ttl,
+            max_size=int(os.getenv('ARMORIQ_CACHE_SIZE', '1024')),
+            fallback_ttl=float(os.getenv('ARMORIQ_CACHE_FALLBACK_TTL', '0'))
+        )
+
+    @staticmethod
+    def key(intent_data: Dict[str, Any]) -> str:
+        """Canonical hash of an intent, ignoring its timestamp"""
+        canonical = {k: v for k, v in intent_data.items() if k != 'timestamp'}
+        if isinstance(canonical.get('raw_input'), str):
+            canonical['raw_input'] = ' '.join(canonical['raw_input'].split())
+        encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def cacheable(self, intent_data: Dict[str, Any]) -> bool:
+        return intent_data.get('type') not in self.UNCACHEABLE_TYPES
+
+    def get(self, intent_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Cached verification for an intent, or None"""
+        if not self.cacheable(intent_data):
+            return None
+        key = self.key(intent_data)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, result = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        cached = dict(result)
+        cached['cache'] = 'hit'
+        return cached
+
+    def put(self, intent_data: Dict[str, Any], result: Dict[str, Any]):
+        """Store a successful verification result"""
+        if not self.cacheable(intent_data) or not result.get('verified'):
+            return
+        ttl = self.fallback_ttl if result.get('mode') == 'fallback' else self.ttl
+        if ttl <= 0:
+            return
+        key = self.key(intent_data)
+
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
@@ -0,0 +1,301 @@
+﻿#!/usr/bin/env python3
+"""
+Benchmarks for the Taara command pipeline
+
+Microbenchmarks time each stage on its own (parse, classify, policy
+check, scheduling at several calendar sizes, risk scoring, audit), and an
+end-to-end run replays a JSONL corpus of commands through
+SimpleTaara.process against a local stub ARMORIQ server. Everything runs
+in a temporary HOME, so the real calendar and audit log are untouched.
+
+    python benchmarks/bench_pipeline.py --output bench.json
+    python benchmarks/bench_pipeline.py --compare bench.json --threshold 0.2
+
+Results are JSON (one entry per benchmark, timings in microseconds) so
+runs from different commits can be compared with --compare, which exits
+with status 1 when any benchmark got slower than the threshold.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.jsonl')
+
+SAMPLE_COMMANDS = [
+    "Schedule a meeting tomorrow at 2pm",
+    "Remind me to call John at 5pm",
+    "Add task: Buy groceries",
+    "What meetings do I have tomorrow?",
+    "Delete everything from my calendar",
+    "Hello Taara",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(samples_us, calls_per_sample=1):
+    """Timing summary for per-call samples in microseconds"""
+    return {
+        'calls': len(samples_us) * calls_per_sample,
+        'mean_us': statistics.fmean(samples_us),
+        'median_us': statistics.median(samples_us),
+        'p95_us': percentile(samples_us, 0.95),
+        'min_us': min(samples_us),
+    }
+
+
+def bench(fn, min_time=0.2, repeat=5, setup=None):
+    """Time fn() in ``repeat`` rounds of at least min_time / repeat seconds each
+
+    Returns per-call microseconds, taking each round's mean so that very
+    fast functions are not dominated by timer overhead.
+    """
+    if setup:
+        setup()
+    fn()  # warm-up
+    round_time = min_time / repeat
+    samples = []
+    calls = 0
+    for _ in range(repeat):
+        n = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            n += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= round_time:
+                break
+        samples.append(elapsed / n * 1e6)
+        calls += n
+    result = summarize(samples)
+    result['calls'] = calls
+    return result
+
+
+def load_corpus(path):
+    """Commands from a JSONL file; each line has a 'text' (or 'command') field"""
+    commands = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            commands.append({
+                'text': item.get('text') or item.get('command', ''),
+                'user_id': item.get('user_id', 'anonymous'),
+            })
+    return commands
+
+
+def make_agent(workdir, stub_url, hour):
+    from calendar_store import SQLiteCalendarStore
+    from simple_agent import SimpleTaara
+
+    agent = SimpleTaara(calendar=SQLiteCalendarStore(os.path.join(workdir, 'calendar.db')))
+    agent.armoriq.api_endpoint = stub_url
+    # Pin the hour so time-of-day policies give the same decisions on every run
+    agent.check_policies = lambda action, params: agent.policy_store.current().check(action, hour)
+    return agent
+
+
+def micro_benchmarks(agent, workdir, sizes, min_time, backends, corpus=()):
+    from calendar_store import JsonCalendarStore, SQLiteCalendarStore
+    from armoriq_integration.audit_log import SegmentedAuditLog
+
+    results = {}
+    texts = iter(SAMPLE_COMMANDS * 1000000)
+
+    results['parse_input'] = bench(lambda: agent.parse_input(next(texts)), min_time)
+    results['parse_input_no_verify'] = bench(
+        lambda: agent.parse_input(next(texts), verify_with_armoriq=False), min_time)
+    results['classify_intent'] = bench(lambda: agent._classify_intent(next(texts).lower()), min_time)
+    if corpus:
+        # Every command of the replay corpus, lowercased as parse_input does
+        corpus_texts = itertools.cycle([command['text'].lower() for command in corpus])
+        results['match_intent[corpus]'] = bench(lambda: agent.matcher.match(next(corpus_texts)), min_time)
+    results['check_policies'] = bench(lambda: agent.check_policies('schedule', {}), min_time)
+
+    intent = agent._build_intent("Schedule a meeting tomorrow at 2pm")[1]
+    results['calculate_risk_score'] = bench(lambda: agent.armoriq._calculate_risk_score(intent), min_time)
+
+    def meetings():
+        # A free slot each time: repeating one time would overlap every earlier
+        # call and time a growing conflict list instead of one insert
+        for n in itertools.count():
+            day = date(2026, 3, 2) + timedelta(days=n // 8)
+            yield {'title': 'Meeting', 'time': f"{9 + n % 8}:30", 'date': day.isoformat()}
+
+    for backend in backends:
+        for size in sizes:
+            path = os.path.join(workdir, f"sched-{backend}-{size}.{'db' if backend == 'sqlite' else 'json'}")
+            store = SQLiteCalendarStore(path) if backend == 'sqlite' else JsonCalendarStore(path)
+            store.import_events([
+                {'id': n + 1, 'title': 'Existing', 'time': f"{n % 24}:00", 'date': f"2026-{n % 12 + 1:02d}-01"}
+                for n in range(size)
+            ])
+            previous, agent.calendar = agent.calendar, store
+            params = meetings()
+            results[f'schedule_meeting[{backend},{size}]'] = bench(lambda: agent.schedule_meeting(next(params)), min_time)
+            agent.calendar = previous
+            store.close()
+
+    results['create_audit_log'] = bench(
+        lambda: agent.armoriq.create_audit_log('schedule', {'status': 'success'}, 'bench'), min_time)
+    agent.armoriq.audit_writer.flush(timeout=30)
+
+    log = SegmentedAuditLog(os.path.join(workdir, 'bench-audit.log'))
+    batch = lambda: [{'timestamp': datetime.utcnow().isoformat(), 'action': 'schedule', 'user': 'bench',
+                      'result': {'status': 'success'}} for _ in range(100)]
+    timing = bench(lambda: log.write_batch(batch(), fsync='none'), min_time)
+    results['audit_write_batch[100]'] = dict(timing, per_entry_us=timing['median_us'] / 100)
+    return results
+
+
+def replay(agent, commands, workers=1):
+    """Run every command through process(); latency per command and outcome counts"""
+    latencies = []
+    outcomes = {'allowed': 0, 'blocked': 0, 'error': 0}
+
+    def run(command):
+        start = time.perf_counter()
+        try:
+            response = agent.process(command['text'], command['user_id'])
+            outcome = 'allowed' if response.get('allowed') else 'blocked'
+        except Exception:
+            outcome = 'error'
+        return (time.perf_counter() - start) * 1e6, outcome
+
+    start = time.perf_counter()
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            timings = list(pool.map(run, commands))
+    else:
+        timings = [run(command) for command in commands]
+    elapsed = time.perf_counter() - start
+
+    for latency, outcome in timings:
+        latencies.append(latency)
+        outcomes[outcome] += 1
+    result = summarize(latencies)
+    result.update({
+        'p99_us': percentile(latencies, 0.99),
+        'throughput_per_s': len(commands) / elapsed,
+        'workers': workers,
+        'outcomes': outcomes,
+    })
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Print the change per benchmark; return names slower by more than threshold"""
+    regressions = []
+    print(f"\n{'benchmark':40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            print(f"{name:40} {'-':>12} {result['median_us']:12.1f}      new")
+            continue
+        change = result['median_us'] / before['median_us'] - 1
+        flag = '  ✗' if change > threshold else ''
+        print(f"{name:40} {before['median_us']:12.1f} {result['median_us']:12.1f} {change:+8.1%}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Taara pipeline benchmarks")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help="JSONL commands to replay end to end")
+    parser.add_argument('--rounds', type=int, default=3, help="times the corpus is replayed")
+    parser.add_argument('--workers', type=int, default=1, help="concurrent replay threads")
+    parser.add_argument('--calendar-sizes', default='0,1000,10000')
+    parser.add_argument('--backends', default='sqlite,json')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="seconds added by the stub ARMORIQ")
+    parser.add_argument('--hour', type=int, default=10, help="hour of day used for policy checks")
+    parser.add_argument('--min-time', type=float, default=0.5, help="seconds spent per microbenchmark")
+    parser.add_argument('--only', choices=['micro', 'e2e'])
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--compare', help="baseline results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before --compare fails")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('TAARA_SERVER_MODE', '1')
+    from armoriq_integration.stub_server import StubArmoriqServer
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, StubArmoriqServer(latency=args.stub_latency) as stub:
+        os.environ.update({
+            'HOME': workdir,
+            'ARMORIQ_AUDIT_LOG': os.path.join(workdir, 'audit.log'),
+            'TAARA_CALENDAR_DIR': os.path.join(workdir, 'calendars'),
+        })
+        agent = make_agent(workdir, stub.url, args.hour)
+        try:
+            if args.only != 'e2e':
+                sizes = [int(size) for size in args.calendar_sizes.split(',') if size]
+                backends = [backend for backend in args.backends.split(',') if backend]
+                results.update(micro_benchmarks(agent, workdir, sizes, args.min_time, backends,
+                                                load_corpus(args.corpus)))
+            if args.only != 'micro':
+                commands = load_corpus(args.corpus) * args.rounds
+                results['e2e_replay'] = replay(agent, commands, args.workers)
+                results['e2e_replay']['commands'] = len(commands)
+        finally:
+            agent.armoriq.close()
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'results': results,
+    }
+
+    for name, result in results.items():
+        print(f"{name:40} median {result['median_us']:10.1f} us   p95 {result['p95_us']:10.1f} us")
+    if 'e2e_replay' in results:
+        e2e = results['e2e_replay']
+        print(f"{'':40} {e2e['throughput_per_s']:.0f} commands/s, outcomes {e2e['outcomes']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} benchmark(s) slower than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print(f"\n✓ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+﻿#!/usr/bin/env python3
+"""
+Cold-start benchmark for the serverless handler (api/process.py)
+
+Each trial starts a fresh interpreter with ``python -X importtime``,
+imports the handler module and serves one POST, the way a new Vercel
+instance does. The median time to the first response and the import
+time of the handler module are checked against budgets; the script exits
+with status 1 when either is exceeded, so it can gate CI.
+
+    python benchmarks/coldstart.py --trials 5 --budget-ms 250
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only load once a request needs them
+LAZY_MODULES = ('yaml', 'colorama', 'requests', 'httpx', 'asyncio')
+
+TRIAL = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {api!r})
+import process
+imported = time.perf_counter()
+eager = [name for name in {lazy!r} if name in sys.modules]
+response = process.handler({{
+    'requestContext': {{'http': {{'method': 'POST'}}}},
+    'body': json.dumps({{'text': 'Add task: cold start'}})
+}}, None)
+done = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - start) * 1000, 'first_response_ms': (done - start) * 1000,
+                  'status': response['statusCode'], 'eager': eager}}))
+"""
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_trial(workdir):
+    env = dict(os.environ)
+    env.update({
+        'HOME': workdir,
+        'TAARA_CALENDAR_DIR': os.path.join(workdir, 'calendars'),
+        'ARMORIQ_AUDIT_LOG': os.path.join(workdir, 'audit.log'),
+        # Nothing listens here, so verification falls back locally without waiting
+        'ARMORIQ_ENDPOINT': 'http://127.0.0.1:9',
+        'ARMORIQ_MAX_RETRIES': '0',
+        'TAARA_SERVER_MODE': '1',
+    })
+    code = TRIAL.format(api=os.path.join(ROOT, 'api'), lazy=LAZY_MODULES)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=workdir, env=env, capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f"trial failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['modules'] = parse_importtime(proc.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serverless cold-start benchmark")
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('TAARA_COLDSTART_BUDGET_MS', '250')),
+                        help="max median time from interpreter start to the first response")
+    parser.add_argument('--import-budget-ms', type=float, default=50.0,
+                        help="max median import time of api/process.py")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list")
+    parser.add_argument('--json', dest='json_output', help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The first run compiles bytecode; it is not what instances see
+        run_trial(workdir)
+        trials = [run_trial(workdir) for _ in range(args.trials)]
+
+    import_ms = statistics.median(t['import_ms'] for t in trials)
+    first_ms = statistics.median(t['first_response_ms'] for t in trials)
+    eager = sorted(set().union(*(t['eager'] for t in trials)))
+    slowest = sorted(trials[-1]['modules'].items(), key=lambda item: -item[1][0])[:args.top]
+
+    print(f"Cold start over {args.trials} trials (median)")
+    print(f"  import api/process.py : {import_ms:7.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+    print(f"  first response        : {first_ms:7.1f} ms  (budget {args.budget_ms:.0f} ms)")
+    print(f"  eager heavy modules   : {', '.join(eager) or 'none'}")
+    print(f"  slowest imports (self time, last trial):")
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"    {self_us / 1000:6.1f} ms  {cumulative_us / 1000:7.1f} ms cumulative  {name}")
+
+    failures = []
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import took {import_ms:.1f} ms > {args.import_budget_ms:.0f} ms")
+    if first_ms > args.budget_ms:
+        failures.append(f"first response took {first_ms:.1f} ms > {args.budget_ms:.0f} ms")
+    if any(t['status'] != 200 for t in trials):
+        failures.append("handler did not return 200")
+
+    if args.json_output:
+        with open(args.json_output, 'w') as f:
+            json.dump({'import_ms': import_ms, 'first_response_ms': first_ms, 'eager': eager,
+                       'failures': failures}, f, indent=2)
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    print("✓ Within cold-start budget" if not failures else "✗ Cold-start budget exceeded")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
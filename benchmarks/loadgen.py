@@ -0,0 +1,318 @@
+﻿#!/usr/bin/env python3
+"""
+Closed-loop load generator for Taara
+
+Drives either the FastAPI app (web_app.py, in process through httpx's
+ASGI transport) or the Vercel handler (api/process.py, called directly
+with a synthesised event) from ``--concurrency`` workers. Each worker
+sends one command, waits for the answer, then sends the next, for
+``--duration`` seconds or ``--requests`` commands in total.
+
+    python benchmarks/loadgen.py --target web --concurrency 32 --duration 10
+    python benchmarks/loadgen.py --target handler --mix allowed=50,blocked=40,unknown=10 \\
+        --stub-latency 0.05
+
+ARMORIQ is a local stub server whose latency can be injected with
+--stub-latency; --batch-window-ms turns on micro-batched verification,
+and the report counts the requests that reached the stub. Policies are evaluated at a pinned hour (--hour) so
+the allowed/blocked split does not depend on the time of day. The report
+gives throughput and a latency histogram per outcome; --output writes it
+as JSON.
+"""
+
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COMMANDS = {
+    'allowed': [
+        "Schedule a meeting tomorrow at 2pm",
+        "Schedule a meeting at 10am",
+        "Remind me to call John at 5pm",
+        "Add task: Buy groceries",
+        "What meetings do I have tomorrow?",
+    ],
+    'blocked': [
+        "Delete everything from my calendar",
+        "Clear all my events",
+    ],
+    'unknown': [
+        "Hello Taara",
+        "What's the weather like?",
+    ],
+}
+
+OUTCOMES = ('allowed', 'blocked', 'unknown', 'error')
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+
+
+def parse_mix(spec):
+    """'allowed=70,blocked=20,unknown=10' -> [(kind, weight), ...]"""
+    mix = []
+    for part in spec.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in COMMANDS:
+            raise ValueError(f"Unknown command kind {kind!r}; use {', '.join(COMMANDS)}")
+        mix.append((kind, float(weight or 1)))
+    return mix
+
+
+class Recorder:
+    """Latency samples per outcome, shared by all workers"""
+
+    def __init__(self):
+        self.samples = {outcome: [] for outcome in OUTCOMES}
+        self._lock = threading.Lock()
+        self._first = None
+        self._last = None
+
+    def record(self, outcome, latency_ms):
+        now = time.perf_counter()
+        with self._lock:
+            self.samples[outcome].append(latency_ms)
+            if self._first is None:
+                self._first = now - latency_ms / 1000
+            self._last = now
+
+    def elapsed(self):
+        """Seconds from the first recorded request's start to the last response"""
+        return self._last - self._first if self._first is not None else 0.0
+
+    @staticmethod
+    def _stats(values):
+        if not values:
+            return {'count': 0}
+        ordered = sorted(values)
+
+        def pick(fraction):
+            return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+        histogram = [0] * len(BUCKETS_MS)
+        for value in ordered:
+            histogram[bisect.bisect_left(BUCKETS_MS, value)] += 1
+        return {
+            'count': len(ordered),
+            'mean_ms': sum(ordered) / len(ordered),
+            'p50_ms': pick(0.50),
+            'p90_ms': pick(0.90),
+            'p99_ms': pick(0.99),
+            'max_ms': ordered[-1],
+            'histogram': histogram,
+        }
+
+    def report(self, elapsed):
+        everything = [value for values in self.samples.values() for value in values]
+        return {
+            'elapsed_s': elapsed,
+            'requests': len(everything),
+            'throughput_per_s': len(everything) / elapsed if elapsed else 0.0,
+            'overall': self._stats(everything),
+            'outcomes': {outcome: self._stats(values) for outcome, values in self.samples.items()},
+            'buckets_ms': [str(bound) for bound in BUCKETS_MS],
+        }
+
+
+def classify(response):
+    """Outcome of one /api/process response body"""
+    if response.get('error'):
+        return 'error'
+    if response.get('action') == 'unknown':
+        return 'unknown'
+    return 'allowed' if response.get('allowed') else 'blocked'
+
+
+class Workload:
+    """Shared stop condition and command picker for the workers"""
+
+    def __init__(self, mix, users, duration, requests, seed):
+        self.kinds = [kind for kind, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.users = [f"load-user-{n}" for n in range(users)]
+        self.duration = duration
+        self.deadline = None
+        self.remaining = requests
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the clock once warm-up is done"""
+        if self.duration:
+            self.deadline = time.monotonic() + self.duration
+
+    def next(self):
+        """(command, user) for the next request, or None when the run is over"""
+        with self._lock:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                return None
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    return None
+                self.remaining -= 1
+            kind = self._random.choices(self.kinds, self.weights)[0]
+            return self._random.choice(COMMANDS[kind]), self._random.choice(self.users)
+
+
+def pin_policies(agent, hour):
+    agent.check_policies = lambda action, params: agent.policy_store.current().check(action, hour)
+
+
+def run_web(workload, recorder, concurrency, stub_url, hour, warmup):
+    """Closed loop against the FastAPI app through the ASGI transport"""
+    import httpx
+    import web_app
+
+    web_app.agent.armoriq.api_endpoint = stub_url
+    pin_policies(web_app.agent, hour)
+
+    async def send(client, text, user):
+        try:
+            response = await client.post("/api/process", json={"text": text}, headers={"X-User-Id": user})
+            return classify(response.json()) if response.status_code == 200 else 'error'
+        except Exception:
+            return 'error'
+
+    async def worker(client):
+        while True:
+            item = workload.next()
+            if item is None:
+                return
+            start = time.perf_counter()
+            outcome = await send(client, *item)
+            recorder.record(outcome, (time.perf_counter() - start) * 1000)
+
+    async def main():
+        transport = httpx.ASGITransport(app=web_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadgen") as client:
+            for _ in range(warmup):
+                await send(client, COMMANDS['allowed'][0], 'warmup')
+            workload.start()
+            await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        await web_app.agent.aclose()
+
+    asyncio.run(main())
+
+
+def run_handler(workload, recorder, concurrency, stub_url, hour, warmup):
+    """Closed loop calling the Vercel handler from worker threads"""
+    sys.path.insert(0, os.path.join(ROOT, 'api'))
+    import process
+
+    agent = process.get_agent()
+    agent.armoriq.api_endpoint = stub_url
+    pin_policies(agent, hour)
+
+    def send(text, user):
+        event = {
+            'requestContext': {'http': {'method': 'POST'}},
+            'headers': {'x-user-id': user},
+            'body': json.dumps({'text': text}),
+        }
+        try:
+            response = process.handler(event, None)
+            return classify(json.loads(response['body'])) if response['statusCode'] == 200 else 'error'
+        except Exception:
+            return 'error'
+
+    def worker():
+        while True:
+            item = workload.next()
+            if item is None:
+                return
+            start = time.perf_counter()
+            outcome = send(*item)
+            recorder.record(outcome, (time.perf_counter() - start) * 1000)
+
+    for _ in range(warmup):
+        send(COMMANDS['allowed'][0], 'warmup')
+    workload.start()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']:.2f}s "
+          f"= {report['throughput_per_s']:.1f} req/s, {report['upstream_requests']} upstream ARMORIQ requests")
+    print(f"\n{'outcome':10} {'count':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (ms)")
+    for outcome, stats in [('overall', report['overall'])] + list(report['outcomes'].items()):
+        if not stats['count']:
+            continue
+        print(f"{outcome:10} {stats['count']:7} {stats['mean_ms']:9.2f} {stats['p50_ms']:9.2f} "
+              f"{stats['p90_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['max_ms']:9.2f}")
+
+    print("\nLatency histogram (ms)")
+    active = [(outcome, stats) for outcome, stats in report['outcomes'].items() if stats['count']]
+    print(f"{'<=':>8} " + ''.join(f"{outcome:>10}" for outcome, _ in active))
+    for position, bound in enumerate(BUCKETS_MS):
+        counts = [stats['histogram'][position] for _, stats in active]
+        if any(counts):
+            print(f"{bound:>8} " + ''.join(f"{count:>10}" for count in counts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Closed-loop load generator for Taara")
+    parser.add_argument('--target', choices=['web', 'handler'], default='web')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument('--requests', type=int, default=None, help="stop after this many requests")
+    parser.add_argument('--mix', default='allowed=70,blocked=20,unknown=10')
+    parser.add_argument('--users', type=int, default=10, help="distinct X-User-Id values")
+    parser.add_argument('--stub-latency', type=float, default=0.0, help="seconds added by the stub ARMORIQ")
+    parser.add_argument('--batch-window-ms', type=float, default=0.0,
+                        help="micro-batch ARMORIQ verifications within this window (0 = off)")
+    parser.add_argument('--hour', type=int, default=10, help="hour of day used for policy checks")
+    parser.add_argument('--warmup', type=int, default=10, help="unrecorded requests sent first")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the report JSON here")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    workdir = tempfile.mkdtemp(prefix='taara-load-')
+    os.environ.update({
+        'TAARA_SERVER_MODE': '1',
+        'HOME': workdir,
+        'TAARA_CALENDAR_DIR': os.path.join(workdir, 'calendars'),
+        'ARMORIQ_AUDIT_LOG': os.path.join(workdir, 'audit.log'),
+        'ARMORIQ_BATCH_WINDOW_MS': str(args.batch_window_ms),
+    })
+
+    from armoriq_integration.stub_server import StubArmoriqServer
+
+    workload = Workload(mix, args.users, None if args.requests else args.duration, args.requests, args.seed)
+    recorder = Recorder()
+    run = run_web if args.target == 'web' else run_handler
+
+    with StubArmoriqServer(latency=args.stub_latency) as stub:
+        run(workload, recorder, args.concurrency, stub.url, args.hour, args.warmup)
+        upstream = stub.requests
+    elapsed = recorder.elapsed()
+
+    report = recorder.report(elapsed)
+    report['upstream_requests'] = upstream
+    report['config'] = {k: v for k, v in vars(args).items() if k != 'output'}
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+    return 1 if report['outcomes']['error']['count'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+﻿"""
+Push updates to connected dashboards
+
+``Broadcaster`` fans messages out to subscribers, each with its own bounded
+asyncio queue. A client that falls behind loses its oldest messages
+instead of holding up the publisher or the other clients, and is told how
+many it missed so it can resync (``/api/calendar?since=<version>``).
+
+Every message is encoded as a Server-Sent Events frame once, on publish,
+and the same string is queued for every subscriber, so an idle connection
+costs one queue and one suspended coroutine. ``publish`` may be called
+from any thread; delivery always happens on the event loop.
+"""
+
+import asyncio
+import json
+import os
+import threading
+
+import metrics
+
+QUEUE_SIZE = int(os.getenv('TAARA_STREAM_QUEUE_SIZE', '100'))
+HEARTBEAT_SECONDS = float(os.getenv('TAARA_STREAM_HEARTBEAT', '15'))
+RETRY_MS = 3000
+
+metrics.REGISTRY.describe('taara_stream_messages_total', 'counter', 'Messages published to dashboards by event')
+metrics.REGISTRY.describe('taara_stream_dropped_total', 'counter', 'Messages dropped for slow dashboards')
+metrics.REGISTRY.describe('taara_stream_clients', 'gauge', 'Connected dashboard streams')
+
+
+def sse_frame(event, data):
+    """One Server-Sent Events frame; ``data`` is sent as a single JSON line"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    """One connected client's queue"""
+
+    def __init__(self, user, maxsize):
+        self.user = user
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, frame):
+        """Queue a frame, dropping the oldest one when full; runs on the loop"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            metrics.REGISTRY.inc('taara_stream_dropped_total')
+        self.queue.put_nowait(frame)
+
+    async def frames(self, heartbeat=HEARTBEAT_SECONDS):
+        """SSE frames for this client, with comment heartbeats while idle"""
+        yield f"retry: {RETRY_MS}\n\n"
+        reported = 0
+        while True:
+            try:
+                frame = await asyncio.wait_for(self.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if frame is None:
+                return
+            if self.dropped != reported:
+                yield sse_frame('dropped', {'count': self.dropped - reported})
+                reported = self.dropped
+            yield frame
+
+
+class Broadcaster:
+    """Per-user fan-out of SSE frames"""
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._subscribers = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, user):
+        """Register a client; call from the event loop"""
+        subscription = Subscription(user, self.maxsize)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.setdefault(user, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            clients = self._subscribers.get(subscription.user)
+            if clients is not None:
+                clients.discard(subscription)
+                if not clients:
+                    del self._subscribers[subscription.user]
+
+    def close(self):
+        """End every open stream; call from the event loop at shutdown"""
+        with self._lock:
+            clients = [s for subscribers in self._subscribers.values() for s in subscribers]
+        for subscription in clients:
+            subscription.offer(None)
+
+    def clients(self, user=None):
+        with self._lock:
+            if user is not None:
+                return len(self._subscribers.get(user, ()))
+            return sum(len(clients) for clients in self._subscribers.values())
+
+    def publish(self, user, event, data):
+        """Send an event to every dashboard of ``user``; safe from any thread"""
+        metrics.REGISTRY.inc('taara_stream_messages_total', event=event)
+        with self._lock:
+            if user not in self._subscribers:
+                return
+            loop = self._loop
+        frame = sse_frame(event, data)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(user, frame)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._deliver, user, frame)
+
+    def _deliver(self, user, frame):
+        with self._lock:
+            clients = list(self._subscribers.get(user, ()))
+        for subscription in clients:
+            subscription.offer(frame)
+
+    def publish_response(self, user, response):
+        """Broadcast a /api/process decision and any event it created"""
+        self.publish(user, 'decision', {
+            'command': response.get('command'),
+            'action': response.get('action'),
+            'allowed': response.get('allowed', False),
+            'message': response.get('message'),
+            'reason': response.get('reason'),
+        })
+        event = (response.get('result') or {}).get('event')
+        if response.get('allowed') and event:
+            self.publish(user, 'calendar', {'event': event, 'version': event.get('version')})
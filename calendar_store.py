@@ -0,0 +1,1129 @@
+﻿#!/usr/bin/env python3
+"""
+Taara calendar storage backends
+
+The default backend is an embedded SQLite database with indexes on the
+event id and date, so scheduling a meeting is a single indexed insert
+instead of a rewrite of the whole calendar. The original JSON document
+(``{"events": [...]}``) is still supported as a backend and as the
+import/export format.
+
+Both backends are safe to share between processes (several uvicorn
+workers, or serverless invocations on one host): SQLite serialises
+writers itself, and the JSON backend takes an advisory lock and replaces
+the file atomically. Ids are monotonic and never reused.
+
+Every stored event carries a ``version`` from a per-calendar counter that
+only goes up, so readers can ask for the current version (an ETag) or for
+just the events added since a version they already have.
+
+Events last ``duration`` minutes (DEFAULT_DURATION when unset). The index
+keeps, per day, the timed events sorted by start and the merged busy
+blocks they cover, so an overlap check or a free-slot search is a dict
+lookup plus a bisect however large the calendar grows. ``add_event`` can
+reject or flag events that overlap existing ones (``on_conflict``), and
+``free_slot`` finds the next gap of N minutes inside allowed hours.
+
+Recurring events (see recurrence.py) are stored as one record holding the
+rule. Range reads expand each series lazily over the requested dates and
+heapq.merge the occurrences with the one-off events, so a page of a busy
+calendar never materialises more than it returns.
+
+ShardedCalendarStore partitions calendars by user: each user gets a
+separate store file with its own lock and query index, so users write in
+parallel and a read only ever touches the caller's events.
+"""
+
+import argparse
+import base64
+import bisect
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date as Date, timedelta
+from operator import itemgetter
+
+from recurrence import HORIZON_DAYS, is_recurring, normalize_rule, occurrence_on, occurrences, set_exception
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one writer process per file
+    fcntl = None
+
+DEFAULT_BACKEND = 'sqlite'
+DEFAULT_USER = 'anonymous'
+BUSY_TIMEOUT = 30.0
+# Shards kept open at once; each SQLite shard holds a few file descriptors
+MAX_OPEN_SHARDS = 128
+
+DEFAULT_DURATION = 30
+MINUTES_PER_DAY = 24 * 60
+FREE_SLOT_DAYS = 14
+
+# add_event(on_conflict=...): store overlapping events silently, store them
+# and report the overlap, or refuse them
+ALLOW, WARN, REJECT = 'allow', 'warn', 'reject'
+CONFLICT_MODES = (ALLOW, WARN, REJECT)
+# Overlapping events listed in a warning or rejection; the rest are only counted
+MAX_REPORTED_CONFLICTS = 5
+# Dates whose recurring-event occurrences are kept expanded (a year both ways)
+SERIES_CACHE_DAYS = 2 * HORIZON_DAYS
+
+
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+
+def time_key(value):
+    """Normalize '9:00' style times to a sortable 'HH:MM' key"""
+    hour, sep, minute = str(value).partition(':')
+    if not hour.isdigit():
+        return str(value)
+    return f"{int(hour):02d}:{minute if sep else '00'}"
+
+
+def event_span(event):
+    """(start, end) minutes of the day an event occupies, or None if untimed
+
+    Events are kept within their own day: one running past midnight ends at 24:00.
+    """
+    hour, sep, minute = str(event.get('time', '')).partition(':')
+    if not (hour.isdigit() and (minute.isdigit() or not sep)):
+        return None
+    duration = event.get('duration') or DEFAULT_DURATION
+    if not isinstance(duration, int):
+        try:
+            duration = int(duration)
+        except (TypeError, ValueError):
+            duration = DEFAULT_DURATION
+    start = int(hour) * 60 + int(minute or 0)
+    end = min(start + duration, MINUTES_PER_DAY)
+    if start >= MINUTES_PER_DAY or end <= start:
+        return None
+    return start, end
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def hour_windows(hour_mask=None):
+    """Contiguous (start, end) minute ranges of the hours set in a 24-bit mask"""
+    if hour_mask is None:
+        return [(0, MINUTES_PER_DAY)]
+    windows = []
+    for hour in range(24):
+        if not hour_mask >> hour & 1:
+            continue
+        if windows and windows[-1][1] == hour * 60:
+            windows[-1] = (windows[-1][0], (hour + 1) * 60)
+        else:
+            windows.append((hour * 60, (hour + 1) * 60))
+    return windows
+
+
+def describe_conflicts(conflicts, count=None, dated=False):
+    """'Standup at 9:00, Review at 9:30 and 3 more' for the first MAX_REPORTED_CONFLICTS
+
+    ``dated`` adds each conflict's date, for series that clash on several days.
+    """
+    count = len(conflicts) if count is None else count
+    shown = conflicts[:MAX_REPORTED_CONFLICTS]
+    text = ", ".join(f"{e.get('title', 'event')} at {e.get('time')}" + (f" on {e.get('date')}" if dated else "")
+                     for e in shown)
+    return f"{text} and {count - len(shown)} more" if count > len(shown) else text
+
+
+class ConflictError(ValueError):
+    """An event overlaps events already in the calendar
+
+    ``conflicts`` lists the first MAX_REPORTED_CONFLICTS of them and
+    ``conflict_count`` how many there are.
+    """
+
+    def __init__(self, event, conflicts):
+        self.event = event
+        self.conflicts = conflicts[:MAX_REPORTED_CONFLICTS]
+        self.conflict_count = len(conflicts)
+        if is_recurring(event):
+            super().__init__(f"Overlaps {describe_conflicts(conflicts, dated=True)}")
+        else:
+            super().__init__(f"Overlaps {describe_conflicts(conflicts)} on {event.get('date')}")
+
+
+class DaySchedule:
+    """Timed events of one day and the busy blocks they cover
+
+    ``_spans`` holds (start, end, id) sorted by start; ``_starts``/``_ends``
+    are the disjoint, sorted blocks of the union of those spans. Lookups
+    are bisects; an insert merges into its neighbouring blocks.
+    """
+
+    def __init__(self, spans=()):
+        self._spans = sorted(spans)
+        self._starts = []
+        self._ends = []
+        self.longest = 0
+        for start, end, _ in self._spans:
+            self.longest = max(self.longest, end - start)
+            if self._ends and start <= self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def add(self, start, end, event_id):
+        bisect.insort(self._spans, (start, end, event_id))
+        self.longest = max(self.longest, end - start)
+        # Blocks that overlap or touch [start, end) collapse into one
+        first = bisect.bisect_left(self._ends, start)
+        last = bisect.bisect_right(self._starts, end)
+        if first < last:
+            start = min(start, self._starts[first])
+            end = max(end, self._ends[last - 1])
+        self._starts[first:last] = [start]
+        self._ends[first:last] = [end]
+
+    def busy(self, start, end):
+        """Whether anything is scheduled inside [start, end)"""
+        block = bisect.bisect_right(self._ends, start)
+        return block < len(self._starts) and self._starts[block] < end
+
+    def overlapping(self, start, end):
+        """(start, end, id) of the events overlapping [start, end), by start time"""
+        if not self.busy(start, end):
+            return []
+        # Nothing longer than self.longest can reach start from further back
+        first = bisect.bisect_left(self._spans, (start - self.longest,))
+        spans = []
+        for position in range(first, len(self._spans)):
+            span = self._spans[position]
+            if span[0] >= end:
+                break
+            if span[1] > start:
+                spans.append(span)
+        return spans
+
+    def free(self, minutes, window_start, window_end):
+        """Start of the first gap of ``minutes`` inside the window, or None"""
+        cursor = window_start
+        block = bisect.bisect_right(self._ends, cursor)
+        while cursor + minutes <= window_end:
+            next_start = self._starts[block] if block < len(self._starts) else MINUTES_PER_DAY
+            if min(next_start, window_end) - cursor >= minutes:
+                return cursor
+            if next_start >= window_end:
+                return None
+            cursor = max(cursor, self._ends[block])
+            block += 1
+        return None
+
+
+def first_free(schedules, minutes, window_start, window_end):
+    """Start of the first gap of ``minutes`` free in every DaySchedule, or None"""
+    cursor = window_start
+    while True:
+        starts = [schedule.free(minutes, cursor, window_end) for schedule in schedules]
+        if None in starts:
+            return None
+        # Each schedule's answer is a lower bound for all of them; stop once they agree
+        latest = max(starts, default=cursor)
+        if latest == cursor:
+            return cursor if cursor + minutes <= window_end else None
+        cursor = latest
+
+
+def encode_cursor(key, origin=None):
+    """Opaque pagination cursor for an index key
+
+    ``origin`` is the date_from of the first page, which fixes where
+    open-ended series stop however far the pages have moved.
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(key) + [origin]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor into (key, origin)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, time, event_id, *rest = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    # Cursors from before origin was added have three items
+    origin = rest[0] if len(rest) == 1 else None
+    # The key is compared against (str, str, int) index keys, so anything else is a client error
+    if not (isinstance(date, str) and isinstance(time, str)
+            and isinstance(event_id, int) and not isinstance(event_id, bool) and len(rest) <= 1
+            and (origin is None or isinstance(origin, str) and DATE_PATTERN.match(origin))):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return (date, time, event_id), origin
+
+
+class EventIndex:
+    """In-memory index of events sorted by (date, time, id), with a DaySchedule per date
+
+    Recurring events are kept apart in ``_rules`` and expanded on demand;
+    ``_series_days`` caches the DaySchedule of their occurrences per date.
+    """
+
+    def __init__(self, events=()):
+        self._keys = []
+        self._events = {}
+        self._rules = {}
+        self.max_id = 0
+        self.max_version = 0
+        spans = {}
+        for event in events:
+            self._events[event['id']] = event
+            self.max_id = max(self.max_id, event['id'])
+            self.max_version = max(self.max_version, event.get('version', 0))
+            if is_recurring(event):
+                self._rules[event['id']] = event
+                continue
+            self._keys.append(self.key(event))
+            span = event_span(event)
+            if span is not None:
+                spans.setdefault(event.get('date', ''), []).append(span + (event['id'],))
+        self._keys.sort()
+        self._days = {date: DaySchedule(day_spans) for date, day_spans in spans.items()}
+        self._series_days = {}
+
+    def __len__(self):
+        return len(self._events)
+
+    @staticmethod
+    def key(event):
+        return (event.get('date', ''), time_key(event.get('time', '')), event['id'])
+
+    def add(self, event):
+        """Index a new event, or the new state of a recurring one"""
+        self.max_version = max(self.max_version, event.get('version', 0))
+        if is_recurring(event):
+            changed = event['id'] in self._rules
+            self._events[event['id']] = self._rules[event['id']] = event
+            if changed:
+                # Exceptions move or cancel occurrences; expanded again on demand
+                self._series_days.clear()
+            else:
+                for date, day in self._series_days.items():
+                    span = self._occurrence_span(event, date)
+                    if span:
+                        day.add(*span)
+        elif event['id'] not in self._events:
+            self._events[event['id']] = event
+            bisect.insort(self._keys, self.key(event))
+            self._schedule(event)
+        self.max_id = max(self.max_id, event['id'])
+
+    def _schedule(self, event):
+        span = event_span(event)
+        if span is not None:
+            day = self._days.get(event.get('date', ''))
+            if day is None:
+                day = self._days[event.get('date', '')] = DaySchedule()
+            day.add(span[0], span[1], event['id'])
+
+    @staticmethod
+    def _occurrence_span(rule, date):
+        occurrence = occurrence_on(rule, date)
+        span = occurrence and event_span(occurrence)
+        return span + (rule['id'],) if span else None
+
+    def _series_day(self, date):
+        """DaySchedule of the recurring events' occurrences on one date"""
+        day = self._series_days.get(date)
+        if day is None:
+            if len(self._series_days) >= SERIES_CACHE_DAYS:
+                self._series_days.clear()
+            spans = [span for span in (self._occurrence_span(rule, date) for rule in self._rules.values()) if span]
+            day = self._series_days[date] = DaySchedule(spans)
+        return day
+
+    def _schedules(self, date):
+        """DaySchedules covering one date: its one-off events, then the series' occurrences"""
+        schedules = [self._days[date]] if date in self._days else []
+        if self._rules and DATE_PATTERN.match(date):
+            schedules.append(self._series_day(date))
+        return schedules
+
+    def conflicts(self, event):
+        """Indexed events (or occurrences) overlapping a (not yet stored) event
+
+        A recurring event is checked on each of its occurrences, up to its
+        until date or HORIZON_DAYS after it starts.
+        """
+        found = []
+        for occurrence in occurrences(event) if is_recurring(event) else (event,):
+            span = event_span(occurrence)
+            if span is None:
+                continue
+            date = occurrence.get('date', '')
+            overlaps = heapq.merge(*(day.overlapping(*span) for day in self._schedules(date)))
+            found.extend(occurrence_on(self._rules[event_id], date) if event_id in self._rules
+                         else self._events[event_id] for _, _, event_id in overlaps)
+        return found
+
+    def free_slot(self, minutes, date, after=0, hour_mask=None, days=FREE_SLOT_DAYS):
+        """First (date, start minute) with ``minutes`` free inside the allowed hours"""
+        windows = hour_windows(hour_mask)
+        day = Date.fromisoformat(date)
+        for offset in range(days):
+            schedules = self._schedules(day.isoformat())
+            for window_start, window_end in windows:
+                start = first_free(schedules, minutes, max(window_start, after if offset == 0 else 0), window_end)
+                if start is not None:
+                    return day.isoformat(), start
+            day += timedelta(days=1)
+        return None
+
+    def range(self, date_from=None, date_to=None, after=None, origin=None):
+        """Yield (key, event) between two dates (inclusive), resuming after a key
+
+        One-off events come from the sorted keys; each recurring event adds
+        a lazy stream of occurrences, merged in key order. Without
+        ``date_to``, a series without an until date stops HORIZON_DAYS after
+        ``origin`` (the first page's date_from; defaults to ``date_from``) or
+        its start, so every page of one query agrees on where it ends.
+        """
+        one_offs = self._one_offs(date_from, date_to, after)
+        if not self._rules:
+            return one_offs
+        origin = date_from if after is None else origin
+        series = [self._expand(rule, date_from, date_to, after, origin) for rule in self._rules.values()]
+        return heapq.merge(one_offs, *series, key=itemgetter(0))
+
+    def _expand(self, rule, date_from, date_to, after, origin):
+        if date_to is None and not rule['recurrence'].get('until'):
+            first = max(rule['date'], origin) if origin else rule['date']
+            date_to = (Date.fromisoformat(first) + timedelta(days=HORIZON_DAYS)).isoformat()
+        if after is not None:
+            date_from = max(date_from or after[0], after[0])
+        for occurrence in occurrences(rule, date_from, date_to):
+            key = self.key(occurrence)
+            if after is None or key > after:
+                yield key, occurrence
+
+    def _one_offs(self, date_from, date_to, after):
+        start = bisect.bisect_left(self._keys, (date_from,)) if date_from else 0
+        if after is not None:
+            start = max(start, bisect.bisect_right(self._keys, after))
+        end = bisect.bisect_right(self._keys, (date_to, '\uffff')) if date_to else len(self._keys)
+        for position in range(start, end):
+            yield self._keys[position], self._events[self._keys[position][2]]
+
+
+class CalendarStore:
+    """Base class for calendar backends"""
+
+    _index = None
+
+    def _index_event(self, event):
+        if self._index is not None:
+            self._index.add(event)
+
+    def _refresh_index(self):
+        """Build the index if needed; the caller holds the store lock"""
+        if self._index is None:
+            self._index = EventIndex(self.events_unlocked())
+
+    def query(self, date_from=None, date_to=None, cursor=None, limit=None, fields=None):
+        """Return one page of events in (date, time) order"""
+        after, origin = decode_cursor(cursor) if cursor else (None, date_from)
+        with self._lock:
+            self._refresh_index()
+            matches = self._index.range(date_from, date_to, after, origin)
+            page = list(itertools.islice(matches, limit + 1 if limit else None))
+
+        next_cursor = None
+        if limit and len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1][0], origin)
+
+        events = [event for _, event in page]
+        if fields:
+            events = [{field: event[field] for field in fields if field in event} for event in events]
+        return {"events": events, "next_cursor": next_cursor}
+
+    def events_unlocked(self):
+        """Iterate over all events; the caller holds the store lock"""
+        return self.events()
+
+    def conflicts(self, event):
+        """Stored events that overlap ``event`` (same date, intersecting spans)"""
+        with self._lock:
+            self._refresh_index()
+            return self._index.conflicts(event)
+
+    def free_slot(self, minutes, date, after=0, hour_mask=None, days=FREE_SLOT_DAYS):
+        """Next free slot of ``minutes`` from ``date`` at minute ``after``
+
+        Only hours set in ``hour_mask`` (bit N = hour N, as in the policy
+        engine) count; None means the whole day. Returns {"date", "time",
+        "duration"}, or None when nothing is free within ``days`` days.
+        """
+        if minutes <= 0:
+            raise ValueError(f"Invalid slot length: {minutes} minutes")
+        with self._lock:
+            self._refresh_index()
+            slot = self._index.free_slot(minutes, date, after, hour_mask, days)
+        if slot is None:
+            return None
+        return {"date": slot[0], "time": format_minutes(slot[1]), "duration": minutes}
+
+    def update_occurrence(self, event_id, date, changes=None):
+        """Cancel one occurrence of a recurring event, or change its time, duration or title
+
+        ``changes`` None cancels. The series stays a single record: the
+        exception is stored on it and its version moves on. Returns the
+        updated event.
+        """
+        def apply(event):
+            if not is_recurring(event):
+                raise ValueError(f"Event {event_id} is not recurring")
+            set_exception(event, date, changes)
+        return self._update_event(event_id, apply)
+
+    def cancel_occurrence(self, event_id, date):
+        return self.update_occurrence(event_id, date)
+
+    def _update_event(self, event_id, apply):
+        """Apply ``apply(event)`` to a stored event under a new version"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _prepare(event):
+        """Validate the recurrence rule of an event about to be stored"""
+        if event.get('recurrence') is not None:
+            event['recurrence'] = normalize_rule(event['recurrence'])
+            Date.fromisoformat(event.get('date', ''))
+        return event
+
+    def _check_conflicts(self, event, on_conflict):
+        """Overlaps for add_event; the caller holds the lock and refreshed the index"""
+        if on_conflict not in CONFLICT_MODES:
+            raise ValueError(f"Unknown conflict mode: {on_conflict}")
+        conflicts = self._index.conflicts(event)
+        if conflicts and on_conflict == REJECT:
+            raise ConflictError(event, conflicts)
+        return conflicts
+
+    @staticmethod
+    def _with_conflicts(stored, conflicts):
+        # Reported to the caller only; the stored and indexed event stay as they were
+        if not conflicts:
+            return stored
+        return dict(stored, conflicts=conflicts[:MAX_REPORTED_CONFLICTS], conflict_count=len(conflicts))
+
+    def version(self):
+        """Current calendar version; 0 for an empty calendar"""
+        raise NotImplementedError
+
+    def changes(self, since=0, limit=None):
+        """Events added after version ``since``, oldest first
+
+        Returns {"events", "version", "more"}: ``version`` is the version to
+        pass as ``since`` next time, and ``more`` is set when ``limit`` cut
+        the list short.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _changes_page(events, since, limit, current):
+        page = list(itertools.islice(events, limit + 1 if limit else None))
+        more = bool(limit) and len(page) > limit
+        if more:
+            page = page[:limit]
+        return {"events": page, "version": page[-1]["version"] if more else max(current, since), "more": more}
+
+    def add_event(self, event, on_conflict=ALLOW):
+        """Store a new event, assign its id and return it
+
+        With ``on_conflict`` WARN the returned event lists the events it
+        overlaps under "conflicts"; with REJECT an overlap raises
+        ConflictError and nothing is stored.
+        """
+        raise NotImplementedError
+
+    def get_event(self, event_id):
+        """Return one event by id, or None"""
+        raise NotImplementedError
+
+    def events(self):
+        """Iterate over all events in id order"""
+        raise NotImplementedError
+
+    def count(self):
+        """Number of stored events"""
+        return sum(1 for _ in self.events())
+
+    def import_events(self, events):
+        """Bulk import events, keeping their ids where present"""
+        imported = 0
+        for event in events:
+            self.add_event(dict(event))
+            imported += 1
+        return imported
+
+    def export(self):
+        """Return the calendar in the JSON document format"""
+        return {"events": list(self.events())}
+
+    def export_json(self, path):
+        """Write the calendar to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.export(), f, indent=2)
+
+    def import_json(self, path):
+        """Load events from a JSON calendar file"""
+        with open(path, 'r') as f:
+            calendar = json.load(f)
+        return self.import_events(calendar.get('events', []))
+
+    def close(self):
+        pass
+
+
+class JsonCalendarStore(CalendarStore):
+    """Legacy backend that keeps the whole calendar in one JSON file
+
+    Writers hold an advisory lock on ``<path>.lock`` for the whole
+    read-modify-write and replace the file atomically (temp file, fsync,
+    rename, fsync of the directory), so concurrent processes neither lose
+    writes nor leave a torn file behind. Ids come from a ``next_id``
+    counter kept in the document, versions from its ``version`` counter;
+    explicit ids are checked for collisions like SQLite's primary key.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._version = 0
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, 'a') as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        calendar = {"events": []}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    calendar = json.load(f)
+            except (OSError, ValueError):
+                pass
+        if "version" not in calendar:
+            # Files written before versioning: number events in file order
+            for position, event in enumerate(calendar["events"], 1):
+                event.setdefault("version", position)
+            calendar["version"] = len(calendar["events"])
+        return calendar
+
+    def _save(self, calendar):
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(calendar, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.unlink(temp)
+            raise
+        # Persist the rename itself, not just the new file's contents
+        if hasattr(os, 'O_DIRECTORY'):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    @staticmethod
+    def _append(calendar, event, ids):
+        """Append an event under a new version, keeping its id or taking next_id
+
+        ``ids`` holds the ids in use; a taken or non-integer id raises
+        ValueError, as the SQLite primary key would.
+        """
+        event = dict(event)
+        event.pop('version', None)
+        event_id = event.pop('id', None)
+        if event_id is None:
+            event_id = calendar["next_id"]
+        if not isinstance(event_id, int) or isinstance(event_id, bool) or event_id in ids:
+            raise ValueError(f"Invalid or duplicate event id: {event_id!r}")
+        ids.add(event_id)
+        stored = {"id": event_id}
+        stored.update(event)
+        calendar["version"] += 1
+        stored["version"] = calendar["version"]
+        calendar["events"].append(stored)
+        calendar["next_id"] = max(calendar["next_id"], event_id + 1)
+        return stored
+
+    @staticmethod
+    def _next_id(calendar):
+        """Next free id; files written before next_id existed use max(id) + 1"""
+        ids = [event['id'] + 1 for event in calendar["events"] if isinstance(event.get('id'), int)]
+        return max([calendar.get("next_id", 1)] + ids)
+
+    def _refresh_index(self):
+        # Another process may have replaced the file since the index was built
+        stamp = self._file_stamp()
+        if self._index is None or stamp != self._stamp:
+            calendar = self._load()
+            self._stamp = stamp
+            self._version = calendar["version"]
+            self._index = EventIndex(calendar["events"])
+
+    def add_event(self, event, on_conflict=ALLOW):
+        event = self._prepare(dict(event))
+        with self._lock, self._file_lock():
+            if self._file_stamp() != self._stamp:
+                self._index = None
+            conflicts = []
+            if on_conflict != ALLOW:
+                self._refresh_index()
+                conflicts = self._check_conflicts(event, on_conflict)
+            calendar = self._load()
+            calendar["next_id"] = self._next_id(calendar)
+            stored = self._append(calendar, event, {e.get('id') for e in calendar["events"]})
+            self._save(calendar)
+            self._stamp = self._file_stamp()
+            self._version = calendar["version"]
+            self._index_event(stored)
+        return self._with_conflicts(stored, conflicts)
+
+    def _update_event(self, event_id, apply):
+        with self._lock, self._file_lock():
+            if self._file_stamp() != self._stamp:
+                self._index = None
+            calendar = self._load()
+            event = next((e for e in calendar["events"] if e.get('id') == event_id), None)
+            if event is None:
+                raise ValueError(f"No event {event_id}")
+            apply(event)
+            calendar["version"] += 1
+            event["version"] = calendar["version"]
+            self._save(calendar)
+            self._stamp = self._file_stamp()
+            self._version = calendar["version"]
+            self._index_event(event)
+        return event
+
+    def get_event(self, event_id):
+        for event in self.events():
+            if event.get('id') == event_id:
+                return event
+        return None
+
+    def events(self):
+        return iter(self._load()["events"])
+
+    def count(self):
+        return len(self._load()["events"])
+
+    def version(self):
+        # Served from the index state, so it costs a stat() unless the file changed
+        with self._lock:
+            self._refresh_index()
+            return self._version
+
+    def changes(self, since=0, limit=None):
+        calendar = self._load()
+        events = sorted((e for e in calendar["events"] if e["version"] > since), key=lambda e: e["version"])
+        return self._changes_page(iter(events), since, limit, calendar["version"])
+
+    def import_events(self, events):
+        with self._lock, self._file_lock():
+            calendar = self._load()
+            calendar["next_id"] = self._next_id(calendar)
+            ids = {e.get('id') for e in calendar["events"]}
+            for event in events:
+                # All or nothing: a bad id raises before anything is saved
+                self._append(calendar, event, ids)
+            self._save(calendar)
+            self._index = None
+        return len(events)
+
+
+class SQLiteCalendarStore(CalendarStore):
+    """Embedded SQLite backend with indexed, O(log n) inserts"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            body TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_date ON events (date, time);
+    """
+    INDEXES = """
+        CREATE INDEX IF NOT EXISTS idx_events_version ON events (version);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._data_version = None
+        self._connect()
+
+    def _connect(self):
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                           timeout=BUSY_TIMEOUT)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+        self._conn.executescript(self.INDEXES)
+
+    @property
+    def _conn(self):
+        # A closed store reconnects on next use (shards are closed while callers may hold them)
+        if self._connection is None:
+            self._connect()
+        return self._connection
+
+    def _migrate(self):
+        """Add the version column to databases created before it existed"""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(events)')]
+        if 'version' not in columns:
+            self._conn.execute('BEGIN IMMEDIATE')
+            columns = [row[1] for row in self._conn.execute('PRAGMA table_info(events)')]
+            if 'version' not in columns:
+                self._conn.execute('ALTER TABLE events ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+                self._conn.execute('UPDATE events SET version = id')
+            self._conn.execute('COMMIT')
+
+    @staticmethod
+    def _row_to_event(row):
+        event = {"id": row[0]}
+        event.update(json.loads(row[1]))
+        event["version"] = row[2]
+        return event
+
+    def _insert(self, event):
+        event_id = event.pop('id', None)
+        event.pop('version', None)
+        # Single writer at a time, so MAX(version) + 1 is never handed out twice
+        try:
+            cursor = self._conn.execute(
+                'INSERT INTO events (id, date, time, body, version) '
+                'VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM events))',
+                (event_id, event.get('date', ''), time_key(event.get('time', '')), json.dumps(event))
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Invalid or duplicate event id: {event_id!r}")
+        stored = {"id": cursor.lastrowid}
+        stored.update(event)
+        stored["version"] = self._conn.execute(
+            'SELECT version FROM events WHERE id = ?', (cursor.lastrowid,)
+        ).fetchone()[0]
+        return stored
+
+    def _refresh_index(self):
+        # data_version changes whenever another connection commits
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if self._index is not None and version != self._data_version:
+            # New events and updated series both carry a version above the index's
+            rows = self._conn.execute(
+                'SELECT id, body, version FROM events WHERE version > ? ORDER BY version', (self._index.max_version,)
+            ).fetchall()
+            for row in rows:
+                self._index.add(self._row_to_event(row))
+            # Explicit ids below max_id (imports) need a full rebuild
+            if len(self._index) != self._conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]:
+                self._index = None
+        if self._index is None:
+            self._index = EventIndex(self.events_unlocked())
+        self._data_version = version
+
+    def add_event(self, event, on_conflict=ALLOW):
+        event = self._prepare(dict(event))
+        with self._lock:
+            conflicts = []
+            if on_conflict == ALLOW:
+                stored = self._insert(event)
+            else:
+                # Check and insert in one write transaction, so no other process slips in between
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    self._refresh_index()
+                    conflicts = self._check_conflicts(event, on_conflict)
+                    stored = self._insert(event)
+                except BaseException:
+                    self._conn.execute('ROLLBACK')
+                    raise
+                self._conn.execute('COMMIT')
+            self._index_event(stored)
+        return self._with_conflicts(stored, conflicts)
+
+    def _update_event(self, event_id, apply):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT id, body, version FROM events WHERE id = ?', (event_id,)).fetchone()
+                if row is None:
+                    raise ValueError(f"No event {event_id}")
+                event = self._row_to_event(row)
+                apply(event)
+                body = {key: value for key, value in event.items() if key not in ('id', 'version')}
+                self._conn.execute(
+                    'UPDATE events SET date = ?, time = ?, body = ?, '
+                    'version = (SELECT MAX(version) + 1 FROM events) WHERE id = ?',
+                    (event.get('date', ''), time_key(event.get('time', '')), json.dumps(body), event_id)
+                )
+                event["version"] = self._conn.execute(
+                    'SELECT version FROM events WHERE id = ?', (event_id,)
+                ).fetchone()[0]
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            self._index_event(event)
+        return event
+
+    def get_event(self, event_id):
+        with self._lock:
+            row = self._conn.execute('SELECT id, body, version FROM events WHERE id = ?', (event_id,)).fetchone()
+        return self._row_to_event(row) if row else None
+
+    def events(self):
+        with self._lock:
+            return self.events_unlocked()
+
+    def events_unlocked(self):
+        rows = self._conn.execute('SELECT id, body, version FROM events ORDER BY id').fetchall()
+        return (self._row_to_event(row) for row in rows)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def version(self):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(MAX(version), 0) FROM events').fetchone()[0]
+
+    def changes(self, since=0, limit=None):
+        with self._lock:
+            # One read transaction: the version and the rows come from the same snapshot
+            self._conn.execute('BEGIN')
+            try:
+                current = self._conn.execute('SELECT COALESCE(MAX(version), 0) FROM events').fetchone()[0]
+                rows = self._conn.execute(
+                    'SELECT id, body, version FROM events WHERE version > ? ORDER BY version LIMIT ?',
+                    (since, limit + 1 if limit else -1)
+                ).fetchall()
+            finally:
+                self._conn.execute('COMMIT')
+        return self._changes_page(map(self._row_to_event, rows), since, limit, current)
+
+    def import_events(self, events):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for event in events:
+                    self._insert(dict(event))
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            self._index = None
+        return len(events)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+                # data_version is per connection, so the next one must catch up by version
+                self._data_version = None
+
+
+class ShardedCalendarStore:
+    """Per-user calendar stores under one directory
+
+    Shards are opened on first use; each one is an ordinary CalendarStore,
+    so its lock and index only cover that user's events. At most
+    ``max_open`` stay open: the least recently used one is closed when
+    another is opened, and reopens its connection if a caller still
+    holding it uses it again.
+    """
+
+    def __init__(self, directory, backend=DEFAULT_BACKEND, default_user=DEFAULT_USER, max_open=MAX_OPEN_SHARDS):
+        if backend not in ('json', 'sqlite'):
+            raise ValueError(f"Unknown calendar backend: {backend}")
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.directory = directory
+        self.backend = backend
+        self.default_user = default_user
+        self.max_open = max_open
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def shard_name(user_id):
+        """Readable, collision-free file stem for a user id"""
+        safe = re.sub(r'[^A-Za-z0-9_.-]', '_', user_id)[:48]
+        digest = hashlib.sha256(user_id.encode()).hexdigest()[:12]
+        return f"{safe}-{digest}"
+
+    def shard_path(self, user_id):
+        extension = 'json' if self.backend == 'json' else 'db'
+        return os.path.join(self.directory, f"{self.shard_name(user_id)}.{extension}")
+
+    def shard(self, user_id=None):
+        """The calendar store for one user, opened on first use"""
+        user_id = user_id or self.default_user
+        evicted = None
+        with self._lock:
+            store = self._shards.get(user_id)
+            if store is not None:
+                self._shards.move_to_end(user_id)
+                return store
+            path = self.shard_path(user_id)
+            store = JsonCalendarStore(path) if self.backend == 'json' else SQLiteCalendarStore(path)
+            self._shards[user_id] = store
+            if len(self._shards) > self.max_open:
+                _, evicted = self._shards.popitem(last=False)
+        if evicted is not None:
+            # Waits for the evicted store's lock, so in-flight calls finish first
+            evicted.close()
+        return store
+
+    def open_count(self):
+        with self._lock:
+            return len(self._shards)
+
+    def close(self):
+        with self._lock:
+            shards, self._shards = self._shards, OrderedDict()
+        for store in shards.values():
+            store.close()
+
+
+def default_path(backend=DEFAULT_BACKEND):
+    """Default calendar location in the user's home directory"""
+    extension = 'json' if backend == 'json' else 'db'
+    return os.path.join(os.path.expanduser("~"), f"taara_calendar.{extension}")
+
+
+def migrate_json(json_path, store):
+    """Import a legacy JSON calendar into an empty store"""
+    if not json_path or not os.path.exists(json_path) or store.count():
+        return 0
+    if isinstance(store, JsonCalendarStore) and os.path.abspath(store.path) == os.path.abspath(json_path):
+        return 0
+    return store.import_json(json_path)
+
+
+def migrate_store(path, store):
+    """Import the single calendar used before sharding into an empty store"""
+    if not path or not os.path.exists(path) or store.count():
+        return 0
+    if path.endswith('.json'):
+        return migrate_json(path, store)
+    if os.path.abspath(path) == os.path.abspath(store.path):
+        return 0
+    source = SQLiteCalendarStore(path)
+    try:
+        return store.import_events(list(source.events()))
+    finally:
+        source.close()
+
+
+def open_calendar_store(path=None, backend=None, legacy_json=None):
+    """Open the configured calendar backend, migrating a legacy JSON file"""
+    backend = backend or os.getenv('TAARA_CALENDAR_BACKEND', DEFAULT_BACKEND)
+    path = path or os.getenv('TAARA_CALENDAR_PATH') or default_path(backend)
+
+    if backend == 'json':
+        store = JsonCalendarStore(path)
+    elif backend == 'sqlite':
+        store = SQLiteCalendarStore(path)
+    else:
+        raise ValueError(f"Unknown calendar backend: {backend}")
+
+    if legacy_json:
+        migrate_json(legacy_json, store)
+    return store
+
+
+def open_calendar_shards(directory=None, backend=None, legacy_json=None, legacy_path=None):
+    """Open per-user calendars; the pre-sharding calendar goes to the default user
+
+    ``legacy_path`` is the single store used before sharding (by default
+    TAARA_CALENDAR_PATH or ~/taara_calendar.db); the older ``legacy_json``
+    file is only imported when that store did not exist.
+    """
+    backend = backend or os.getenv('TAARA_CALENDAR_BACKEND', DEFAULT_BACKEND)
+    directory = directory or os.getenv('TAARA_CALENDAR_DIR') or os.path.join(
+        os.path.expanduser("~"), "taara_calendars")
+    max_open = int(os.getenv('TAARA_CALENDAR_MAX_OPEN', MAX_OPEN_SHARDS))
+
+    shards = ShardedCalendarStore(directory, backend, max_open=max_open)
+    if legacy_path:
+        migrate_store(legacy_path, shards.shard())
+    if legacy_json:
+        migrate_json(legacy_json, shards.shard())
+    return shards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Taara calendar import/export")
+    parser.add_argument('command', choices=['export', 'import', 'migrate'])
+    parser.add_argument('json_file', nargs='?', default=default_path('json'))
+    parser.add_argument('--db', default=None, help="calendar database path")
+    parser.add_argument('--backend', default=None, help="sqlite or json")
+    parser.add_argument('--user', default=None, help="use this user's shard from TAARA_CALENDAR_DIR")
+    args = parser.parse_args(argv)
+
+    if args.user:
+        shards = open_calendar_shards(backend=args.backend)
+        store = shards.shard(args.user)
+    else:
+        store = open_calendar_store(args.db, args.backend)
+    try:
+        if args.command == 'export':
+            store.export_json(args.json_file)
+            print(f"Exported {store.count()} events to {args.json_file}")
+        elif args.command == 'import':
+            print(f"Imported {store.import_json(args.json_file)} events from {args.json_file}")
+        else:
+            print(f"Migrated {migrate_json(args.json_file, store)} events from {args.json_file}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
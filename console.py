@@ -0,0 +1,56 @@
+﻿"""
+Console output for Taara
+
+The CLI gets coloured banners through colorama; servers (the web app and
+the serverless handler) create their agent with ``server_mode=True``,
+which turns output off and keeps colorama from being imported at all.
+TAARA_SERVER_MODE=1 does the same for any other process.
+"""
+
+import os
+
+_colorama = None
+_server_mode = None
+
+
+def server_mode():
+    if _server_mode is not None:
+        return _server_mode
+    return os.getenv('TAARA_SERVER_MODE', '0') == '1'
+
+
+def set_server_mode(enabled):
+    """Turn output on or off for this process, overriding TAARA_SERVER_MODE"""
+    global _server_mode
+    _server_mode = enabled
+
+
+def _load_colorama():
+    global _colorama
+    if _colorama is None:
+        import colorama
+        colorama.init()
+        _colorama = colorama
+    return _colorama
+
+
+class _LazyColors:
+    """Stand-in for colorama.Fore / colorama.Style, imported on first use"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        if server_mode():
+            return ''
+        return getattr(getattr(_load_colorama(), self._name), attr)
+
+
+Fore = _LazyColors('Fore')
+Style = _LazyColors('Style')
+
+
+def say(message):
+    """Print a status line unless running in server mode"""
+    if not server_mode():
+        print(message)
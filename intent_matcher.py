@@ -0,0 +1,275 @@
+﻿"""
+Single-pass intent matcher for Taara
+
+Intents are described declaratively in INTENT_RULES (first match wins)
+and INTENT_CATEGORIES (coarse classification). The matcher compiles the
+keywords of both tables into one regex, scans a command with it once and
+resolves the action, category and parameters from the keywords found.
+New intents are added by extending the tables, not by editing if/elif
+chains.
+"""
+
+import re
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+from recurrence import WEEKDAY_NAMES, parse_recurrence
+
+TIME_PATTERN = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)?')
+# The lookahead lets the regex engine skip positions that can't start an amount
+DURATION_PATTERN = re.compile(r'(?=[\dah])\b(\d+|an?|half an?)[\s-]*(hours?|hrs?|h|minutes?|mins?)\b')
+# Words without which a command has no recurrence to parse
+RECURRENCE_WORDS = ('every', 'daily', 'weekly')
+# Commands whose scan outcome IntentMatcher keeps; the cache starts over when full
+MATCH_CACHE_SIZE = 4096
+# Flags of the rules that take a date: "tomorrow" or a weekday name
+DATE_FLAGS = ('tomorrow',) + WEEKDAY_NAMES
+
+
+class IntentRule(namedtuple('IntentRule', 'action intent_type keywords prefixes extract dangerous flags')):
+    """One row of the intent table
+
+    A rule matches when the command contains any of ``keywords`` and, if
+    ``prefixes`` is set, also starts with one of them. ``extract(text, hits)``
+    builds the action parameters; ``flags`` are extra keywords the
+    extractor wants to look up in ``hits``.
+    """
+
+    def __new__(cls, action, intent_type, keywords, prefixes=(), extract=None, dangerous=False, flags=()):
+        return super().__new__(cls, action, intent_type, tuple(keywords), tuple(prefixes),
+                               extract, dangerous, tuple(flags))
+
+
+IntentMatch = namedtuple('IntentMatch', 'action intent_type category params dangerous')
+
+
+def _weekday(text, hits):
+    """First weekday named in the command (flagged and still in ``text``), or None"""
+    named = [(text.find(name), name) for name in hits if name in WEEKDAY_NAMES]
+    named = [item for item in named if item[0] >= 0]
+    return min(named)[1] if named else None
+
+
+def _day(text, hits):
+    """Date for "tomorrow" or a weekday name (the next one, today included); else today"""
+    # date.today() is several times slower than this on CPython
+    day = date.fromtimestamp(time.time())
+    if 'tomorrow' in hits:
+        day += timedelta(1)
+    elif hits:
+        weekday = _weekday(text, hits)
+        if weekday:
+            day += timedelta((WEEKDAY_NAMES.index(weekday) - day.weekday()) % 7)
+    return day.isoformat()
+
+
+def extract_scope_all(text, hits):
+    return {"scope": "all"}
+
+
+def extract_day(text, hits):
+    return {"date": _day(text, hits)}
+
+
+def parse_duration(text):
+    """Minutes in "for 45 minutes", "1 hour", "half an hour", ...; None if absent"""
+    match = DURATION_PATTERN.search(text)
+    if not match:
+        return None, text
+    amount, unit = match.groups()
+    if amount.startswith('half'):
+        minutes = 30 if unit.startswith('h') else None
+    else:
+        count = 1 if amount in ('a', 'an') else int(amount)
+        minutes = count * 60 if unit.startswith('h') else count
+    if not minutes:
+        return None, text
+    # The rest of the command, so "a 30 minute meeting at 3pm" doesn't read 30 as the hour
+    return minutes, text[:match.start()] + text[match.end():]
+
+
+def extract_meeting(text, hits):
+    params = {"title": "Meeting"}
+    duration, text = parse_duration(text)
+    if duration:
+        params['duration'] = duration
+    # "every weekday at 10am": one recurring event, not one per day
+    if any(word in hits for word in RECURRENCE_WORDS):
+        recurrence, text = parse_recurrence(text)
+        if recurrence:
+            params['recurrence'] = recurrence
+    # Weekday names left after the recurrence are a date: "a meeting on friday"
+    if 'tomorrow' in hits or _weekday(text, hits):
+        params['date'] = _day(text, hits)
+
+    time_match = TIME_PATTERN.search(text)
+    if time_match:
+        hour = int(time_match.group(1))
+        minute = time_match.group(2) if time_match.group(2) else "00"
+        meridiem = time_match.group(3)
+
+        if meridiem == 'pm' and hour < 12:
+            hour += 12
+        elif meridiem == 'am' and hour == 12:
+            hour = 0
+
+        params['time'] = f"{hour}:{minute}"
+    return params
+
+
+def extract_free_slot(text, hits):
+    params = {"date": _day(text, hits)}
+    duration, _ = parse_duration(text)
+    if duration:
+        params['duration'] = duration
+    return params
+
+
+def extract_reminder(text, hits):
+    return {"text": text.replace("remind", "").replace("me", "").replace("to", "").strip()}
+
+
+def extract_task(text, hits):
+    return {"text": text.replace("task", "").replace("todo", "").replace("add", "").strip()}
+
+
+INTENT_RULES = (
+    IntentRule('delete_all', 'dangerous', ['delete everything', 'clear all'],
+               extract=extract_scope_all, dangerous=True),
+    # Free-time query, e.g. "Find a free slot of 45 minutes tomorrow"
+    IntentRule('free_slot', 'query', ['free slot', 'free time', 'when am i free', 'find a slot', 'find time'],
+               extract=extract_free_slot, flags=DATE_FLAGS),
+    # Calendar query, e.g. "What meetings do I have tomorrow?"
+    IntentRule('list', 'query', ['meeting', 'schedule', 'calendar'],
+               prefixes=['what', 'which', 'show', 'list'], extract=extract_day, flags=DATE_FLAGS),
+    IntentRule('schedule', 'schedule', ['schedule', 'meeting'], extract=extract_meeting,
+               flags=DATE_FLAGS + RECURRENCE_WORDS),
+    IntentRule('remind', 'remind', ['remind'], extract=extract_reminder),
+    IntentRule('task', 'task', ['task', 'todo'], extract=extract_task),
+)
+
+INTENT_CATEGORIES = (
+    ('schedule', ['schedule', 'meeting', 'appointment']),
+    ('remind', ['remind']),
+    ('task', ['task', 'todo']),
+    ('dangerous', ['delete', 'remove', 'clear']),
+)
+
+UNKNOWN = 'unknown'
+DEFAULT_CATEGORY = 'query'
+
+
+def keyword_pattern(words):
+    """One regex matching any of ``words``, factored into a trie
+
+    Shared prefixes are tested once ("f(?:ind ...|ree ...)"), and a word
+    that extends another is tried first, so "clear all" wins over "clear".
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return re.compile(build(trie))
+
+
+class IntentMatcher:
+    """Compiled form of an intent table
+
+    Every keyword of the tables goes into one precompiled alternation
+    regex. A command is scanned once, left to right, and each keyword found
+    adds the rules it can satisfy and its category to one bitmask (bit N =
+    rule N, then one bit per category); the scan stops as soon as the best
+    rule and category can no longer change. Flags are looked up afterwards
+    with a regex of their own, for the chosen rule only.
+
+    Commands repeat a lot, so the outcome of a scan (rule, category and
+    flags, never parameters: those depend on the date) is kept per command,
+    up to MATCH_CACHE_SIZE of them.
+    """
+
+    def __init__(self, rules=INTENT_RULES, categories=INTENT_CATEGORIES):
+        self.rules = tuple(rules)
+        self.categories = tuple((name, tuple(words)) for name, words in categories)
+        self._category_names = tuple(name for name, _ in self.categories) + (DEFAULT_CATEGORY,)
+
+        keywords = [word for rule in self.rules for word in rule.keywords]
+        keywords += [word for _, words in self.categories for word in words]
+        self.keywords = tuple(dict.fromkeys(keywords))
+        self._pattern = keyword_pattern(self.keywords)
+
+        # A match stands for every keyword it starts with ("clear all" is also "clear")
+        self._table = {}
+        for match in self.keywords:
+            implied = {word for word in self.keywords if match.startswith(word)}
+            rules = sum(1 << index for index, rule in enumerate(self.rules) if implied & set(rule.keywords))
+            categories = sum(1 << index for index, (_, words) in enumerate(self.categories) if implied & set(words))
+            self._table[match] = rules | categories << len(self.rules)
+
+        self._flag_patterns = tuple(keyword_pattern(rule.flags) if rule.flags else None for rule in self.rules)
+        self._unprefixed = sum(1 << index for index, rule in enumerate(self.rules) if not rule.prefixes)
+        self._prefixed = tuple((1 << index, rule.prefixes) for index, rule in enumerate(self.rules) if rule.prefixes)
+        self._scanned = {}
+
+    def _match(self, text):
+        """(rule index or -1, category, flags found) of a lowercased command"""
+        scanned = self._scanned.get(text)
+        if scanned is None:
+            if len(self._scanned) >= MATCH_CACHE_SIZE:
+                self._scanned.clear()
+            scanned = self._scanned[text] = self._scan(text)
+        return scanned
+
+    def _scan(self, text):
+        """Uncached _match: one pass of the keyword regex, then the rule's flags"""
+        allowed = self._unprefixed
+        for bit, prefixes in self._prefixed:
+            if text.startswith(prefixes):
+                allowed |= bit
+        # Lowest allowed rule and first category: once both are found, nothing can beat them
+        decisive = (allowed & -allowed) | 1 << len(self.rules)
+        found = 0
+        table = self._table
+        for word in self._pattern.findall(text):
+            found |= table[word]
+            if found & decisive == decisive:
+                break
+        rules = found & allowed
+        categories = found >> len(self.rules) | 1 << len(self.categories)
+        index = (rules & -rules).bit_length() - 1
+        flag_pattern = self._flag_patterns[index] if index >= 0 else None
+        hits = tuple(flag_pattern.findall(text)) if flag_pattern else ()
+        return index, self._category_names[(categories & -categories).bit_length() - 1], hits
+
+    def classify(self, text):
+        """Coarse intent category of a lowercased command"""
+        return self._match(text)[1]
+
+    def match(self, text):
+        """Resolve the action, category and parameters of a lowercased command"""
+        index, category, hits = self._match(text)
+        if index < 0:
+            return IntentMatch(UNKNOWN, UNKNOWN, category, {}, False)
+
+        rule = self.rules[index]
+        params = rule.extract(text, hits) if rule.extract else {}
+        return IntentMatch(rule.action, rule.intent_type, category, params, rule.dangerous)
+
+
+def intent_payload(match, text):
+    """Intent fields sent to ARMORIQ for a matched (lowercased) command"""
+    return {
+        'raw_input': text,
+        'type': match.intent_type,
+        'parameters': {} if match.dangerous else match.params
+    }
@@ -0,0 +1,190 @@
+﻿"""
+Lightweight metrics for the Taara pipeline
+
+``span('verify')`` times one pipeline stage. Every span feeds a
+per-stage latency histogram and, while a request is being timed
+(``start_request``), that request's Server-Timing header. Counters cover
+verification modes, policy decisions and actions. ``REGISTRY.render()``
+produces the Prometheus text exposition format for ``/metrics``.
+
+Recording is a couple of perf_counter calls plus one short lock, so spans
+stay on in production.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_request_timings = contextvars.ContextVar('taara_request_timings', default=None)
+_timings_lock = threading.Lock()
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{' + inner + '}'
+
+
+class Registry:
+    """Counters and histograms keyed by (name, labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._stage_keys = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=STAGE_BUCKETS, **labels):
+        self._observe((name, tuple(sorted(labels.items()))), value, buckets)
+
+    def observe_stage(self, stage, value):
+        """observe('taara_stage_seconds', value, stage=stage) without building the key each time"""
+        key = self._stage_keys.get(stage)
+        if key is None:
+            key = self._stage_keys[stage] = ('taara_stage_seconds', (('stage', stage),))
+        self._observe(key, value, STAGE_BUCKETS)
+
+    def _observe(self, key, value, buckets):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0]
+            histogram[1][bisect.bisect_left(histogram[0], value)] += 1
+            histogram[2] += value
+
+    def add_collector(self, collect):
+        """Register a callable returning [(name, kind, labels dict, value)] at scrape time"""
+        self._collectors.append(collect)
+
+    def counter(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (h[0], list(h[1]), h[2])) for key, h in self._histograms.items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                kind, text = self._help.get(name, (kind, name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        for (name, labels), (buckets, counts, total) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+        for collect in self._collectors:
+            for name, kind, labels, value in collect():
+                header(name, kind)
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REGISTRY.describe('taara_stage_seconds', 'histogram', 'Time spent in each pipeline stage')
+REGISTRY.describe('taara_request_seconds', 'histogram', 'HTTP request latency by route')
+REGISTRY.describe('taara_verifications_total', 'counter', 'ARMORIQ verifications by mode')
+REGISTRY.describe('taara_policy_decisions_total', 'counter', 'Policy decisions by outcome')
+REGISTRY.describe('taara_actions_total', 'counter', 'Executed actions by action and status')
+REGISTRY.describe('taara_coalesced_requests_total', 'counter', 'Duplicate commands that shared an in-flight result')
+REGISTRY.describe('taara_idempotent_replays_total', 'counter', 'Responses replayed for a repeated Idempotency-Key')
+
+
+class span:
+    """Time one pipeline stage: ``with span('verify'): ...``
+
+    A plain class rather than @contextmanager: spans wrap every stage of
+    every command, and a generator per span costs more than the stage
+    being timed.
+    """
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        REGISTRY.observe_stage(self.stage, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            # Batch commands of one request add to its timings from several threads
+            with _timings_lock:
+                timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+
+
+def start_request():
+    """Start collecting stage timings for the current request (and its threads)"""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value, durations in milliseconds"""
+    parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+
+def verification_mode(verification):
+    """remote, cache, fallback, circuit_open or rejected"""
+    if verification.get('cache') == 'hit':
+        return 'cache'
+    if verification.get('mode') == 'fallback':
+        return 'circuit_open' if verification.get('circuit') == 'open' else 'fallback'
+    return 'remote' if verification.get('verified') else 'rejected'
+
+
+def record_verification(verification):
+    if verification:
+        REGISTRY.inc('taara_verifications_total', mode=verification_mode(verification))
+
+
+def record_policy(allowed):
+    REGISTRY.inc('taara_policy_decisions_total', outcome='allowed' if allowed else 'blocked')
+
+
+def record_action(action, status):
+    REGISTRY.inc('taara_actions_total', action=action, status=status or 'unknown')
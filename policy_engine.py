@@ -0,0 +1,199 @@
+﻿"""
+Compiled policy engine for Taara
+
+policies.yaml is compiled once into lookup tables: a frozenset of blocked
+operations, a 24-bit mask of allowed hours and a precomputed decision per
+(action, hour). Evaluating a request is a dict lookup plus a tuple index,
+no matter how many policies are loaded. PolicyStore watches the file's
+mtime and swaps a freshly compiled set in when it changes.
+
+``python policy_engine.py compile`` writes policies.json next to the YAML
+file: the parsed policies plus the SHA-256 of the YAML they came from.
+While the hash matches, policies load from the snapshot with the json
+module and yaml is never imported; an edited YAML file is simply parsed
+again.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+HOURS_PER_DAY = 24
+ALL_HOURS = (1 << HOURS_PER_DAY) - 1
+ALLOWED = (True, "Allowed")
+
+DEFAULT_POLICIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'policies.yaml')
+
+
+def hour_mask(hours):
+    """Bit mask with bit N set for every allowed hour N"""
+    mask = 0
+    for hour in hours or []:
+        if isinstance(hour, int) and 0 <= hour < HOURS_PER_DAY:
+            mask |= 1 << hour
+    return mask
+
+
+class CompiledPolicies:
+    """Immutable decision tables built from a list of policy dicts"""
+
+    def __init__(self, policies):
+        self.policies = list(policies or [])
+        self.hour_mask = ALL_HOURS
+
+        first_op_block = {}
+        first_time_block = [None] * HOURS_PER_DAY
+        for index, policy in enumerate(self.policies):
+            if policy.get('type') == 'time_restriction':
+                mask = hour_mask(policy.get('allowed_hours', []))
+                self.hour_mask &= mask
+                for hour in range(HOURS_PER_DAY):
+                    if not mask >> hour & 1 and first_time_block[hour] is None:
+                        first_time_block[hour] = index
+
+            if policy.get('type') == 'operation_restriction':
+                for op in policy.get('blocked_ops', []):
+                    first_op_block.setdefault(op, index)
+
+        self.blocked_ops = frozenset(first_op_block)
+
+        # Per-action dispatch: every blocked operation gets its own table,
+        # everything else shares the table for unrestricted operations
+        self._default = self._table(None, None, first_time_block)
+        self._tables = {
+            op: self._table(op, index, first_time_block)
+            for op, index in first_op_block.items()
+        }
+
+    @staticmethod
+    def _table(action, op_index, first_time_block):
+        # The earliest failing policy in file order provides the reason
+        table = []
+        for hour, time_index in enumerate(first_time_block):
+            if time_index is not None and (op_index is None or time_index < op_index):
+                table.append((False, f"Not allowed at {hour}:00"))
+            elif op_index is not None:
+                table.append((False, f"Operation '{action}' is blocked"))
+            else:
+                table.append(ALLOWED)
+        return tuple(table)
+
+    def check(self, action, hour):
+        """Return (allowed, reason) for an action at an hour of the day"""
+        return self._tables.get(action, self._default)[hour]
+
+    def allows_hour(self, hour):
+        return bool(self.hour_mask >> hour & 1)
+
+
+def snapshot_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def read_policies(path):
+    """Policy list from a YAML file, via its snapshot when that is current"""
+    with open(path, 'rb') as f:
+        source = f.read()
+    digest = hashlib.sha256(source).hexdigest()
+
+    try:
+        with open(snapshot_path(path), 'r') as f:
+            snapshot = json.load(f)
+        if snapshot.get('sha256') == digest:
+            return snapshot['policies']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    import yaml
+    return yaml.safe_load(source.decode('utf-8-sig'))
+
+
+def compile_snapshot(path):
+    """Write the JSON snapshot for a policies YAML file"""
+    import yaml
+
+    with open(path, 'rb') as f:
+        source = f.read()
+    snapshot = {
+        'source': os.path.basename(path),
+        'sha256': hashlib.sha256(source).hexdigest(),
+        'policies': yaml.safe_load(source.decode('utf-8-sig')) or []
+    }
+    target = snapshot_path(path)
+    with open(target + '.tmp', 'w') as f:
+        json.dump(snapshot, f, indent=2)
+        f.write('\n')
+    os.replace(target + '.tmp', target)
+    return target
+
+
+def load_policy_file(path):
+    """Parse and compile a policies.yaml file"""
+    return CompiledPolicies(read_policies(path))
+
+
+class PolicyStore:
+    """Current compiled policies, reloaded when the file changes on disk"""
+
+    def __init__(self, path=None, check_interval=1.0):
+        self.path = path or os.getenv('TAARA_POLICIES', DEFAULT_POLICIES_FILE)
+        self.check_interval = check_interval
+        self.compiled = CompiledPolicies([])
+        self.error = None
+        self._stamp = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def reload(self):
+        """Recompile the policy file, keeping the old set on failure"""
+        stamp = self._file_stamp()
+        try:
+            compiled = load_policy_file(self.path)
+        except Exception as e:
+            self.error = e
+            self._stamp = stamp
+            return False
+
+        # A single reference assignment, so readers see the old or the new set
+        self.compiled = compiled
+        self.error = None
+        self._stamp = stamp
+        return True
+
+    def current(self):
+        """Return the compiled policies, picking up changes to the file"""
+        now = time.monotonic()
+        if now >= self._next_check and self._reload_lock.acquire(blocking=False):
+            # One thread checks the file; the others keep the current set
+            try:
+                self._next_check = now + self.check_interval
+                if self._file_stamp() != self._stamp:
+                    self.reload()
+            finally:
+                self._reload_lock.release()
+        return self.compiled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Taara policy tools")
+    parser.add_argument('command', choices=['compile'])
+    parser.add_argument('path', nargs='?', default=os.getenv('TAARA_POLICIES', DEFAULT_POLICIES_FILE))
+    args = parser.parse_args(argv)
+
+    target = compile_snapshot(args.path)
+    print(f"Wrote {target} ({len(load_policy_file(args.path).policies)} policies)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+﻿"""
+Recurring events for Taara
+
+A recurring event is stored once, as an ordinary event whose ``date`` is
+the first day of the series and which carries a ``recurrence`` rule:
+
+    {"freq": "weekly", "interval": 1, "weekdays": [0, 1, 2, 3, 4], "until": "2026-12-31"}
+
+``freq`` is daily or weekly, ``weekdays`` (0 = Monday) only applies to
+weekly rules and defaults to the weekday of ``date``, ``until`` is
+optional. Single occurrences are cancelled by listing their date in
+``exdates`` and changed (time, duration, title) through ``overrides``.
+
+Occurrences are never stored: ``occurrences()`` generates them lazily,
+in date order, for just the range a caller asks for.
+"""
+
+import re
+from datetime import date as Date, timedelta
+
+FREQUENCIES = ('daily', 'weekly')
+WEEKDAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+OVERRIDE_FIELDS = ('time', 'duration', 'title')
+
+# Open-ended series without an end date in the query are expanded this far
+HORIZON_DAYS = 366
+
+_DAY = r'(?:mon|tues|wednes|thurs|fri|satur|sun)days?'
+_DAY_PATTERN = re.compile(_DAY)
+RECURRENCE_PATTERN = re.compile(
+    r'\b(?:every\s+(other\s+)?((?:weekday|weekend|day|week)s?|' + _DAY + r'(?:(?:\s*,\s*|\s+and\s+)' + _DAY + r')*)'
+    r'|(daily|weekly))\b'
+)
+UNTIL_PATTERN = re.compile(r'\buntil\s+(\d{4}-\d{2}-\d{2})\b')
+
+
+def is_recurring(event):
+    return isinstance(event.get('recurrence'), dict)
+
+
+def normalize_rule(rule):
+    """Validated copy of a recurrence rule; raises ValueError"""
+    if not isinstance(rule, dict) or rule.get('freq') not in FREQUENCIES:
+        raise ValueError(f"Recurrence needs a freq of {' or '.join(FREQUENCIES)}")
+    normalized = {"freq": rule['freq'], "interval": rule.get('interval', 1)}
+    if not isinstance(normalized['interval'], int) or normalized['interval'] < 1:
+        raise ValueError(f"Invalid recurrence interval: {rule.get('interval')!r}")
+    if rule.get('weekdays') is not None:
+        weekdays = sorted(set(rule['weekdays']))
+        if not weekdays or not all(isinstance(day, int) and 0 <= day < 7 for day in weekdays):
+            raise ValueError(f"Invalid recurrence weekdays: {rule['weekdays']!r}")
+        normalized['weekdays'] = weekdays
+    if rule.get('until') is not None:
+        normalized['until'] = Date.fromisoformat(rule['until']).isoformat()
+    return normalized
+
+
+def parse_recurrence(text):
+    """Rule for "every weekday", "every other monday and friday", "daily", ...
+
+    Returns (rule or None, the text without the recurrence words).
+    """
+    match = RECURRENCE_PATTERN.search(text)
+    if not match:
+        return None, text
+    other, unit, adverb = match.groups()
+    unit = (unit or adverb).rstrip('s')
+    if unit in ('day', 'daily'):
+        rule = {"freq": "daily"}
+    elif unit in ('week', 'weekly'):
+        rule = {"freq": "weekly"}
+    elif unit == 'weekday':
+        rule = {"freq": "weekly", "weekdays": [0, 1, 2, 3, 4]}
+    elif unit == 'weekend':
+        rule = {"freq": "weekly", "weekdays": [5, 6]}
+    else:
+        names = _DAY_PATTERN.findall(unit)
+        rule = {"freq": "weekly", "weekdays": sorted({WEEKDAY_NAMES.index(name.rstrip('s')) for name in names})}
+    if other:
+        rule['interval'] = 2
+    text = text[:match.start()] + text[match.end():]
+
+    until = UNTIL_PATTERN.search(text)
+    if until:
+        rule['until'] = until.group(1)
+        text = text[:until.start()] + text[until.end():]
+    return rule, text
+
+
+def describe_rule(rule):
+    """'every weekday', 'every other monday, friday', 'daily until 2026-12-31', ..."""
+    every = 'every other' if rule.get('interval', 1) == 2 else 'every'
+    if rule.get('interval', 1) > 2:
+        every = f"every {rule['interval']}"
+    weekdays = rule.get('weekdays')
+    if rule['freq'] == 'daily':
+        text = 'daily' if every == 'every' else f"{every} {'days' if rule['interval'] > 2 else 'day'}"
+    elif weekdays == [0, 1, 2, 3, 4]:
+        text = f"{every} weekday"
+    elif weekdays == [5, 6]:
+        text = f"{every} weekend"
+    elif weekdays:
+        text = f"{every} " + ", ".join(WEEKDAY_NAMES[day] for day in weekdays)
+    else:
+        text = 'weekly' if every == 'every' else f"{every} {'weeks' if rule['interval'] > 2 else 'week'}"
+    if rule.get('until'):
+        text += f" until {rule['until']}"
+    return text
+
+
+def _matches(rule, start, day):
+    """Whether ``day`` is on the rule's pattern, ignoring bounds and exceptions"""
+    interval = rule.get('interval', 1)
+    if rule['freq'] == 'daily':
+        return (day - start).days % interval == 0
+    if day.weekday() not in rule.get('weekdays', (start.weekday(),)):
+        return False
+    # Weeks are counted from the Monday of the first week
+    week = (day - (start - timedelta(days=start.weekday()))).days // 7
+    return week % interval == 0
+
+
+def _occurrence(event, day, overrides):
+    occurrence = {key: value for key, value in event.items() if key not in ('exdates', 'overrides')}
+    occurrence['date'] = day
+    occurrence.update(overrides.get(day, {}))
+    return occurrence
+
+
+def occurrences(event, date_from=None, date_to=None):
+    """Yield the occurrences of a recurring event between two dates (inclusive)
+
+    Each occurrence is a copy of the event with its own ``date`` and any
+    override applied; cancelled dates are skipped. Without ``date_to`` or
+    an ``until`` the series stops HORIZON_DAYS after the first day looked at.
+    """
+    rule = event['recurrence']
+    start = Date.fromisoformat(event['date'])
+    day = max(start, Date.fromisoformat(date_from)) if date_from else start
+    ends = [Date.fromisoformat(value) for value in (rule.get('until'), date_to) if value]
+    last = min(ends) if ends else day + timedelta(days=HORIZON_DAYS)
+
+    exdates = set(event.get('exdates', ()))
+    overrides = event.get('overrides', {})
+    step = 1
+    if rule['freq'] == 'daily':
+        # Jump straight to the first day on the rule's cadence
+        step = rule.get('interval', 1)
+        day += timedelta(days=-(day - start).days % step)
+    while day <= last:
+        if step > 1 or _matches(rule, start, day):
+            iso = day.isoformat()
+            if iso not in exdates:
+                yield _occurrence(event, iso, overrides)
+        day += timedelta(days=step)
+
+
+def occurrence_on(event, date):
+    """The event's occurrence on one date, or None"""
+    return next(occurrences(event, date, date), None)
+
+
+def first_occurrence(event):
+    return next(occurrences(event), None)
+
+
+def set_exception(event, date, changes=None):
+    """Cancel one occurrence (changes None) or override some of its fields, in place"""
+    day = Date.fromisoformat(date)
+    rule = event['recurrence']
+    start = Date.fromisoformat(event['date'])
+    if day < start or (rule.get('until') and date > rule['until']) or not _matches(rule, start, day):
+        raise ValueError(f"{date} is not an occurrence of event {event.get('id')}")
+
+    overrides = dict(event.get('overrides', {}))
+    if changes is None:
+        event['exdates'] = sorted(set(event.get('exdates', [])) | {date})
+        overrides.pop(date, None)
+    else:
+        unknown = set(changes) - set(OVERRIDE_FIELDS)
+        if unknown:
+            raise ValueError(f"Occurrences can only change {', '.join(OVERRIDE_FIELDS)}, not {', '.join(sorted(unknown))}")
+        overrides[date] = dict(overrides.get(date, {}), **changes)
+        event['exdates'] = [exdate for exdate in event.get('exdates', []) if exdate != date]
+    event['overrides'] = overrides
+    return event
@@ -4,11 +4,18 @@ Taara - AI Agent with ARMORIQ Security Integration
 """
 
 import os
-import yaml
 import json
-from datetime import datetime, timedelta
-import re
-from colorama import init, Fore, Style
+import asyncio
+from datetime import datetime
+import console
+from console import Fore, Style, say
+import metrics
+from metrics import span
+from calendar_store import (CONFLICT_MODES, DEFAULT_DURATION, WARN, ConflictError,
+                            default_path, describe_conflicts, open_calendar_shards, open_calendar_store)
+from policy_engine import PolicyStore
+from intent_matcher import IntentMatcher, intent_payload
+from recurrence import describe_rule, first_occurrence
 
 # Import ARMORIQ client
 try:
@@ -16,103 +23,211 @@ try:
     armoriq_available = True
 except ImportError:
     armoriq_available = False
-    print(f"{Fore.YELLOW}⚠ ARMORIQ integration not available{Style.RESET_ALL}")
 
-init()
+MAX_BATCH_SIZE = 1000
+BATCH_WORKERS = 8
+
+def parse_batch(body):
+    """Read batch commands from a JSON array or NDJSON body"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    body = body.strip()
+    
+    if body.startswith('['):
+        items = json.loads(body)
+    else:
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch too large: {len(items)} commands (max {MAX_BATCH_SIZE})")
+    
+    texts = []
+    for item in items:
+        text = item.get('text') if isinstance(item, dict) else item
+        if not isinstance(text, str):
+            raise ValueError(f"Invalid batch item: {item!r}")
+        texts.append(text)
+    return texts
 
 class SimpleTaara:
-    def __init__(self):
+    def __init__(self, calendar=None, server_mode=None):
+        # Servers pass server_mode=True: no banners or colours in their logs
+        if server_mode is not None:
+            console.set_server_mode(server_mode)
         self.name = "Taara"
+        self.matcher = IntentMatcher()
         self.load_policies()
+        # Legacy JSON calendar, kept as the import/export format
         self.calendar_file = os.path.join(os.path.expanduser("~"), "taara_calendar.json")
         
+        # One calendar per user unless a store is given or TAARA_CALENDAR_SHARDING=0;
+        # self.calendar is the default (CLI) user's calendar
+        self.calendars = None
+        if calendar is not None:
+            self.calendar = calendar
+        elif os.getenv('TAARA_CALENDAR_SHARDING', '1') == '0':
+            self.calendar = open_calendar_store(legacy_json=self.calendar_file)
+        else:
+            # The single calendar from before sharding becomes the default user's
+            legacy_path = os.getenv('TAARA_CALENDAR_PATH') or default_path()
+            self.calendars = open_calendar_shards(legacy_json=self.calendar_file, legacy_path=legacy_path)
+            self.calendar = self.calendars.shard()
+        
+        # What to do with a meeting that overlaps another: allow, warn or reject
+        self.conflict_mode = os.getenv('TAARA_CONFLICTS', WARN)
+        if self.conflict_mode not in CONFLICT_MODES:
+            raise ValueError(f"TAARA_CONFLICTS must be one of {', '.join(CONFLICT_MODES)}")
+        
         # Initialize ARMORIQ if available
         self.armoriq = None
+        self._armoriq_async = None
         if armoriq_available:
             try:
                 self.armoriq = ArmoriqClient()
-                print(f"{Fore.GREEN}✓ ARMORIQ security initialized{Style.RESET_ALL}")
+                say(f"{Fore.GREEN}✓ ARMORIQ security initialized{Style.RESET_ALL}")
             except Exception as e:
-                print(f"{Fore.YELLOW}⚠ ARMORIQ init failed: {e}{Style.RESET_ALL}")
+                say(f"{Fore.YELLOW}⚠ ARMORIQ init failed: {e}{Style.RESET_ALL}")
+        else:
+            say(f"{Fore.YELLOW}⚠ ARMORIQ integration not available{Style.RESET_ALL}")
+    
+    @property
+    def armoriq_async(self):
+        """asyncio front end for self.armoriq, imported and created on first use"""
+        if self._armoriq_async is None and self.armoriq:
+            from armoriq_integration.async_client import AsyncArmoriqClient
+            self._armoriq_async = AsyncArmoriqClient(self.armoriq)
+        return self._armoriq_async
+    
+    async def aclose(self):
+        if self._armoriq_async:
+            await self._armoriq_async.aclose()
     
     def load_policies(self):
-        """Load simple policies"""
-        try:
-            with open('policies.yaml', 'r') as f:
-                self.policies = yaml.safe_load(f)
-            print(f"{Fore.GREEN}✓ Policies loaded{Style.RESET_ALL}")
-        except Exception as e:
-            self.policies = []
-            print(f"{Fore.YELLOW}⚠ No policies file found: {e}{Style.RESET_ALL}")
+        """Load and compile policies, reloading them when the file changes"""
+        self.policy_store = PolicyStore()
+        if self.policy_store.error:
+            say(f"{Fore.YELLOW}⚠ No policies file found: {self.policy_store.error}{Style.RESET_ALL}")
+        else:
+            say(f"{Fore.GREEN}✓ Policies loaded{Style.RESET_ALL}")
+    
+    def calendar_for(self, user_id=None):
+        """Calendar store holding one user's events"""
+        if self.calendars is None:
+            return self.calendar
+        return self.calendars.shard(user_id)
+    
+    @property
+    def policies(self):
+        return self.policy_store.current().policies
     
     def check_policies(self, action, params):
-        """Simple policy check"""
-        current_hour = datetime.now().hour
-        
-        for policy in self.policies:
-            if policy.get('type') == 'time_restriction':
-                if current_hour not in policy.get('allowed_hours', []):
-                    return False, f"Not allowed at {current_hour}:00"
-            
-            if policy.get('type') == 'operation_restriction':
-                if action in policy.get('blocked_ops', []):
-                    return False, f"Operation '{action}' is blocked"
-        
-        return True, "Allowed"
+        """Policy check against the compiled policy set"""
+        return self.policy_store.current().check(action, datetime.now().hour)
     
-    def execute_action(self, action, params):
-        """Execute the action with ARMORIQ audit"""
+    def execute_action(self, action, params, intent=None):
+        """Execute the action with ARMORIQ audit (``intent`` is recorded with it)"""
         result = None
         
-        if action == "schedule":
-            result = self.schedule_meeting(params)
-        elif action == "remind":
-            result = self.set_reminder(params)
-        elif action == "task":
-            result = self.create_task(params)
-        else:
-            result = {"status": "error", "message": f"Unknown action: {action}"}
+        with span('execute'):
+            if action == "schedule":
+                result = self.schedule_meeting(params)
+            elif action == "remind":
+                result = self.set_reminder(params)
+            elif action == "task":
+                result = self.create_task(params)
+            elif action == "list":
+                result = self.list_meetings(params)
+            elif action == "free_slot":
+                result = self.find_free_slot(params)
+            else:
+                result = {"status": "error", "message": f"Unknown action: {action}"}
+        metrics.record_action(action, result.get('status'))
         
         # Log to ARMORIQ if available
         if self.armoriq and result.get('status') == 'success':
-            self.armoriq.create_audit_log(
-                action=action,
-                result=result,
-                user=params.get('user_id', 'anonymous')
-            )
+            with span('audit'):
+                self.armoriq.create_audit_log(
+                    action=action,
+                    result=result,
+                    user=params.get('user_id', 'anonymous'),
+                    intent=intent
+                )
         
         return result
     
     def schedule_meeting(self, params):
-        """Simple meeting scheduling"""
-        # Load or create calendar
-        calendar = {"events": []}
-        if os.path.exists(self.calendar_file):
-            try:
-                with open(self.calendar_file, 'r') as f:
-                    calendar = json.load(f)
-            except:
-                calendar = {"events": []}
-        
-        # Add new event
+        """Meeting scheduling, checked against overlapping events"""
         event = {
-            "id": len(calendar["events"]) + 1,
             "title": params.get('title', 'Meeting'),
             "time": params.get('time', '12:00'),
             "date": params.get('date', datetime.now().strftime('%Y-%m-%d')),
+            "duration": params.get('duration', DEFAULT_DURATION),
             "created": datetime.now().isoformat(),
             "verified": params.get('verified', False)
         }
-        calendar["events"].append(event)
+        if params.get('recurrence'):
+            event['recurrence'] = params['recurrence']
+        try:
+            event = self.calendar_for(params.get('user_id')).add_event(event, on_conflict=self.conflict_mode)
+        except ConflictError as e:
+            return {
+                "status": "conflict",
+                "message": f"Not scheduled: {e}",
+                "conflicts": e.conflicts,
+                "conflict_count": e.conflict_count
+            }
+        
+        if 'recurrence' in event:
+            first = first_occurrence(event)
+            message = (f"Scheduled: {event['title']} at {event['time']} {describe_rule(event['recurrence'])}, "
+                       f"starting {first['date'] if first else event['date']}")
+        else:
+            message = f"Scheduled: {event['title']} at {event['time']} on {event['date']}"
+        conflicts = event.pop('conflicts', None)
+        count = event.pop('conflict_count', None)
+        result = {"status": "success", "message": message, "event": event}
+        if conflicts:
+            result['message'] += f" (overlaps {describe_conflicts(conflicts, count, dated='recurrence' in event)})"
+            result['conflicts'] = conflicts
+            result['conflict_count'] = count
+        return result
+    
+    def find_free_slot(self, params):
+        """Next free slot of the requested length within the policy's allowed hours"""
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        date = params.get('date', today)
+        minutes = params.get('duration', DEFAULT_DURATION)
+        # Work hours are the allowed_hours of the time_restriction policies
+        slot = self.calendar_for(params.get('user_id')).free_slot(
+            minutes, date,
+            after=now.hour * 60 + now.minute if date == today else 0,
+            hour_mask=self.policy_store.current().hour_mask
+        )
+        
+        if slot is None:
+            return {"status": "success", "message": f"No free {minutes}-minute slot from {date}", "slot": None}
+        return {
+            "status": "success",
+            "message": f"Free for {minutes} minutes at {slot['time']} on {slot['date']}",
+            "slot": slot
+        }
+    
+    def list_meetings(self, params):
+        """List one day's meetings from the calendar index"""
+        date = params.get('date', datetime.now().strftime('%Y-%m-%d'))
+        events = self.calendar_for(params.get('user_id')).query(date, date)["events"]
         
-        # Save
-        with open(self.calendar_file, 'w') as f:
-            json.dump(calendar, f, indent=2)
+        if events:
+            meetings = ", ".join(f"{e['title']} at {e['time']}" for e in events)
+            message = f"{len(events)} meeting(s) on {date}: {meetings}"
+        else:
+            message = f"No meetings on {date}"
         
         return {
             "status": "success",
-            "message": f"Scheduled: {event['title']} at {event['time']} on {event['date']}",
-            "event": event
+            "message": message,
+            "events": events
         }
     
     def set_reminder(self, params):
@@ -129,101 +244,176 @@ class SimpleTaara:
             "message": f"Task created: {params.get('text', '')}"
         }
     
-    def parse_input(self, text, verify_with_armoriq=True):
-        """Parse input with optional ARMORIQ verification"""
+    def _build_intent(self, text):
+        """Match a command and build the intent data sent to ARMORIQ"""
         text = text.lower().strip()
+        match = self.matcher.match(text)
         
-        # Create intent data for ARMORIQ
-        intent_data = {
-            'raw_input': text,
-            'type': self._classify_intent(text),
-            'parameters': {},
-            'timestamp': datetime.now().isoformat()
-        }
+        intent_data = intent_payload(match, text)
+        intent_data['timestamp'] = datetime.now().isoformat()
+        return match, intent_data
+    
+    def _apply_verification(self, match, verification):
+        """Attach an ARMORIQ verification result to the parsed command"""
+        action, params = match.action, match.params
         
-        # Check for dangerous commands first
-        if "delete everything" in text or "clear all" in text:
-            intent_data['type'] = 'dangerous'
-            action = "delete_all"
-            params = {"scope": "all"}
-            
-            # Verify with ARMORIQ
-            if self.armoriq and verify_with_armoriq:
-                verification = self.armoriq.verify_intent(intent_data)
-                if verification.get('risk_score', 0) > 0.7:
-                    return action, params, verification
+        # Dangerous commands only report verification when it flags them
+        if match.dangerous:
+            if verification and verification.get('risk_score', 0) > 0.7:
+                return action, params, verification
             return action, params, None
         
-        # Schedule meeting
-        if "schedule" in text or "meeting" in text:
-            params = {"title": "Meeting"}
-            
-            if "tomorrow" in text:
-                tomorrow = datetime.now() + timedelta(days=1)
-                params['date'] = tomorrow.strftime('%Y-%m-%d')
-            
-            # Extract time
-            time_match = re.search(r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)?', text)
-            if time_match:
-                hour = int(time_match.group(1))
-                minute = time_match.group(2) if time_match.group(2) else "00"
-                meridiem = time_match.group(3)
-                
-                if meridiem == 'pm' and hour < 12:
-                    hour += 12
-                elif meridiem == 'am' and hour == 12:
-                    hour = 0
-                    
-                params['time'] = f"{hour}:{minute}"
-            
-            intent_data['type'] = 'schedule'
-            intent_data['parameters'] = params
-            
-            action = "schedule"
-        
-        # Reminder
-        elif "remind" in text:
-            msg = text.replace("remind", "").replace("me", "").replace("to", "").strip()
-            params = {"text": msg}
-            intent_data['type'] = 'remind'
-            intent_data['parameters'] = params
-            action = "remind"
+        if verification and verification.get('verified'):
+            params['verified'] = True
+            params['verification_id'] = verification.get('verification_id')
+        return action, params, verification
+    
+    def parse_input(self, text, verify_with_armoriq=True):
+        """Parse input with optional ARMORIQ verification"""
+        return self._parse(text, verify_with_armoriq)[1:]
+    
+    def _parse(self, text, verify_with_armoriq=True):
+        """(intent_data, action, params, verification); the intent is kept for the audit log"""
+        with span('parse'):
+            match, intent_data = self._build_intent(text)
         
-        # Task
-        elif "task" in text or "todo" in text:
-            task = text.replace("task", "").replace("todo", "").replace("add", "").strip()
-            params = {"text": task}
-            intent_data['type'] = 'task'
-            intent_data['parameters'] = params
-            action = "task"
+        # Verify with ARMORIQ
+        verification = None
+        if self.armoriq and verify_with_armoriq and match.action != "unknown":
+            with span('verify'):
+                verification = self.armoriq.verify_intent(intent_data)
+            metrics.record_verification(verification)
         
-        else:
-            intent_data['type'] = 'unknown'
-            action = "unknown"
-            params = {}
+        return (intent_data,) + self._apply_verification(match, verification)
+    
+    async def parse_input_async(self, text, verify_with_armoriq=True):
+        """parse_input for asyncio callers; verification does not block the loop"""
+        return (await self._parse_async(text, verify_with_armoriq))[1:]
+    
+    async def _parse_async(self, text, verify_with_armoriq=True):
+        with span('parse'):
+            match, intent_data = self._build_intent(text)
         
-        # Verify with ARMORIQ
         verification = None
-        if self.armoriq and verify_with_armoriq and action != "unknown":
-            verification = self.armoriq.verify_intent(intent_data)
-            if verification and verification.get('verified'):
-                params['verified'] = True
-                params['verification_id'] = verification.get('verification_id')
+        if self.armoriq_async and verify_with_armoriq and match.action != "unknown":
+            with span('verify'):
+                verification = await self.armoriq_async.verify_intent(intent_data)
+            metrics.record_verification(verification)
         
-        return action, params, verification
+        return (intent_data,) + self._apply_verification(match, verification)
     
     def _classify_intent(self, text):
         """Classify intent type"""
-        if any(word in text for word in ['schedule', 'meeting', 'appointment']):
-            return 'schedule'
-        elif 'remind' in text:
-            return 'remind'
-        elif any(word in text for word in ['task', 'todo']):
-            return 'task'
-        elif any(word in text for word in ['delete', 'remove', 'clear']):
-            return 'dangerous'
-        else:
-            return 'query'
+        return self.matcher.classify(text)
+    
+    def _policy_response(self, text, action, params, verification):
+        """Response skeleton and policy decision for a parsed command"""
+        response = {
+            'command': text,
+            'action': action,
+            'allowed': False,
+            'armoriq_verified': False
+        }
+        if verification:
+            response['armoriq_verified'] = verification.get('verified', False)
+            response['risk_score'] = verification.get('risk_score', 0)
+            response['verification_id'] = verification.get('verification_id', '')
+        
+        with span('policy'):
+            allowed, reason = self.check_policies(action, params)
+        metrics.record_policy(allowed)
+        if not allowed:
+            response['message'] = f"Blocked: {reason}"
+            response['reason'] = reason
+        return response, allowed, reason
+    
+    @staticmethod
+    def _executed_response(response, result):
+        response['allowed'] = True
+        response['message'] = result.get('message', 'Command executed')
+        response['result'] = result
+        return response
+    
+    def process(self, text, user_id='anonymous'):
+        """Run one command through parse, verify, policy check and execute"""
+        intent, action, params, verification = self._parse(text)
+        response, allowed, reason = self._policy_response(text, action, params, verification)
+        
+        if not allowed:
+            if self.armoriq:
+                with span('audit'):
+                    self.armoriq.create_audit_log(
+                        action=action,
+                        result={'reason': reason, 'blocked': True},
+                        user=user_id,
+                        intent=intent
+                    )
+            return response
+        
+        params['user_id'] = user_id
+        return self._executed_response(response, self.execute_action(action, params, intent))
+    
+    async def process_async(self, text, user_id='anonymous'):
+        """process() for asyncio callers; network, calendar and audit I/O stay off the loop"""
+        intent, action, params, verification = await self._parse_async(text)
+        response, allowed, reason = self._policy_response(text, action, params, verification)
+        
+        if not allowed:
+            if self.armoriq_async:
+                with span('audit'):
+                    await self.armoriq_async.create_audit_log(
+                        action=action,
+                        result={'reason': reason, 'blocked': True},
+                        user=user_id,
+                        intent=intent
+                    )
+            return response
+        
+        params['user_id'] = user_id
+        result = await asyncio.to_thread(self.execute_action, action, params, intent)
+        return self._executed_response(response, result)
+    
+    def process_batch(self, texts, user_id='anonymous', workers=BATCH_WORKERS):
+        """Process commands on a thread pool, yielding each result as it completes
+
+        At most ``workers * 2`` commands are queued or running at once, and
+        more are only submitted while the caller keeps reading. Closing the
+        generator (a client that went away) cancels the queued ones instead
+        of waiting for the whole batch.
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        import contextvars
+        commands = enumerate(texts)
+        pending = {}
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                for index, text in commands:
+                    # Pool threads don't inherit the caller's context; without a copy
+                    # the request's Server-Timing never sees the batch's stages
+                    context = contextvars.copy_context()
+                    pending[pool.submit(context.run, self.process, text, user_id)] = index
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {
+                            'command': texts[index],
+                            'allowed': False,
+                            'error': str(e),
+                            'message': f'Server error: {str(e)}'
+                        }
+                    result['index'] = index
+                    yield result
+        finally:
+            # Commands already running finish in the background; queued ones are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
     
     def run(self):
         """Main loop with ARMORIQ integration"""
@@ -243,6 +433,8 @@ class SimpleTaara:
         print("  ✅ Add task: Buy groceries")
         print("  ❌ Delete everything from my calendar")
         print("  📅 What meetings do I have tomorrow?")
+        print("  🕒 Find a free slot of 45 minutes tomorrow")
+        print("  🔁 Schedule a standup every weekday at 10am")
         print("\n  Type 'quit' to exit\n")
         
         while True:
@@ -258,7 +450,7 @@ class SimpleTaara:
                 
                 # Parse with ARMORIQ verification
                 print(f"{Fore.BLUE}📝 Parsing with ARMORIQ...{Style.RESET_ALL}")
-                action, params, verification = self.parse_input(user_input)
+                intent, action, params, verification = self._parse(user_input)
                 
                 # Show ARMORIQ verification result
                 if verification:
@@ -281,7 +473,8 @@ class SimpleTaara:
                         self.armoriq.create_audit_log(
                             action=action,
                             result={'reason': reason, 'blocked': True},
-                            user='anonymous'
+                            user='anonymous',
+                            intent=intent
                         )
                     continue
                 
@@ -289,7 +482,7 @@ class SimpleTaara:
                 
                 # Execute
                 print(f"{Fore.BLUE}⚡ Executing...{Style.RESET_ALL}")
-                result = self.execute_action(action, params)
+                result = self.execute_action(action, params, intent)
                 
                 if result['status'] == 'success':
                     print(f"{Fore.GREEN}✅ {result['message']}{Style.RESET_ALL}")
@@ -0,0 +1,230 @@
+﻿"""
+Request coalescing and idempotency keys
+
+A double-submitted form or a retrying client can send the same command
+again while the first copy is still running. ``SingleFlight`` (threads)
+and ``AsyncSingleFlight`` (asyncio) key work on ``(user, normalized
+command)``: duplicates that arrive while a call is in flight wait for it
+and share its result instead of verifying and executing again.
+
+``IdempotencyStore`` covers retries under the client's ``Idempotency-Key``:
+the first request reserves the key before running, a retry arriving while
+it runs waits for its response, and later ones get the stored response
+for ``TAARA_IDEMPOTENCY_TTL`` seconds, as long as the key is reused with
+the same command. Every caller gets its own copy of the response.
+
+asyncio is imported on first use, and concurrent.futures (which drags in
+logging) not at all, so the serverless handler doesn't pay for them at
+cold start.
+"""
+
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_command(text):
+    """Case- and whitespace-insensitive form of a command"""
+    return _SPACES.sub(' ', (text or '').strip().lower())
+
+
+def flight_key(user_id, text):
+    return (user_id, normalize_command(text))
+
+
+def enabled():
+    """TAARA_SINGLEFLIGHT=0 turns coalescing off"""
+    return os.getenv('TAARA_SINGLEFLIGHT', '1') != '0'
+
+
+class _Call:
+    """Result of one in-flight call, shared with the duplicates waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key across threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn):
+        """Run fn() unless a call for key is in flight; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            return call.wait(), True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class AsyncSingleFlight:
+    """Coalesce concurrent coroutines with the same key on one event loop
+
+    The shared call runs as its own task, so a caller that disconnects
+    doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.shared = 0
+
+    async def do(self, key, fn):
+        """Await fn() unless a call for key is in flight; returns (result, shared)"""
+        import asyncio
+
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here when every caller went away
+
+
+class IdempotencyConflict(ValueError):
+    """An idempotency key was reused with a different command"""
+
+
+class IdempotencyStore:
+    """Bounded TTL/LRU store of responses by (user, Idempotency-Key)
+
+    Entries hold a _Call: pending while the request that reserved the key
+    runs, done once it finished.
+    """
+
+    def __init__(self, ttl=60.0, max_size=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    @classmethod
+    def from_env(cls):
+        """Store configured by TAARA_IDEMPOTENCY_*; None when the TTL is 0"""
+        ttl = float(os.getenv('TAARA_IDEMPOTENCY_TTL', '60'))
+        if ttl <= 0:
+            return None
+        return cls(ttl=ttl, max_size=int(os.getenv('TAARA_IDEMPOTENCY_SIZE', '10000')))
+
+    def _lookup(self, user_id, key, text):
+        """Live call for this key or None; raises IdempotencyConflict. Hold the lock"""
+        entry = self._entries.get((user_id, key))
+        if entry is None:
+            return None
+        expires, command, call = entry
+        if expires <= self._clock():
+            del self._entries[(user_id, key)]
+            return None
+        if command != normalize_command(text):
+            raise IdempotencyConflict(f"Idempotency-Key {key!r} was used for a different command")
+        self._entries.move_to_end((user_id, key))
+        return call
+
+    def _store(self, user_id, key, expires, text, call):
+        self._entries[(user_id, key)] = (expires, normalize_command(text), call)
+        self._entries.move_to_end((user_id, key))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def begin(self, user_id, key, text):
+        """Reserve a key before running its command; returns (call, owner)
+
+        With owner True this caller holds the key and must settle the call
+        with finish() or abandon(). Otherwise the call belongs to an earlier
+        request for the same command, finished or still running: wait()
+        returns its response. Raises IdempotencyConflict for a different command.
+        """
+        with self._lock:
+            call = self._lookup(user_id, key, text)
+            if call is not None:
+                self.replays += 1
+                return call, False
+            call = _Call()
+            # Pending keys don't expire; the TTL starts when the call finishes
+            self._store(user_id, key, float('inf'), text, call)
+            return call, True
+
+    def finish(self, user_id, key, call, response):
+        """Keep a copy of the owner's response and release the requests waiting on it"""
+        call.result = copy.deepcopy(response)
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and entry[2] is call:
+                self._entries[(user_id, key)] = (self._clock() + self.ttl, entry[1], call)
+        call.done.set()
+
+    def abandon(self, user_id, key, call, error):
+        """Free the key after the owner failed; waiting requests get the error"""
+        if not isinstance(error, Exception):
+            error = RuntimeError(f"The request holding Idempotency-Key {key!r} was cancelled")
+        call.error = error
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and entry[2] is call:
+                del self._entries[(user_id, key)]
+        call.done.set()
+
+    @staticmethod
+    def wait(call):
+        """The response of a call from begin(), copied; blocks while it runs"""
+        return copy.deepcopy(call.wait())
+
+    def get(self, user_id, key, text):
+        """Copy of the stored response for this key, or None (also while it runs)
+
+        Raises IdempotencyConflict.
+        """
+        with self._lock:
+            call = self._lookup(user_id, key, text)
+            if call is None or not call.done.is_set() or call.error is not None:
+                return None
+            self.replays += 1
+        return copy.deepcopy(call.result)
+
+    def put(self, user_id, key, text, response):
+        call = _Call()
+        call.result = copy.deepcopy(response)
+        call.done.set()
+        with self._lock:
+            self._store(user_id, key, self._clock() + self.ttl, text, call)
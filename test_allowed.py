@@ -3,7 +3,7 @@
 def test_allowed():
     print("\n🧪 Testing ALLOWED action...")
     agent = SimpleTaara()
-    action, params = agent.parse_input("Schedule a meeting tomorrow at 2pm")
+    action, params, _ = agent.parse_input("Schedule a meeting tomorrow at 2pm")
     allowed, reason = agent.check_policies(action, params)
     
     if allowed:
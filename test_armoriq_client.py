@@ -0,0 +1,52 @@
+﻿import time
+from concurrent.futures import ThreadPoolExecutor
+
+from armoriq_integration.armoriq_client import ArmoriqClient
+from armoriq_integration.stub_server import StubArmoriqServer
+
+INTENT = {'raw_input': 'schedule a meeting at 2pm', 'type': 'schedule', 'parameters': {'time': '14:00'}}
+
+def make_client(stub, **kwargs):
+    client = ArmoriqClient(**kwargs)
+    client.api_endpoint = stub.url
+    return client
+
+def test_connection_reuse():
+    print("\n🧪 Testing pooled keep-alive connections...")
+    with StubArmoriqServer() as stub:
+        client = make_client(stub, pool_size=4)
+        start = time.perf_counter()
+        for _ in range(50):
+            result = client.verify_intent(INTENT)
+            assert result['verified'] and result['verification_id'].startswith('stub_')
+        elapsed = time.perf_counter() - start
+        print(f"   50 sequential verifications: {elapsed * 1000:.1f}ms over {stub.connections} connection(s)")
+        assert stub.requests == 50
+        assert stub.connections == 1
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: client.verify_intent(INTENT), range(40)))
+        assert stub.connections <= 4
+        client.close()
+
+def test_retries_with_backoff():
+    print("\n🧪 Testing retries on upstream failures...")
+    with StubArmoriqServer(fail_first=2) as stub:
+        client = make_client(stub, max_retries=2)
+        result = client.verify_intent(INTENT)
+        assert result['verification_id'].startswith('stub_')
+        assert stub.requests == 3
+
+def test_time_budget_falls_back():
+    print("\n🧪 Testing per-request time budget...")
+    with StubArmoriqServer(latency=1.0) as stub:
+        client = make_client(stub, read_timeout=0.2, time_budget=0.5, max_retries=5)
+        start = time.perf_counter()
+        result = client.verify_intent(INTENT)
+        assert result['mode'] == 'fallback'
+        assert time.perf_counter() - start < 0.9
+
+if __name__ == "__main__":
+    test_connection_reuse()
+    test_retries_with_backoff()
+    test_time_budget_falls_back()
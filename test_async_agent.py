@@ -0,0 +1,64 @@
+﻿import asyncio
+import os
+import tempfile
+import time
+
+from armoriq_integration.stub_server import StubArmoriqServer
+from calendar_store import SQLiteCalendarStore
+from simple_agent import SimpleTaara
+
+def make_agent(tmp, endpoint):
+    agent = SimpleTaara(calendar=SQLiteCalendarStore(os.path.join(tmp, "calendar.db")))
+    agent.armoriq.api_endpoint = endpoint
+    agent.check_policies = lambda action, params: (action != "delete_all", "blocked")
+    agent.armoriq.create_audit_log = lambda action, result, user='anonymous', intent=None: None
+    return agent
+
+def test_async_pipeline_does_not_block_loop():
+    print("\n🧪 Testing async agent pipeline...")
+    with tempfile.TemporaryDirectory() as tmp, StubArmoriqServer(latency=0.2) as stub:
+        agent = make_agent(tmp, stub.url)
+
+        async def run():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            tick_task = asyncio.create_task(ticker())
+            start = time.perf_counter()
+            results = await asyncio.gather(*[
+                agent.process_async(f"Schedule a meeting at {hour}am") for hour in range(1, 9)
+            ])
+            elapsed = time.perf_counter() - start
+            tick_task.cancel()
+            await agent.armoriq_async.aclose()
+            return results, elapsed, ticks
+
+        results, elapsed, ticks = asyncio.run(run())
+        print(f"   8 concurrent commands in {elapsed * 1000:.0f}ms, {ticks} loop ticks")
+        assert all(r['allowed'] and r['armoriq_verified'] for r in results)
+        assert all(r['verification_id'].startswith('stub_') for r in results)
+        assert elapsed < 8 * 0.2
+        assert ticks >= 10
+        assert agent.calendar.count() == 8
+
+def test_async_matches_sync():
+    print("\n🧪 Testing async and sync parsing agree...")
+    with tempfile.TemporaryDirectory() as tmp, StubArmoriqServer() as stub:
+        agent = make_agent(tmp, stub.url)
+        for text in ["Remind me to call John", "Delete everything", "hello", "Add task: review"]:
+            async_action, async_params, _ = asyncio.run(agent.parse_input_async(text))
+            action, params, _ = agent.parse_input(text)
+            assert async_action == action
+            # Verification ids include the request timestamp
+            async_params.pop('verification_id', None)
+            params.pop('verification_id', None)
+            assert async_params == params
+
+if __name__ == "__main__":
+    test_async_pipeline_does_not_block_loop()
+    test_async_matches_sync()
@@ -0,0 +1,114 @@
+﻿import json
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+
+from armoriq_integration.audit_index import AuditIndex
+from armoriq_integration.audit_log import SegmentedAuditLog
+from armoriq_integration.audit_writer import AuditWriter
+
+def make_writer(tmp, max_segment_bytes=64 * 1024 * 1024):
+    log = SegmentedAuditLog(os.path.join(tmp, "audit.log"), max_segment_bytes=max_segment_bytes)
+    return AuditWriter(log.path, batch_size=7, flush_interval=10, fsync='none', log=log, index=AuditIndex(log))
+
+def entry(n):
+    return {
+        'timestamp': f"2026-03-{n % 3 + 1:02d}T{n % 24:02d}:00:00",
+        'action': 'schedule' if n % 2 else 'delete_all',
+        'result': {'blocked': True, 'reason': 'no'} if n % 2 == 0 else {'status': 'success'},
+        'user': f"user{n % 4}",
+        'n': n
+    }
+
+def collect(items):
+    entries, cursor = [], None
+    for kind, value in items:
+        if kind == 'entry':
+            entries.append(value)
+        else:
+            cursor = value
+    return entries, cursor
+
+def test_filters_across_rotated_segments():
+    print("\n🧪 Testing audit index filters...")
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = make_writer(tmp, max_segment_bytes=3000)
+        for n in range(200):
+            writer.write(entry(n))
+        assert writer.flush(timeout=5)
+        index = writer.index
+        assert len(writer.log.segments()) > 3
+        assert index.count() == 200
+
+        entries, _ = collect(index.query(user='user1', limit=1000))
+        assert [e['n'] for e in entries] == [n for n in range(200) if n % 4 == 1]
+
+        entries, _ = collect(index.query(outcome='blocked', action='delete_all', limit=1000))
+        assert len(entries) == 100 and all(e['result']['blocked'] for e in entries)
+        assert collect(index.query(outcome='allowed', action='delete_all'))[0] == []
+
+        entries, _ = collect(index.query(since='2026-03-02', until='2026-03-03', limit=1000))
+        assert [e['n'] for e in entries] == [n for n in range(200) if n % 3 == 1]
+        entries, _ = collect(index.query(since='2026-03-02T10:00:01', until='2026-03-02T16:00:00', limit=1000))
+        assert {e['timestamp'] for e in entries} == {'2026-03-02T13:00:00'}
+
+        assert index.rebuild() == 200
+        assert collect(index.query(user='user1', limit=1000))[0][0]['n'] == 1
+        writer.close()
+
+def test_cursor_pagination():
+    print("\n🧪 Testing audit index pagination...")
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = make_writer(tmp)
+        for n in range(25):
+            writer.write(entry(n))
+        writer.flush(timeout=5)
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = collect(writer.index.query(outcome='allowed', cursor=cursor, limit=5))
+            seen += [e['n'] for e in page]
+            if not cursor:
+                break
+        assert seen == list(range(1, 25, 2))
+        writer.close()
+
+def test_audit_endpoint():
+    print("\n🧪 Testing GET /api/audit...")
+    import web_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        armoriq = web_app.agent.armoriq
+        previous = armoriq._audit_writer
+        armoriq._audit_writer = make_writer(tmp)
+        try:
+            for n in range(12):
+                armoriq.audit_writer.write(entry(n))
+            client = TestClient(web_app.app)
+
+            response = client.get("/api/audit", params={"user": "user2", "outcome": "blocked", "limit": 2})
+            assert response.status_code == 200
+            body = json.loads(response.text)
+            assert [e['n'] for e in body['entries']] == [2, 6]
+            assert body['next_cursor']
+
+            body = client.get("/api/audit", params={"user": "user2", "cursor": body['next_cursor']}).json()
+            assert [e['n'] for e in body['entries']] == [10] and body['next_cursor'] is None
+
+            # Entries are scoped to the caller
+            body = client.get("/api/audit", headers={"X-User-Id": "user1"}).json()
+            assert {e['user'] for e in body['entries']} == {'user1'}
+            assert client.get("/api/audit").json()['entries'] == []
+
+            assert client.get("/api/audit", params={"cursor": "nope"}).status_code == 400
+            assert client.get("/api/audit", params={"outcome": "maybe"}).status_code == 422
+        finally:
+            armoriq._audit_writer.close()
+            armoriq._audit_writer = previous
+
+if __name__ == "__main__":
+    test_filters_across_rotated_segments()
+    test_cursor_pagination()
+    test_audit_endpoint()
+    print("\n✅ Audit index tests passed")
@@ -0,0 +1,138 @@
+﻿import json
+import multiprocessing
+import os
+import tempfile
+
+from armoriq_integration.audit_log import SegmentedAuditLog, legacy_hash, verify_log
+
+def write_entries(path, count, tag, max_segment_bytes=2000):
+    log = SegmentedAuditLog(path, max_segment_bytes=max_segment_bytes)
+    for i in range(count):
+        log.write_batch([{'timestamp': f"2026-03-02T10:{i % 60:02d}:00", 'action': tag, 'n': i}], fsync='none')
+
+def test_chain_and_rotation():
+    print("\n🧪 Testing hash-chained audit segments...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        write_entries(path, 100, 'schedule')
+
+        log = SegmentedAuditLog(path)
+        segments = log.segments()
+        assert len(segments) > 2 and segments[0][1].endswith('.log.gz')
+        index = log.read_index(segments[1][0])
+        assert index['first_prev_hash'] == log.read_index(segments[0][0])['last_hash']
+
+        report = verify_log(path, workers=2)
+        assert report['ok'], report['errors']
+        assert report['entries'] == 100
+
+def test_tampering_detected():
+    print("\n🧪 Testing audit tamper detection...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        write_entries(path, 10, 'remind', max_segment_bytes=10**6)
+
+        with open(path) as f:
+            lines = f.readlines()
+        with open(path, 'w') as f:
+            f.writelines(lines[:4] + lines[5:])
+        report = verify_log(path, workers=1)
+        assert not report['ok'] and 'chain broken' in report['errors'][0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        write_entries(path, 60, 'task')
+        os.remove(SegmentedAuditLog(path).segments()[1][1])
+        report = verify_log(path, workers=2)
+        assert not report['ok'] and 'does not continue' in report['errors'][0]
+
+def rewrite(path, edit):
+    with open(path) as f:
+        entries = [json.loads(line) for line in f]
+    with open(path, 'w') as f:
+        f.writelines(json.dumps(entry) + '\n' for entry in edit(entries))
+
+def test_head_truncation_and_unchaining_detected():
+    print("\n🧪 Testing truncated heads and stripped links...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        write_entries(path, 5, 'remind', max_segment_bytes=10**6)
+        rewrite(path, lambda entries: entries[1:])
+        report = verify_log(path, workers=1)
+        assert not report['ok'] and 'genesis' in report['errors'][0]
+
+    def strip_links(entries):
+        for entry in entries[:2]:
+            del entry['prev_hash']
+            entry['action'], entry['user'] = 'delete_all', 'mallory'
+        return entries
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        write_entries(path, 5, 'remind', max_segment_bytes=10**6)
+        rewrite(path, strip_links)
+        assert not verify_log(path, workers=1)['ok']
+
+        # Even with recomputed legacy digests the third entry no longer links up
+        def forge(entries):
+            for entry in entries[:2]:
+                entry['hash'] = legacy_hash(entry)
+            return entries
+        rewrite(path, forge)
+        report = verify_log(path, workers=1)
+        assert not report['ok'] and 'chain broken' in report['errors'][0]
+
+def test_legacy_prefix_accepted():
+    print("\n🧪 Testing logs that start with pre-chain entries...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        with open(path, 'w') as f:
+            for n in range(3):
+                entry = {'timestamp': f"2026-03-01T09:0{n}:00", 'action': 'schedule', 'user': 'alice'}
+                entry['hash'] = legacy_hash(entry)
+                f.write(json.dumps(entry) + '\n')
+        write_entries(path, 4, 'task', max_segment_bytes=10**6)
+        report = verify_log(path, workers=1)
+        assert report['ok'] and report['entries'] == 7, report['errors']
+
+        rewrite(path, lambda entries: entries[:4] + [entries[1]] + entries[4:])
+        assert not verify_log(path, workers=1)['ok']
+
+def test_legacy_prefix_rotated():
+    print("\n🧪 Testing rotated segments that start with pre-chain entries...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        with open(path, 'w') as f:
+            for n in range(3):
+                entry = {'timestamp': f"2026-03-01T09:0{n}:00", 'action': 'schedule', 'user': 'alice'}
+                entry['hash'] = legacy_hash(entry)
+                f.write(json.dumps(entry) + '\n')
+        write_entries(path, 40, 'task')
+
+        log = SegmentedAuditLog(path)
+        assert len(log.segments()) > 1
+        report = verify_log(path, workers=1)
+        assert report['ok'] and report['entries'] == 43, report['errors']
+
+def test_concurrent_writers_share_one_chain():
+    print("\n🧪 Testing audit chain with several processes...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        workers = [multiprocessing.Process(target=write_entries, args=(path, 40, f"worker{n}"))
+                   for n in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        report = verify_log(path, workers=2)
+        assert report['ok'], report['errors']
+        assert report['entries'] == 120
+
+if __name__ == "__main__":
+    test_chain_and_rotation()
+    test_tampering_detected()
+    test_head_truncation_and_unchaining_detected()
+    test_legacy_prefix_accepted()
+    test_legacy_prefix_rotated()
+    test_concurrent_writers_share_one_chain()
@@ -0,0 +1,102 @@
+﻿import json
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from armoriq_integration.armoriq_client import ArmoriqClient
+from armoriq_integration.audit_writer import AuditWriter
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_group_commit():
+    print("\n🧪 Testing batched audit writes...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        writer = AuditWriter(path, batch_size=50, flush_interval=10, fsync='none')
+
+        threads = [threading.Thread(target=lambda n=n: [writer.write({'t': n, 'i': i}) for i in range(100)])
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert writer.flush(timeout=5)
+
+        assert len(read_lines(path)) == 400
+        assert writer.batches <= 9
+        writer.close()
+
+def test_time_flush_and_close():
+    print("\n🧪 Testing audit flush interval and shutdown...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        writer = AuditWriter(path, batch_size=1000, flush_interval=0.05, fsync='entry')
+        writer.write({'n': 1})
+        time.sleep(0.3)
+        assert len(read_lines(path)) == 1
+
+        writer.write({'n': 2})
+        writer.close()
+        assert len(read_lines(path)) == 2
+
+def test_backpressure():
+    print("\n🧪 Testing audit queue backpressure...")
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AuditWriter(os.path.join(tmp, "audit.log"), batch_size=1, max_queue=2)
+        disk = threading.Event()
+        commit = writer._commit
+        writer._commit = lambda lines: (disk.wait(), commit(lines))
+
+        writer.write({'n': 1})
+        time.sleep(0.05)  # the writer thread is now stuck on the slow disk
+        writer.write({'n': 2})
+        writer.write({'n': 3})
+        try:
+            writer.write({'n': 4}, timeout=0.05)
+            assert False, "queue grew past max_queue"
+        except queue.Full:
+            pass
+        # flush gives up instead of blocking on the full queue
+        started = time.monotonic()
+        assert writer.flush(timeout=0.1) is False
+        assert time.monotonic() - started < 2
+        disk.set()
+        writer.close()
+        assert writer.written == 3
+
+def test_unserialisable_entry_keeps_writer_alive():
+    print("\n🧪 Testing audit writer survives a bad entry...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audit.log")
+        writer = AuditWriter(path, batch_size=10, flush_interval=10, fsync='none')
+        writer.write({'n': 1})
+        writer.write({'n': 2, 'result': object()})
+        writer.write({'n': 3})
+        assert writer.flush(timeout=5)
+        assert [entry['n'] for entry in read_lines(path)] == [1, 3]
+        assert writer.errors == 1
+
+        writer.write({'n': 4})
+        assert writer.flush(timeout=5) and len(read_lines(path)) == 3
+        writer.close()
+
+def test_client_audit_log():
+    print("\n🧪 Testing ArmoriqClient audit entries...")
+    with tempfile.TemporaryDirectory() as tmp:
+        client = ArmoriqClient(audit_path=os.path.join(tmp, "audit.log"))
+        entry_hash = client.create_audit_log('schedule', {'status': 'success'}, user='alice')
+        client.audit_writer.flush()
+        entries = read_lines(client.audit_path)
+        assert entries[0]['digest'] == entry_hash and entries[0]['user'] == 'alice'
+        client.close()
+
+if __name__ == "__main__":
+    test_group_commit()
+    test_time_flush_and_close()
+    test_backpressure()
+    test_unserialisable_entry_keeps_writer_alive()
+    test_client_audit_log()
@@ -0,0 +1,62 @@
+﻿import json
+import os
+import tempfile
+import threading
+import time
+
+from calendar_store import SQLiteCalendarStore
+from simple_agent import SimpleTaara, parse_batch
+
+def test_parse_batch():
+    print("\n🧪 Testing batch body parsing...")
+    assert parse_batch('["a", {"text": "b"}]') == ["a", "b"]
+    assert parse_batch(b'{"text": "a"}\n\n"b"\n') == ["a", "b"]
+    try:
+        parse_batch('[1]')
+        assert False, "invalid item accepted"
+    except ValueError:
+        pass
+
+def test_process_batch():
+    print("\n🧪 Testing batch processing...")
+    with tempfile.TemporaryDirectory() as tmp:
+        agent = SimpleTaara(calendar=SQLiteCalendarStore(os.path.join(tmp, "calendar.db")))
+        agent.armoriq = None
+        agent.check_policies = lambda action, params: (action != "delete_all", "blocked")
+
+        texts = ["Schedule a meeting at 10am", "Delete everything", "Add task: write report", "hello"]
+        results = sorted(agent.process_batch(texts, workers=4), key=lambda r: r['index'])
+
+        assert [r['index'] for r in results] == [0, 1, 2, 3]
+        assert [r['allowed'] for r in results] == [True, False, True, True]
+        assert results[0]['result']['event']['time'] == "10:00"
+        assert results[3]['result']['status'] == "error"
+        assert agent.calendar.count() == 1
+        json.dumps(results)
+
+def test_batch_stops_when_consumer_leaves():
+    print("\n🧪 Testing bounded batch submission...")
+    with tempfile.TemporaryDirectory() as tmp:
+        agent = SimpleTaara(calendar=SQLiteCalendarStore(os.path.join(tmp, "calendar.db")))
+        started = []
+        lock = threading.Lock()
+
+        def process(text, user_id='anonymous'):
+            with lock:
+                started.append(text)
+            time.sleep(0.02)
+            return {'command': text, 'allowed': True}
+
+        agent.process = process
+        results = agent.process_batch([f"task {n}" for n in range(200)], workers=2)
+        next(results)
+        assert len(started) <= 4
+        results.close()
+        time.sleep(0.1)
+        assert len(started) <= 5
+        agent.calendar.close()
+
+if __name__ == "__main__":
+    test_parse_batch()
+    test_process_batch()
+    test_batch_stops_when_consumer_leaves()
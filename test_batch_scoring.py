@@ -0,0 +1,106 @@
+﻿import gzip
+import itertools
+import json
+import os
+import random
+import tempfile
+
+from armoriq_integration import batch_scoring
+from armoriq_integration.armoriq_client import ArmoriqClient
+from armoriq_integration.batch_scoring import score_intents, score_records
+
+WORDS = ['delete', 'remove', 'clear', 'erase', 'destroy', 'everything', 'EVERYTHING', 'Delete',
+         'meeting', 'all', 'task', 'calendar', '', 'éé', 'clearance', 'deleted']
+TYPES = ['dangerous', 'delete', 'clear_all', 'schedule', 'query', 'unknown', '', 'undelete', 'Delete']
+
+def random_intents(count, seed=7):
+    rng = random.Random(seed)
+    intents = []
+    for _ in range(count):
+        intent = {'type': rng.choice(TYPES),
+                  'raw_input': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 5))),
+                  'parameters': rng.choice([{}, {'scope': 'all'}, {'scope': 'day'}, {'time': '9:00'}])}
+        if rng.random() < 0.1:
+            del intent['raw_input']
+        intents.append(intent)
+    return intents
+
+def engines():
+    return ['python', 'numpy'] if batch_scoring.np is not None else ['python']
+
+def test_parity_with_scalar_scoring():
+    print("\n🧪 Testing batch scores match ArmoriqClient._calculate_risk_score...")
+    client = ArmoriqClient()
+    intents = random_intents(5000)
+    expected = [client._calculate_risk_score(intent) for intent in intents]
+    assert len(set(expected)) > 3
+    for engine in engines():
+        assert score_intents(intents, engine) == expected, engine
+    assert score_intents([]) == []
+
+def test_streaming_chunks_keep_order():
+    print("\n🧪 Testing chunked streaming...")
+    client = ArmoriqClient()
+    intents = random_intents(1000, seed=3)
+    records = [{'id': n, 'intent': intent} for n, intent in enumerate(intents)]
+    records.insert(10, {'id': 'no-intent', 'user': 'x'})
+    records.append({'id': 'text', 'text': 'Delete everything from my calendar'})
+
+    consumed = []
+    source = (consumed.append(1) or record for record in records)
+    stream = score_records(source, chunk_size=64)
+    first = list(itertools.islice(stream, 5))
+    assert len(consumed) == 64  # only the first chunk has been read
+    results = first + list(stream)
+
+    assert [record['id'] for record, _ in results] == [record['id'] for record in records]
+    assert dict((record['id'], score) for record, score in results)['no-intent'] is None
+    assert results[-1][1] == 0.4
+    scored = [score for record, score in results if isinstance(record['id'], int)]
+    assert scored == [client._calculate_risk_score(intent) for intent in intents]
+
+def test_cli_scores_jsonl_and_gzip():
+    print("\n🧪 Testing the batch scoring CLI...")
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, 'corpus.jsonl')
+        with open(plain, 'w') as f:
+            f.write(json.dumps({'id': 'a', 'text': 'Schedule a meeting at 2pm'}) + '\n')
+            f.write('not json\n\n')
+            f.write(json.dumps({'id': 'b', 'command': 'Delete everything'}) + '\n')
+        packed = os.path.join(tmp, 'more.jsonl.gz')
+        with gzip.open(packed, 'wt') as f:
+            f.write(json.dumps({'id': 'c', 'type': 'delete', 'raw_input': 'x', 'parameters': {'scope': 'all'}}) + '\n')
+
+        output = os.path.join(tmp, 'scores.jsonl')
+        assert batch_scoring.main([plain, packed, '--output', output, '--chunk-size', '2',
+                                   '--engine', 'python']) == 0
+        with open(output) as f:
+            scores = {row['id']: row['risk_score'] for row in map(json.loads, f)}
+        assert scores == {'a': 0.0, 'b': 0.4, 'c': 0.8}
+
+def test_cli_scores_audit_log():
+    print("\n🧪 Testing batch scoring of an audit log...")
+    from intent_matcher import IntentMatcher, intent_payload
+
+    matcher = IntentMatcher()
+    with tempfile.TemporaryDirectory() as tmp:
+        client = ArmoriqClient(audit_path=os.path.join(tmp, 'audit.log'))
+        for text in ('schedule a meeting at 2pm', 'delete everything from my calendar'):
+            match = matcher.match(text)
+            client.create_audit_log(match.action, {'status': 'success'}, intent=intent_payload(match, text))
+        # Entries without an intent can't be scored
+        client.create_audit_log('task', {'status': 'success'})
+        client.audit_writer.flush()
+
+        output = os.path.join(tmp, 'scores.jsonl')
+        assert batch_scoring.main(['--audit-log', client.audit_path, '--output', output, '--engine', 'python']) == 0
+        with open(output) as f:
+            scores = [row['risk_score'] for row in map(json.loads, f)]
+        assert scores == [0.0, 0.4]
+        client.close()
+
+if __name__ == "__main__":
+    test_parity_with_scalar_scoring()
+    test_streaming_chunks_keep_order()
+    test_cli_scores_jsonl_and_gzip()
+    test_cli_scores_audit_log()
@@ -0,0 +1,89 @@
+﻿import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from armoriq_integration.armoriq_client import ArmoriqClient
+from armoriq_integration.async_client import AsyncArmoriqClient
+from armoriq_integration.stub_server import StubArmoriqServer
+
+def intent(n):
+    return {'raw_input': f'schedule meeting {n}', 'type': 'schedule', 'parameters': {'n': n}}
+
+def make_client(stub, **kwargs):
+    client = ArmoriqClient(batch_window=0.05, batch_max=8, **kwargs)
+    client.api_endpoint = stub.url
+    return client
+
+def test_concurrent_calls_share_batches():
+    print("\n🧪 Testing micro-batched verification...")
+    with StubArmoriqServer() as stub:
+        client = make_client(stub)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda n: (n, client.verify_intent(intent(n))), range(16)))
+
+        plain = ArmoriqClient()
+        plain.api_endpoint = stub.url
+        for n, result in results:
+            assert result['verified'] and 'mode' not in result
+            assert result['verification_id'] == plain.verify_intent(intent(n))['verification_id']
+        print(f"   16 verifications in {client.batcher.batches} batch request(s)")
+        assert client.batcher.batched_intents >= 8 and client.batcher.batches <= 4
+        client.close()
+        plain.close()
+
+def test_lone_intent_uses_verify():
+    print("\n🧪 Testing a lone intent skips the batch endpoint...")
+    with StubArmoriqServer() as stub:
+        client = make_client(stub)
+        start = time.perf_counter()
+        assert client.verify_intent(intent(1))['verification_id'].startswith('stub_')
+        assert time.perf_counter() - start >= 0.05
+        assert client.batcher.batches == 0 and stub.requests == 1
+        client.close()
+
+def test_partial_failure_falls_back_per_item():
+    print("\n🧪 Testing per-item fallback for rejected batch items...")
+    with StubArmoriqServer(reject=lambda i: i['parameters']['n'] % 2 == 1) as stub:
+        client = make_client(stub)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = dict(pool.map(lambda n: (n, client.verify_intent(intent(n))), range(8)))
+        assert client.batcher.batches == 1
+        for n, result in results.items():
+            assert (result.get('mode') == 'fallback') == (n % 2 == 1)
+            assert result['verification_id'].startswith('local_' if n % 2 else 'stub_')
+        client.close()
+
+def test_server_without_batch_endpoint():
+    print("\n🧪 Testing servers without /verify/batch...")
+    with StubArmoriqServer(batch=False) as stub:
+        client = make_client(stub)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda n: client.verify_intent(intent(n)), range(4)))
+        assert all(r['verification_id'].startswith('stub_') for r in results)
+        assert not client.batcher.supported
+        client.verify_intent(intent(9))
+        assert stub.intents == 5
+        client.close()
+
+def test_async_batching():
+    print("\n🧪 Testing async micro-batching...")
+    with StubArmoriqServer() as stub:
+        client = AsyncArmoriqClient(make_client(stub))
+
+        async def run():
+            try:
+                return await asyncio.gather(*(client.verify_intent(intent(n)) for n in range(20)))
+            finally:
+                await client.aclose()
+
+        results = asyncio.run(run())
+        assert [r['verification_id'].startswith('stub_') for r in results] == [True] * 20
+        assert client.batcher.batches == 3 and stub.requests == 3
+        client.client.close()
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_batches()
+    test_lone_intent_uses_verify()
+    test_partial_failure_falls_back_per_item()
+    test_server_without_batch_endpoint()
+    test_async_batching()
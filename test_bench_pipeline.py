@@ -0,0 +1,42 @@
+﻿import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(ROOT, "benchmarks", "bench_pipeline.py")
+
+def run_bench(*args):
+    return subprocess.run([sys.executable, SCRIPT, '--min-time', '0.02', '--calendar-sizes', '0,10', *args],
+                          cwd=ROOT, capture_output=True, text=True, timeout=300)
+
+def test_results_json_and_compare():
+    print("\n🧪 Testing pipeline benchmark output...")
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "bench.json")
+        result = run_bench('--rounds', '1', '--output', output)
+        assert result.returncode == 0, result.stderr
+
+        with open(output) as f:
+            report = json.load(f)
+        results = report['results']
+        for name in ['parse_input', 'classify_intent', 'match_intent[corpus]', 'check_policies', 'calculate_risk_score',
+                     'schedule_meeting[sqlite,10]', 'schedule_meeting[json,0]', 'create_audit_log', 'e2e_replay']:
+            assert results[name]['median_us'] > 0, name
+        e2e = results['e2e_replay']
+        assert e2e['commands'] == 60 and e2e['outcomes']['error'] == 0
+        assert e2e['outcomes']['blocked'] > 0 and e2e['outcomes']['allowed'] > 0
+
+        # A baseline that was much faster makes --compare fail
+        for timing in report['results'].values():
+            timing['median_us'] /= 100
+        baseline = os.path.join(tmp, "baseline.json")
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        result = run_bench('--only', 'micro', '--backends', 'sqlite', '--compare', baseline)
+        assert result.returncode == 1 and "slower than" in result.stdout
+
+if __name__ == "__main__":
+    test_results_json_and_compare()
+    print("\n✅ Benchmark tests passed")
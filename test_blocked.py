@@ -3,7 +3,7 @@
 def test_blocked():
     print("\n🧪 Testing BLOCKED action...")
     agent = SimpleTaara()
-    action, params = agent.parse_input("Delete everything from my calendar")
+    action, params, _ = agent.parse_input("Delete everything from my calendar")
     allowed, reason = agent.check_policies(action, params)
     
     if allowed:
@@ -0,0 +1,132 @@
+﻿import asyncio
+import json
+import tempfile
+import threading
+
+from broadcast import Broadcaster, sse_frame
+from calendar_store import ShardedCalendarStore
+
+def parse_frame(frame):
+    fields = dict(line.split(': ', 1) for line in frame.strip().splitlines())
+    return fields['event'], json.loads(fields['data'])
+
+def test_fan_out_per_user():
+    print("\n🧪 Testing per-user fan-out...")
+
+    async def run():
+        broadcaster = Broadcaster()
+        alice = [broadcaster.subscribe('alice') for _ in range(3)]
+        bob = broadcaster.subscribe('bob')
+        assert broadcaster.clients() == 4 and broadcaster.clients('alice') == 3
+
+        broadcaster.publish('alice', 'decision', {'allowed': True})
+        broadcaster.publish('carol', 'decision', {'allowed': False})
+        for subscription in alice:
+            assert parse_frame(subscription.queue.get_nowait()) == ('decision', {'allowed': True})
+        assert bob.queue.empty()
+
+        # Publishing from a worker thread is handed to the loop
+        thread = threading.Thread(target=broadcaster.publish, args=('bob', 'calendar', {'version': 1}))
+        thread.start()
+        thread.join()
+        assert parse_frame(await asyncio.wait_for(bob.queue.get(), 1)) == ('calendar', {'version': 1})
+
+        for subscription in alice + [bob]:
+            broadcaster.unsubscribe(subscription)
+        assert broadcaster.clients() == 0
+
+    asyncio.run(run())
+
+def test_slow_client_drops_oldest():
+    print("\n🧪 Testing bounded queues for slow clients...")
+
+    async def run():
+        broadcaster = Broadcaster(maxsize=2)
+        slow = broadcaster.subscribe('alice')
+        fast = broadcaster.subscribe('alice')
+        frames = fast.frames(heartbeat=0.05)
+        assert await frames.__anext__() == "retry: 3000\n\n"
+
+        received = []
+        for n in range(5):
+            broadcaster.publish('alice', 'calendar', {'version': n})
+            received.append(parse_frame(await frames.__anext__())[1]['version'])
+        assert received == [0, 1, 2, 3, 4]
+        assert await frames.__anext__() == ": keepalive\n\n"
+
+        assert slow.dropped == 3
+        stream = slow.frames()
+        await stream.__anext__()
+        assert parse_frame(await stream.__anext__()) == ('dropped', {'count': 3})
+        assert [parse_frame(await stream.__anext__())[1]['version'] for _ in range(2)] == [3, 4]
+
+        broadcaster.close()
+        assert [frame async for frame in stream] == []
+
+    asyncio.run(run())
+
+def test_process_publishes_decisions_and_events():
+    print("\n🧪 Testing /api/process pushes to the caller's stream...")
+    import httpx
+    import web_app
+
+    agent = web_app.agent
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = (agent.calendars, agent.calendar, agent.check_policies, agent.armoriq)
+        agent.calendars = ShardedCalendarStore(tmp)
+        agent.calendar = agent.calendars.shard()
+        agent.check_policies = lambda action, params: (action != 'delete_all', "Not allowed")
+        agent.armoriq = None
+
+        async def run():
+            subscription = web_app.broadcaster.subscribe('alice')
+            transport = httpx.ASGITransport(app=web_app.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    for text in ("Schedule a meeting at 3pm", "Delete everything from my calendar"):
+                        await client.post("/api/process", json={"text": text}, headers={"X-User-Id": "alice"})
+                    await client.post("/api/process", json={"text": "Add task: x"}, headers={"X-User-Id": "bob"})
+            finally:
+                web_app.broadcaster.unsubscribe(subscription)
+            frames = []
+            while not subscription.queue.empty():
+                frames.append(parse_frame(subscription.queue.get_nowait()))
+            return frames
+
+        try:
+            frames = asyncio.run(run())
+        finally:
+            agent.calendars.close()
+            agent.calendars, agent.calendar, agent.check_policies, agent.armoriq = previous
+
+    assert [event for event, _ in frames] == ['decision', 'calendar', 'decision']
+    assert frames[0][1]['allowed'] and not frames[2][1]['allowed']
+    assert frames[1][1]['version'] == 1 and frames[1][1]['event']['time'] == '15:00'
+
+def test_stream_subscribes_when_body_starts():
+    print("\n🧪 Testing that an unread /api/stream leaves no subscription...")
+    import web_app
+
+    async def run():
+        broadcaster = web_app.broadcaster
+        response = await web_app.stream('carol')
+        # Never streamed (client left before the body started): nothing registered
+        assert 'carol' not in broadcaster._subscribers
+        body = response.body_iterator
+        assert (await body.__anext__()).startswith('retry:')
+        assert len(broadcaster._subscribers['carol']) == 1
+        await body.aclose()
+        assert 'carol' not in broadcaster._subscribers
+
+    asyncio.run(run())
+
+def test_sse_frame():
+    print("\n🧪 Testing SSE framing...")
+    assert sse_frame('decision', {'a': 'x\ny'}) == 'event: decision\ndata: {"a": "x\\ny"}\n\n'
+
+if __name__ == "__main__":
+    test_fan_out_per_user()
+    test_slow_client_drops_oldest()
+    test_process_publishes_decisions_and_events()
+    test_stream_subscribes_when_body_starts()
+    test_sse_frame()
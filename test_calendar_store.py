@@ -0,0 +1,409 @@
+﻿import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+import threading
+
+from calendar_store import (REJECT, WARN, ConflictError, JsonCalendarStore, SQLiteCalendarStore,
+                            ShardedCalendarStore, encode_cursor, migrate_json, open_calendar_shards,
+                            open_calendar_store)
+from policy_engine import hour_mask
+
+def test_sqlite_store():
+    print("\n🧪 Testing SQLite calendar store...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteCalendarStore(os.path.join(tmp, "calendar.db"))
+        first = store.add_event({"title": "Standup", "time": "9:00", "date": "2026-03-02"})
+        second = store.add_event({"title": "Review", "time": "14:00", "date": "2026-03-02"})
+
+        assert (first["id"], second["id"]) == (1, 2)
+        assert store.get_event(2)["title"] == "Review"
+        assert store.count() == 2
+        assert [e["id"] for e in store.export()["events"]] == [1, 2]
+        store.close()
+
+def test_json_migration():
+    print("\n🧪 Testing JSON calendar migration...")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "taara_calendar.json")
+        with open(legacy, 'w') as f:
+            json.dump({"events": [
+                {"id": 1, "title": "Meeting", "time": "14:00", "date": "2026-03-02", "verified": True},
+                {"id": 2, "title": "Meeting", "time": "9:00", "date": "2026-03-03", "verified": False}
+            ]}, f)
+
+        store = open_calendar_store(os.path.join(tmp, "calendar.db"), 'sqlite', legacy_json=legacy)
+        assert store.count() == 2
+        assert store.add_event({"title": "Next", "time": "10:00", "date": "2026-03-04"})["id"] == 3
+        assert migrate_json(legacy, store) == 0
+
+        exported = os.path.join(tmp, "export.json")
+        store.export_json(exported)
+        assert JsonCalendarStore(exported).count() == 3
+        store.close()
+
+def test_range_query_pagination():
+    print("\n🧪 Testing calendar range queries...")
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (SQLiteCalendarStore(os.path.join(tmp, "calendar.db")),
+                      JsonCalendarStore(os.path.join(tmp, "calendar.json"))):
+            store.add_event({"title": "Late", "time": "14:00", "date": "2026-03-02"})
+            store.add_event({"title": "Early", "time": "9:00", "date": "2026-03-02"})
+            store.add_event({"title": "Before", "time": "9:00", "date": "2026-03-01"})
+            assert store.query()["events"][0]["title"] == "Before"
+
+            # Index is updated incrementally after the first query
+            store.add_event({"title": "After", "time": "8:00", "date": "2026-03-03"})
+
+            page = store.query("2026-03-02", "2026-03-03", limit=2, fields=["title"])
+            assert page["events"] == [{"title": "Early"}, {"title": "Late"}]
+            page = store.query("2026-03-02", "2026-03-03", cursor=page["next_cursor"], limit=2)
+            assert [e["title"] for e in page["events"]] == ["After"]
+            assert page["next_cursor"] is None
+            for key in (["a", 1, "x"], [20260302, "09:00", 1], ["2026-03-02", "09:00", True], "x"):
+                try:
+                    store.query(cursor=encode_cursor(key) if isinstance(key, list) else key)
+                    assert False, f"expected {key!r} to be rejected"
+                except ValueError:
+                    pass
+            store.close()
+
+def schedule_many(backend, path, worker, count):
+    store = open_calendar_store(path, backend)
+    for n in range(count):
+        store.add_event({"title": f"w{worker}-{n}", "time": f"{n % 24}:00", "date": "2026-03-02"})
+    store.close()
+
+def test_concurrent_writers():
+    print("\n🧪 Testing concurrent calendar writers...")
+    workers, per_worker = 4, 50
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend, name in (('sqlite', "calendar.db"), ('json', "calendar.json")):
+            path = os.path.join(tmp, name)
+            store = open_calendar_store(path, backend)
+            assert store.query()["events"] == []
+
+            start = time.perf_counter()
+            processes = [multiprocessing.Process(target=schedule_many, args=(backend, path, w, per_worker))
+                         for w in range(workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - start
+            print(f"   {backend}: {workers * per_worker} writes from {workers} processes in {elapsed * 1000:.0f}ms")
+            assert all(process.exitcode == 0 for process in processes)
+
+            events = list(store.events())
+            assert sorted(e["id"] for e in events) == list(range(1, workers * per_worker + 1))
+            assert len({e["title"] for e in events}) == workers * per_worker
+
+            # The parent's cached index picks up the other processes' writes
+            assert len(store.query(limit=1000)["events"]) == workers * per_worker
+            assert store.add_event({"title": "Last", "time": "9:00", "date": "2026-03-03"})["id"] == 201
+            assert store.query("2026-03-03")["events"][0]["title"] == "Last"
+            store.close()
+        assert not [name for name in os.listdir(tmp) if name.endswith('.tmp')]
+
+def test_sharded_calendars():
+    print("\n🧪 Testing per-user calendar shards...")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "taara_calendar.json")
+        with open(legacy, 'w') as f:
+            json.dump({"events": [{"id": 1, "title": "Old", "time": "9:00", "date": "2026-03-02"}]}, f)
+        shards = open_calendar_shards(os.path.join(tmp, "shards"), 'sqlite', legacy_json=legacy)
+        assert shards.shard().count() == 1
+
+        def schedule(user):
+            for n in range(20):
+                shards.shard(user).add_event({"title": user, "time": f"{n}:00", "date": "2026-03-02"})
+
+        users = ["alice", "bob", "../carol", "Carol"]
+        threads = [threading.Thread(target=schedule, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for user in users:
+            events = shards.shard(user).query("2026-03-02", "2026-03-02")["events"]
+            assert len(events) == 20 and {e["title"] for e in events} == {user}
+        assert shards.shard("alice") is shards.shard("alice")
+        assert len({shards.shard_path(user) for user in users}) == 4
+        assert all(os.path.dirname(shards.shard_path(user)) == shards.directory for user in users)
+        shards.close()
+
+def test_shard_lru_and_legacy_store():
+    print("\n🧪 Testing shard eviction and the pre-sharding calendar...")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "taara_calendar.db")
+        old = SQLiteCalendarStore(legacy)
+        old.add_event({"title": "Old", "time": "9:00", "date": "2026-03-02"})
+        old.close()
+        legacy_json = os.path.join(tmp, "taara_calendar.json")
+        with open(legacy_json, 'w') as f:
+            json.dump({"events": [{"id": 1, "title": "Older", "time": "9:00", "date": "2026-03-02"}]}, f)
+
+        shards = open_calendar_shards(os.path.join(tmp, "shards"), 'sqlite', legacy_json=legacy_json,
+                                      legacy_path=legacy)
+        assert [e["title"] for e in shards.shard().events()] == ["Old"]
+        shards.close()
+
+        shards = ShardedCalendarStore(os.path.join(tmp, "shards"), max_open=2)
+        alice = shards.shard("alice")
+        alice.add_event({"title": "A", "time": "9:00", "date": "2026-03-02"})
+        shards.shard("bob")
+        shards.shard("alice")
+        shards.shard("carol")
+        # bob was the least recently used, so his store was closed
+        assert shards.open_count() == 2 and shards.shard("alice") is alice
+        # A store closed under a caller reopens instead of failing
+        shards.shard("dave")
+        shards.shard("erin")
+        alice.add_event({"title": "B", "time": "10:00", "date": "2026-03-02"})
+        assert shards.shard("alice") is not alice
+        assert [e["title"] for e in shards.shard("alice").query("2026-03-02")["events"]] == ["A", "B"]
+        alice.close()
+        shards.close()
+
+def test_calendar_endpoint_reads_callers_shard():
+    print("\n🧪 Testing /api/calendar per-user isolation...")
+    from fastapi.testclient import TestClient
+    import web_app
+
+    agent = web_app.agent
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = (agent.calendars, agent.calendar, agent.check_policies, agent.armoriq)
+        agent.calendars = ShardedCalendarStore(tmp)
+        agent.calendar = agent.calendars.shard()
+        agent.check_policies = lambda action, params: (True, "ok")
+        agent.armoriq = None
+        try:
+            client = TestClient(web_app.app)
+            response = client.post("/api/process", json={"text": "Schedule a meeting at 3pm"},
+                                   headers={"X-User-Id": "alice"})
+            assert response.json()["allowed"]
+            assert response.json()["calendar_version"] == 1
+            assert "calendar" not in response.json()
+
+            assert len(client.get("/api/calendar", headers={"X-User-Id": "alice"}).json()["events"]) == 1
+            assert len(client.get("/api/calendar", params={"user": "alice"}).json()["events"]) == 1
+            assert client.get("/api/calendar", headers={"X-User-Id": "bob"}).json()["events"] == []
+            assert client.get("/api/calendar").json()["events"] == []
+        finally:
+            agent.calendars.close()
+            agent.calendars, agent.calendar, agent.check_policies, agent.armoriq = previous
+
+def test_versioned_changes():
+    print("\n🧪 Testing calendar versions and changes since a version...")
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (SQLiteCalendarStore(os.path.join(tmp, "calendar.db")),
+                      JsonCalendarStore(os.path.join(tmp, "calendar.json"))):
+            assert store.version() == 0
+            assert store.changes() == {"events": [], "version": 0, "more": False}
+            for hour in (15, 9, 12):
+                store.add_event({"title": f"at {hour}", "time": f"{hour}:00", "date": "2026-03-02"})
+            assert store.version() == 3
+
+            changes = store.changes(1)
+            assert [e["title"] for e in changes["events"]] == ["at 9", "at 12"]
+            assert (changes["version"], changes["more"]) == (3, False)
+            page = store.changes(0, limit=2)
+            assert [e["version"] for e in page["events"]] == [1, 2] and page["more"]
+            assert store.changes(page["version"])["events"][0]["title"] == "at 12"
+            assert store.changes(3) == {"events": [], "version": 3, "more": False}
+
+            store.import_events([{"id": 10, "title": "imported", "time": "8:00", "date": "2026-03-03"}])
+            assert store.version() == 4 and store.changes(3)["events"][0]["id"] == 10
+            store.close()
+
+def test_changes_during_writes():
+    print("\n🧪 Testing that following changes misses no concurrent write...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calendar.db")
+        reader, writer = SQLiteCalendarStore(path), SQLiteCalendarStore(path)
+        done = threading.Event()
+
+        def write():
+            for n in range(300):
+                writer.add_event({"title": f"e{n}", "time": "9:00", "date": "2026-03-02"})
+            done.set()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        seen, version = [], 0
+        while True:
+            finished = done.is_set()
+            page = reader.changes(version)
+            seen.extend(e["id"] for e in page["events"])
+            version = page["version"]
+            if finished and not page["more"]:
+                break
+        thread.join()
+        assert seen == list(range(1, 301))
+        reader.close()
+        writer.close()
+
+def test_sqlite_version_migration():
+    print("\n🧪 Testing version column migration for old SQLite calendars...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calendar.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                     "date TEXT NOT NULL, time TEXT NOT NULL, body TEXT NOT NULL)")
+        conn.execute("INSERT INTO events (date, time, body) VALUES ('2026-03-02', '09:00', ?)",
+                     (json.dumps({"title": "Old", "time": "9:00", "date": "2026-03-02"}),))
+        conn.commit()
+        conn.close()
+
+        store = SQLiteCalendarStore(path)
+        assert store.version() == 1 and store.get_event(1)["version"] == 1
+        assert store.add_event({"title": "New", "time": "10:00", "date": "2026-03-02"})["version"] == 2
+        store.close()
+
+def test_calendar_endpoint_conditional_get():
+    print("\n🧪 Testing /api/calendar ETag, 304 and since...")
+    from fastapi.testclient import TestClient
+    import web_app
+
+    agent = web_app.agent
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = (agent.calendars, agent.calendar)
+        agent.calendars = ShardedCalendarStore(tmp)
+        agent.calendar = agent.calendars.shard()
+        try:
+            client = TestClient(web_app.app)
+            alice = {"X-User-Id": "alice"}
+            first = client.get("/api/calendar", headers=alice)
+            assert first.json() == {"events": [], "next_cursor": None, "version": 0}
+            etag = first.headers["ETag"]
+            assert client.get("/api/calendar", headers=dict(alice, **{"If-None-Match": etag})).status_code == 304
+
+            for hour in (9, 10):
+                agent.calendar_for("alice").add_event({"title": f"at {hour}", "time": f"{hour}:00",
+                                                       "date": "2026-03-02"})
+            changed = client.get("/api/calendar", headers=dict(alice, **{"If-None-Match": etag}))
+            assert changed.status_code == 200 and changed.headers["ETag"] != etag
+            assert changed.json()["version"] == 2
+
+            delta = client.get("/api/calendar", params={"since": 1, "fields": "title"}, headers=alice).json()
+            assert delta == {"events": [{"title": "at 10"}], "version": 2, "more": False}
+            assert client.get("/api/calendar", params={"since": -1}, headers=alice).status_code == 422
+        finally:
+            agent.calendars.close()
+            agent.calendars, agent.calendar = previous
+
+def test_overlaps_and_free_slots():
+    print("\n🧪 Testing overlap detection and free slot search...")
+    work_hours = hour_mask(range(9, 18))
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (SQLiteCalendarStore(os.path.join(tmp, "calendar.db")),
+                      JsonCalendarStore(os.path.join(tmp, "calendar.json"))):
+            store.add_event({"title": "Standup", "time": "9:00", "date": "2026-03-02", "duration": 60})
+            store.add_event({"title": "Lunch", "time": "12:00", "date": "2026-03-02"})
+            assert "conflicts" not in store.add_event({"title": "Next", "time": "10:00", "date": "2026-03-02",
+                                                       "duration": 15}, on_conflict=WARN)
+
+            late = store.add_event({"title": "Late", "time": "9:30", "date": "2026-03-02"}, on_conflict=WARN)
+            assert [e["title"] for e in late["conflicts"]] == ["Standup"]
+            assert "conflicts" not in store.get_event(late["id"])
+            try:
+                store.add_event({"title": "Clash", "time": "11:45", "date": "2026-03-02", "duration": 30},
+                                on_conflict=REJECT)
+                assert False, "expected a conflict"
+            except ConflictError as e:
+                assert [c["title"] for c in e.conflicts] == ["Lunch"]
+            assert store.count() == 4
+            assert store.conflicts({"time": "12:29", "date": "2026-03-02"})[0]["title"] == "Lunch"
+            assert store.conflicts({"time": "12:30", "date": "2026-03-02"}) == []
+
+            assert store.free_slot(60, "2026-03-02", hour_mask=work_hours) == \
+                {"date": "2026-03-02", "time": "10:15", "duration": 60}
+            assert store.free_slot(120, "2026-03-02", hour_mask=work_hours)["time"] == "12:30"
+            assert store.free_slot(30, "2026-03-02", after=17 * 60 + 45, hour_mask=work_hours) == \
+                {"date": "2026-03-03", "time": "9:00", "duration": 30}
+            assert store.free_slot(30, "2026-03-02", after=9 * 60)["time"] == "10:15"
+            assert store.free_slot(10 * 60, "2026-03-02", hour_mask=work_hours, days=3) is None
+            store.close()
+
+def test_schedule_conflict_modes():
+    print("\n🧪 Testing meeting conflicts in the agent...")
+    from simple_agent import SimpleTaara
+
+    with tempfile.TemporaryDirectory() as tmp:
+        agent = SimpleTaara(calendar=SQLiteCalendarStore(os.path.join(tmp, "calendar.db")))
+        agent.check_policies = lambda action, params: (True, "ok")
+        agent.armoriq = None
+
+        assert agent.process("Schedule a meeting tomorrow at 10am for 1 hour")["result"]["event"]["duration"] == 60
+        warned = agent.process("Schedule a meeting tomorrow at 10:30am")["result"]
+        assert warned["status"] == "success" and "overlaps Meeting at 10:00" in warned["message"]
+        agent.conflict_mode = REJECT
+        rejected = agent.process("Schedule a meeting tomorrow at 10:45am")["result"]
+        assert rejected["status"] == "conflict" and agent.calendar.count() == 2
+
+        # policies.yaml allows 9:00-18:00, and 9:00-10:00 is too short
+        free = agent.process("Find a free slot of 90 minutes tomorrow")["result"]["slot"]
+        assert free["time"] == "11:00" and agent.calendar.conflicts(free) == []
+
+        # Long overlap lists are cut to the first few plus a count
+        agent.conflict_mode = WARN
+        for n in range(7):
+            agent.calendar.add_event({"title": f"Busy {n}", "time": "15:00", "date": "2026-03-02"})
+        crowded = agent.schedule_meeting({"time": "15:00", "date": "2026-03-02"})
+        assert len(crowded["conflicts"]) == 5 and crowded["conflict_count"] == 7
+        assert crowded["message"].endswith("Busy 4 at 15:00 and 2 more)")
+        agent.conflict_mode = REJECT
+        rejected = agent.schedule_meeting({"time": "15:00", "date": "2026-03-02"})
+        assert len(rejected["conflicts"]) == 5 and rejected["conflict_count"] == 8
+        assert "and 3 more" in rejected["message"]
+
+        # Weekday names resolve to a date, like "tomorrow"
+        friday = agent.process("Schedule a meeting on Friday at 7am")["result"]["event"]["date"]
+        listed = agent.process("Which meetings do I have on Friday?")["result"]
+        assert listed["message"].startswith(f"1 meeting(s) on {friday}")
+        agent.calendar.close()
+
+def test_explicit_ids_are_checked():
+    print("\n🧪 Testing explicit and missing ids on import...")
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (SQLiteCalendarStore(os.path.join(tmp, "calendar.db")),
+                      JsonCalendarStore(os.path.join(tmp, "calendar.json"))):
+            store.add_event({"id": 5, "title": "Kept", "time": "9:00", "date": "2026-03-02"})
+            for bad in ({"id": 5}, {"id": "x"}):
+                try:
+                    store.add_event(dict(bad, title="Clash", time="10:00", date="2026-03-02"))
+                    assert False, f"expected id {bad['id']!r} to be rejected"
+                except ValueError:
+                    pass
+            try:
+                store.import_events([{"title": "New", "time": "8:00", "date": "2026-03-03"},
+                                     {"id": 5, "title": "Dup", "time": "8:00", "date": "2026-03-03"}])
+                assert False, "expected the duplicate to abort the import"
+            except ValueError:
+                pass
+            assert store.count() == 1
+
+            assert store.import_events([{"title": "No id", "time": "8:00", "date": "2026-03-03"}]) == 1
+            events = store.query()["events"]
+            assert [e["id"] for e in events] == [5, 6]
+            store.close()
+
+if __name__ == "__main__":
+    test_sqlite_store()
+    test_json_migration()
+    test_range_query_pagination()
+    test_concurrent_writers()
+    test_sharded_calendars()
+    test_shard_lru_and_legacy_store()
+    test_calendar_endpoint_reads_callers_shard()
+    test_versioned_changes()
+    test_changes_during_writes()
+    test_sqlite_version_migration()
+    test_calendar_endpoint_conditional_get()
+    test_overlaps_and_free_slots()
+    test_explicit_ids_are_checked()
+    test_schedule_conflict_modes()
@@ -0,0 +1,68 @@
+﻿import time
+
+from armoriq_integration.armoriq_client import ArmoriqClient
+from armoriq_integration.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from armoriq_integration.stub_server import StubArmoriqServer
+
+INTENT = {'raw_input': 'remind me to stretch', 'type': 'remind', 'parameters': {}}
+
+def test_breaker_state_machine():
+    print("\n🧪 Testing circuit breaker states...")
+    now = [0.0]
+    breaker = CircuitBreaker(failure_rate=0.5, slow_call_seconds=1.0, window_size=4, min_calls=4,
+                             open_seconds=10, clock=lambda: now[0])
+    for failed in (False, False, False, True):
+        (breaker.record_failure if failed else breaker.record_success)(0.1)
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow_request()
+
+    now[0] = 10.0
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request() and not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    now[0] = 20.0
+    assert breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()['trips'] == 2
+
+    # Slow successes trip the breaker as well
+    for _ in range(4):
+        breaker.record_success(latency=5.0)
+    assert breaker.state == OPEN
+
+def test_open_breaker_skips_network():
+    print("\n🧪 Testing ARMORIQ outage fail-over...")
+    with StubArmoriqServer(latency=0.3) as stub:
+        breaker = CircuitBreaker(min_calls=3, open_seconds=60)
+        client = ArmoriqClient(read_timeout=0.1, time_budget=0.15, max_retries=0, breaker=breaker)
+        client.api_endpoint = stub.url
+
+        for _ in range(3):
+            assert client.verify_intent(INTENT)['mode'] == 'fallback'
+        requests_before = stub.requests
+
+        start = time.perf_counter()
+        result = client.verify_intent(INTENT)
+        assert time.perf_counter() - start < 0.05
+        assert result['mode'] == 'fallback' and result['circuit'] == OPEN
+        assert stub.requests == requests_before
+
+def test_exhausted_429_counts_as_failure():
+    print("\n🧪 Testing rate-limited calls feed the breaker as failures...")
+    with StubArmoriqServer(fail_first=100, fail_status=429) as stub:
+        breaker = CircuitBreaker(min_calls=2, open_seconds=60)
+        client = ArmoriqClient(max_retries=1, breaker=breaker)
+        client.api_endpoint = stub.url
+        for _ in range(2):
+            assert client.verify_intent(dict(INTENT, parameters={'n': _}))['status_code'] == 429
+        assert breaker.state == OPEN
+
+if __name__ == "__main__":
+    test_breaker_state_machine()
+    test_open_breaker_skips_network()
+    test_exhausted_429_counts_as_failure()
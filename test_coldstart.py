@@ -0,0 +1,109 @@
+﻿import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import policy_engine
+from benchmarks import coldstart
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def run_python(code, **env):
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                            env=dict(os.environ, **env), timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+def test_handler_import_is_lazy():
+    print("\n🧪 Testing serverless handler import...")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = run_python(
+            "import json, sys; sys.path.insert(0, 'api'); import process\n"
+            "response = process.handler({'requestContext': {'http': {'method': 'GET'}}}, None)\n"
+            "print(json.dumps([response['statusCode'], process.agent is None,\n"
+            "                  [m for m in %r if m in sys.modules]]))" % (coldstart.LAZY_MODULES,),
+            HOME=tmp
+        )
+        status, no_agent, eager = json.loads(out.splitlines()[-1])
+        assert status == 200 and no_agent
+        assert eager == []
+
+def test_policy_snapshot():
+    print("\n🧪 Testing precompiled policy snapshot...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "policies.yaml")
+        with open(path, 'w') as f:
+            f.write('- name: "no_clear"\n  type: "operation_restriction"\n  blocked_ops: ["clear"]\n')
+        policy_engine.compile_snapshot(path)
+
+        out = run_python(
+            "import sys, policy_engine\n"
+            f"compiled = policy_engine.load_policy_file({path!r})\n"
+            "print(sorted(compiled.blocked_ops), 'yaml' in sys.modules)"
+        )
+        assert out.strip() == "['clear'] False"
+
+        # An edited YAML file no longer matches the snapshot and is parsed again
+        with open(path, 'a') as f:
+            f.write('- name: "no_delete"\n  type: "operation_restriction"\n  blocked_ops: ["delete_all"]\n')
+        assert policy_engine.load_policy_file(path).blocked_ops == {"clear", "delete_all"}
+
+    # The shipped snapshot matches the shipped policies
+    with open(policy_engine.snapshot_path(policy_engine.DEFAULT_POLICIES_FILE)) as f:
+        snapshot = json.load(f)
+    import yaml
+    with open(policy_engine.DEFAULT_POLICIES_FILE, encoding='utf-8-sig') as f:
+        assert snapshot['policies'] == yaml.safe_load(f)
+    assert policy_engine.read_policies(policy_engine.DEFAULT_POLICIES_FILE) == snapshot['policies']
+
+def test_server_mode_is_quiet():
+    print("\n🧪 Testing server mode output...")
+    import simple_agent
+
+    previous = os.environ.get('TAARA_SERVER_MODE')
+    os.environ['TAARA_SERVER_MODE'] = '1'
+    try:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), tempfile.TemporaryDirectory() as tmp:
+            from calendar_store import SQLiteCalendarStore
+            simple_agent.SimpleTaara(calendar=SQLiteCalendarStore(os.path.join(tmp, "calendar.db")))
+        assert out.getvalue() == ""
+        assert simple_agent.Fore.GREEN == ""
+    finally:
+        if previous is None:
+            del os.environ['TAARA_SERVER_MODE']
+        else:
+            os.environ['TAARA_SERVER_MODE'] = previous
+
+def test_server_mode_is_explicit():
+    print("\n🧪 Testing that the web app leaves the environment alone...")
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {key: value for key, value in os.environ.items() if key != 'TAARA_SERVER_MODE'}
+        result = subprocess.run(
+            [sys.executable, '-c', "import os, console, web_app\n"
+                                   "print('TAARA_SERVER_MODE' in os.environ, console.server_mode())"],
+            cwd=ROOT, capture_output=True, text=True, env=dict(env, HOME=tmp), timeout=60
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "False True"
+
+def test_coldstart_benchmark_runs():
+    print("\n🧪 Testing cold-start benchmark...")
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        status = coldstart.main(['--trials', '1', '--budget-ms', '100000', '--import-budget-ms', '100000'])
+    assert status == 0, out.getvalue()
+    assert "eager heavy modules   : none" in out.getvalue()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert coldstart.main(['--trials', '1', '--budget-ms', '0.001']) == 1
+
+if __name__ == "__main__":
+    test_handler_import_is_lazy()
+    test_policy_snapshot()
+    test_server_mode_is_quiet()
+    test_server_mode_is_explicit()
+    test_coldstart_benchmark_runs()
+    print("\n✅ Cold-start tests passed")
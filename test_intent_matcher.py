@@ -0,0 +1,63 @@
+﻿from datetime import datetime, timedelta
+
+import intent_matcher
+from intent_matcher import INTENT_RULES, IntentMatcher, IntentRule
+
+TODAY = datetime.now().strftime('%Y-%m-%d')
+TOMORROW = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+# The next Friday, today included
+FRIDAY = (datetime.now() + timedelta(days=(4 - datetime.now().weekday()) % 7)).strftime('%Y-%m-%d')
+
+def test_matcher_outputs():
+    print("\n🧪 Testing intent matcher...")
+    matcher = IntentMatcher()
+    cases = {
+        "schedule a meeting tomorrow at 2pm": ("schedule", "schedule", {"title": "Meeting", "date": TOMORROW, "time": "14:00"}),
+        "meeting at 12am": ("schedule", "schedule", {"title": "Meeting", "time": "0:00"}),
+        "remind me to call john at 5pm": ("remind", "remind", {"text": "call john at 5pm"}),
+        "add task: buy groceries": ("task", "task", {"text": ": buy groceries"}),
+        "delete everything from my calendar": ("delete_all", "dangerous", {"scope": "all"}),
+        "what meetings do i have tomorrow?": ("list", "query", {"date": TOMORROW}),
+        "which meetings do i have on friday?": ("list", "query", {"date": FRIDAY}),
+        "schedule a meeting on friday at 3pm": ("schedule", "schedule", {"title": "Meeting", "date": FRIDAY,
+                                                                          "time": "15:00"}),
+        "book an appointment": ("unknown", "unknown", {}),
+        "schedule a 45 minute meeting at 3pm": ("schedule", "schedule", {"title": "Meeting", "duration": 45, "time": "15:00"}),
+        "meeting at 9am for 2 hours": ("schedule", "schedule", {"title": "Meeting", "duration": 120, "time": "9:00"}),
+        "find a free slot of half an hour tomorrow": ("free_slot", "query", {"date": TOMORROW, "duration": 30}),
+        "when am i free for an hour?": ("free_slot", "query", {"date": TODAY, "duration": 60}),
+        "schedule a standup every weekday at 10am": ("schedule", "schedule", {"title": "Meeting", "time": "10:00",
+                                                    "recurrence": {"freq": "weekly", "weekdays": [0, 1, 2, 3, 4]}}),
+    }
+    for text, (action, intent_type, params) in cases.items():
+        match = matcher.match(text)
+        assert (match.action, match.intent_type, match.params) == (action, intent_type, params), text
+
+    assert matcher.match("delete everything").dangerous
+    assert matcher.classify("book an appointment") == "schedule"
+    assert matcher.classify("remove the todo") == "task"
+    assert matcher.classify("please erase it") == "query"
+
+def test_matcher_extension():
+    print("\n🧪 Testing intent table extension...")
+    rules = INTENT_RULES + (IntentRule('note', 'note', ['note'], extract=lambda text, hits: {"text": text}),)
+    matcher = IntentMatcher(rules)
+    assert matcher.match("note the wifi password").action == "note"
+    assert matcher.match("schedule a note").action == "schedule"
+
+def test_matcher_cache():
+    print("\n🧪 Testing intent matcher cache...")
+    matcher = IntentMatcher()
+    first = matcher.match("schedule a meeting tomorrow at 2pm")
+    assert matcher.match("schedule a meeting tomorrow at 2pm") == first
+    # Parameters are extracted on every call, the cached scan only picks the rule
+    assert matcher.match("schedule a meeting tomorrow at 2pm").params is not first.params
+    for n in range(intent_matcher.MATCH_CACHE_SIZE + 10):
+        matcher.classify(f"remind me {n} times")
+    assert len(matcher._scanned) <= intent_matcher.MATCH_CACHE_SIZE
+    assert matcher.match("schedule a meeting tomorrow at 2pm") == first
+
+if __name__ == "__main__":
+    test_matcher_outputs()
+    test_matcher_extension()
+    test_matcher_cache()
@@ -0,0 +1,57 @@
+﻿import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.loadgen import Recorder, classify, parse_mix
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(ROOT, "benchmarks", "loadgen.py")
+
+def run_loadgen(output, *args):
+    result = subprocess.run([sys.executable, SCRIPT, '--requests', '40', '--concurrency', '4', '--warmup', '2',
+                             '--output', output, *args], cwd=ROOT, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    with open(output) as f:
+        return json.load(f)
+
+def test_both_targets():
+    print("\n🧪 Testing load generator targets...")
+    with tempfile.TemporaryDirectory() as tmp:
+        for target in ('web', 'handler'):
+            report = run_loadgen(os.path.join(tmp, f"{target}.json"), '--target', target)
+            outcomes = report['outcomes']
+            assert report['requests'] == 40 and report['throughput_per_s'] > 0
+            assert outcomes['error']['count'] == 0
+            assert outcomes['allowed']['count'] > 0
+            assert sum(stats['count'] for stats in outcomes.values()) == 40
+            assert sum(outcomes['allowed']['histogram']) == outcomes['allowed']['count']
+
+        report = run_loadgen(os.path.join(tmp, "blocked.json"), '--target', 'handler', '--mix', 'blocked=1')
+        assert report['outcomes']['blocked']['count'] == 40
+
+def test_helpers():
+    print("\n🧪 Testing load generator helpers...")
+    assert parse_mix("allowed=3,unknown") == [('allowed', 3.0), ('unknown', 1.0)]
+    try:
+        parse_mix("nope=1")
+        assert False, "unknown kind accepted"
+    except ValueError:
+        pass
+
+    assert classify({'allowed': True, 'action': 'schedule'}) == 'allowed'
+    assert classify({'allowed': False, 'action': 'delete_all'}) == 'blocked'
+    assert classify({'allowed': True, 'action': 'unknown'}) == 'unknown'
+
+    recorder = Recorder()
+    for latency in (0.3, 3, 30, 3000):
+        recorder.record('allowed', latency)
+    stats = recorder.report(1.0)['outcomes']['allowed']
+    assert stats['count'] == 4 and stats['max_ms'] == 3000
+    assert [count for count in stats['histogram'] if count] == [1, 1, 1, 1]
+
+if __name__ == "__main__":
+    test_both_targets()
+    test_helpers()
+    print("\n✅ Load generator tests passed")
@@ -0,0 +1,125 @@
+﻿import os
+import sys
+import tempfile
+
+import metrics
+from metrics import Registry, span
+
+def test_registry_render():
+    print("\n🧪 Testing Prometheus rendering...")
+    registry = Registry()
+    registry.describe('jobs_total', 'counter', 'Jobs done')
+    registry.inc('jobs_total', kind='a')
+    registry.inc('jobs_total', 2, kind='a')
+    registry.inc('jobs_total', kind='b"q')
+    registry.observe('wait_seconds', 0.003, buckets=(0.001, 0.01), stage='x')
+    registry.observe('wait_seconds', 5, buckets=(0.001, 0.01), stage='x')
+    registry.add_collector(lambda: [('queue_depth', 'gauge', {}, 7)])
+
+    text = registry.render()
+    assert '# HELP jobs_total Jobs done\n# TYPE jobs_total counter\n' in text
+    assert 'jobs_total{kind="a"} 3\n' in text
+    assert 'jobs_total{kind="b\\"q"} 1\n' in text
+    assert 'wait_seconds_bucket{stage="x",le="0.001"} 0\n' in text
+    assert 'wait_seconds_bucket{stage="x",le="0.01"} 1\n' in text
+    assert 'wait_seconds_bucket{stage="x",le="+Inf"} 2\n' in text
+    assert 'wait_seconds_count{stage="x"} 2\n' in text
+    assert '# TYPE queue_depth gauge\nqueue_depth 7\n' in text
+
+def test_spans_and_server_timing():
+    print("\n🧪 Testing stage spans...")
+    timings = metrics.start_request()
+    with span('verify'):
+        pass
+    with span('verify'):
+        pass
+    assert list(timings) == ['verify']
+    header = metrics.server_timing({'parse': 0.0012, 'verify': 0.05}, 0.06)
+    assert header == "parse;dur=1.20, verify;dur=50.00, total;dur=60.00"
+
+    assert metrics.verification_mode({'verified': True}) == 'remote'
+    assert metrics.verification_mode({'verified': True, 'cache': 'hit', 'mode': 'fallback'}) == 'cache'
+    assert metrics.verification_mode({'verified': True, 'mode': 'fallback'}) == 'fallback'
+    assert metrics.verification_mode({'verified': True, 'mode': 'fallback', 'circuit': 'open'}) == 'circuit_open'
+    assert metrics.verification_mode({'verified': False}) == 'rejected'
+
+def test_web_metrics_and_headers():
+    print("\n🧪 Testing /metrics and Server-Timing...")
+    from fastapi.testclient import TestClient
+    from armoriq_integration.stub_server import StubArmoriqServer
+    from calendar_store import ShardedCalendarStore
+    import web_app
+
+    agent = web_app.agent
+    with tempfile.TemporaryDirectory() as tmp, StubArmoriqServer() as stub:
+        previous = (agent.calendars, agent.calendar, agent.check_policies, agent.armoriq.api_endpoint,
+                    agent.armoriq.create_audit_log)
+        agent.calendars = ShardedCalendarStore(tmp)
+        agent.calendar = agent.calendars.shard()
+        agent.check_policies = lambda action, params: (action != "delete_all", "blocked")
+        agent.armoriq.api_endpoint = stub.url
+        agent.armoriq.create_audit_log = lambda action, result, user='anonymous', intent=None: None
+        try:
+            client = TestClient(web_app.app)
+            response = client.post("/api/process", json={"text": "Schedule a meeting at 3pm"})
+            assert response.json()["allowed"]
+            stages = [entry.split(';')[0] for entry in response.headers["Server-Timing"].split(', ')]
+            assert stages[:4] == ["parse", "verify", "policy", "execute"] and stages[-1] == "total"
+            assert "audit" in stages
+
+            # A streamed batch sends its headers first, but its stages still
+            # reach the request's timings from the worker threads
+            collected = []
+            start_request = metrics.start_request
+            metrics.start_request = lambda: collected.append(start_request()) or collected[-1]
+            try:
+                response = client.post("/api/process/batch", content='["Schedule a meeting at 4pm", "Add task: buy milk"]')
+            finally:
+                metrics.start_request = start_request
+            assert len(response.text.splitlines()) == 2
+            assert {"parse", "verify", "policy", "execute"} <= set(collected[0])
+
+            client.post("/api/process", json={"text": "Delete everything from my calendar"})
+            text = client.get("/metrics").text
+            assert 'taara_policy_decisions_total{outcome="blocked"}' in text
+            assert 'taara_verifications_total{mode="remote"}' in text
+            assert 'taara_stage_seconds_count{stage="verify"}' in text
+            assert 'taara_request_seconds_count{method="POST",route="/api/process"}' in text
+            assert 'taara_circuit_open 0' in text
+        finally:
+            agent.calendars.close()
+            (agent.calendars, agent.calendar, agent.check_policies, agent.armoriq.api_endpoint,
+             agent.armoriq.create_audit_log) = previous
+
+def test_handler_server_timing():
+    print("\n🧪 Testing handler Server-Timing...")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+    import process
+
+    response = process.handler({'requestContext': {'http': {'method': 'GET'}}}, None)
+    assert response['headers']['Server-Timing'].startswith("total;dur=")
+    assert 'Server-Timing' in response['headers']['Access-Control-Expose-Headers'].split(', ')
+
+    # Batch commands run on a thread pool; their stages must still be timed
+    def parse_only(text, user_id='anonymous'):
+        with span('parse'):
+            return {'command': text}
+
+    agent = process.get_agent()
+    previous = agent.process
+    agent.process = parse_only
+    try:
+        response = process.handler({'requestContext': {'http': {'method': 'POST'}}, 'rawPath': '/api/process/batch',
+                                    'body': '["a", "b"]'}, None)
+    finally:
+        agent.process = previous
+    assert response['statusCode'] == 200, response
+    stages = [entry.split(';')[0] for entry in response['headers']['Server-Timing'].split(', ')]
+    assert stages == ["parse", "total"]
+
+if __name__ == "__main__":
+    test_registry_render()
+    test_spans_and_server_timing()
+    test_web_metrics_and_headers()
+    test_handler_server_timing()
+    print("\n✅ Metrics tests passed")
@@ -0,0 +1,58 @@
+﻿import os
+import tempfile
+
+from policy_engine import CompiledPolicies, PolicyStore
+
+POLICIES = [
+    {"name": "no_dangerous_ops", "type": "operation_restriction", "blocked_ops": ["delete_all", "clear"]},
+    {"name": "work_hours", "type": "time_restriction", "allowed_hours": [9, 10, 11, 12, 13, 14, 15, 16, 17]},
+    {"name": "no_evening_tasks", "type": "time_restriction", "allowed_hours": list(range(0, 20))},
+    {"name": "no_tasks", "type": "operation_restriction", "blocked_ops": ["task"]},
+]
+
+def reference_check(policies, action, hour):
+    """The original linear scan over the raw policy dicts"""
+    for policy in policies:
+        if policy.get('type') == 'time_restriction':
+            if hour not in policy.get('allowed_hours', []):
+                return False, f"Not allowed at {hour}:00"
+        if policy.get('type') == 'operation_restriction':
+            if action in policy.get('blocked_ops', []):
+                return False, f"Operation '{action}' is blocked"
+    return True, "Allowed"
+
+def test_compiled_matches_reference():
+    print("\n🧪 Testing compiled policy decisions...")
+    for policies in (POLICIES, POLICIES[::-1], POLICIES[:1], []):
+        compiled = CompiledPolicies(policies)
+        for action in ["schedule", "remind", "task", "list", "delete_all", "clear", "unknown"]:
+            for hour in range(24):
+                assert compiled.check(action, hour) == reference_check(policies, action, hour)
+
+def test_hot_reload():
+    print("\n🧪 Testing policy hot reload...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "policies.yaml")
+        with open(path, 'w') as f:
+            f.write('- type: "operation_restriction"\n  blocked_ops: ["delete_all"]\n')
+        store = PolicyStore(path, check_interval=0)
+        before = store.current()
+        assert before.check("task", 3) == (True, "Allowed")
+
+        with open(path, 'w') as f:
+            f.write('- type: "operation_restriction"\n  blocked_ops: ["delete_all", "task"]\n')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+        assert store.current().check("task", 3) == (False, "Operation 'task' is blocked")
+        # Requests holding the old set are unaffected
+        assert before.check("task", 3) == (True, "Allowed")
+
+        # A broken file keeps the last good policies
+        with open(path, 'w') as f:
+            f.write('- [unclosed\n')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2 * 10**9))
+        assert store.current().check("task", 3) == (False, "Operation 'task' is blocked")
+        assert store.error is not None
+
+if __name__ == "__main__":
+    test_compiled_matches_reference()
+    test_hot_reload()
@@ -0,0 +1,198 @@
+﻿import os
+import tempfile
+
+from calendar_store import REJECT, WARN, ConflictError, JsonCalendarStore, SQLiteCalendarStore
+from recurrence import describe_rule, normalize_rule, occurrences, parse_recurrence, set_exception
+
+WEEKDAYS = {"freq": "weekly", "weekdays": [0, 1, 2, 3, 4]}
+
+def test_parse_recurrence():
+    print("\n🧪 Testing recurrence parsing...")
+    cases = {
+        "standup every weekday at 10am": {"freq": "weekly", "weekdays": [0, 1, 2, 3, 4]},
+        "meeting every day at 9": {"freq": "daily"},
+        "daily sync": {"freq": "daily"},
+        "meeting every other monday and friday": {"freq": "weekly", "weekdays": [0, 4], "interval": 2},
+        "review every tuesdays, thursdays until 2026-12-31": {"freq": "weekly", "weekdays": [1, 3],
+                                                              "until": "2026-12-31"},
+        "meeting tomorrow at 3pm": None,
+    }
+    for text, rule in cases.items():
+        assert parse_recurrence(text)[0] == rule, text
+    assert parse_recurrence("standup every weekday at 10am")[1] == "standup  at 10am"
+    assert describe_rule(normalize_rule(cases["meeting every other monday and friday"])) == \
+        "every other monday, friday"
+
+    for bad in ({"freq": "hourly"}, {"freq": "daily", "interval": 0}, {"freq": "weekly", "weekdays": [7]}):
+        try:
+            normalize_rule(bad)
+            assert False, f"expected {bad} to be rejected"
+        except ValueError:
+            pass
+
+def test_lazy_expansion_and_exceptions():
+    print("\n🧪 Testing lazy occurrence expansion...")
+    series = {"id": 1, "title": "Standup", "date": "2026-03-04", "time": "10:00", "recurrence": WEEKDAYS}
+    dates = [o["date"] for o in occurrences(series, "2026-03-01", "2026-03-10")]
+    assert dates == ["2026-03-04", "2026-03-05", "2026-03-06", "2026-03-09", "2026-03-10"]
+
+    # Open-ended series are generated on demand, not listed up front
+    endless = occurrences(series)
+    assert next(endless)["date"] == "2026-03-04"
+
+    set_exception(series, "2026-03-05")
+    set_exception(series, "2026-03-06", {"time": "11:30"})
+    expanded = [(o["date"], o["time"]) for o in occurrences(series, "2026-03-05", "2026-03-06")]
+    assert expanded == [("2026-03-06", "11:30")]
+    assert "exdates" not in next(occurrences(series))
+    try:
+        set_exception(series, "2026-03-07")
+        assert False, "a Saturday is not an occurrence"
+    except ValueError:
+        pass
+
+    every_third = {"id": 2, "date": "2026-03-01", "recurrence": {"freq": "daily", "interval": 3}}
+    assert [o["date"] for o in occurrences(every_third, "2026-03-05", "2026-03-11")] == ["2026-03-07", "2026-03-10"]
+
+def test_store_merges_series_with_one_offs():
+    print("\n🧪 Testing range reads over recurring and one-off events...")
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (SQLiteCalendarStore(os.path.join(tmp, "calendar.db")),
+                      JsonCalendarStore(os.path.join(tmp, "calendar.json"))):
+            series = store.add_event({"title": "Standup", "date": "2026-03-02", "time": "9:00",
+                                      "recurrence": WEEKDAYS})
+            store.add_event({"title": "Review", "date": "2026-03-03", "time": "8:00"})
+            store.add_event({"title": "Lunch", "date": "2026-03-03", "time": "12:00"})
+            assert store.count() == 3
+
+            page = store.query("2026-03-02", "2026-03-04", limit=3)
+            assert [(e["date"], e["title"]) for e in page["events"]] == [
+                ("2026-03-02", "Standup"), ("2026-03-03", "Review"), ("2026-03-03", "Standup")]
+            rest = store.query("2026-03-02", "2026-03-04", cursor=page["next_cursor"], limit=3)
+            assert [(e["date"], e["title"]) for e in rest["events"]] == [
+                ("2026-03-03", "Lunch"), ("2026-03-04", "Standup")]
+
+            clash = store.add_event({"title": "Call", "date": "2026-03-05", "time": "9:15"}, on_conflict=WARN)
+            assert clash["conflicts"][0]["date"] == "2026-03-05"
+            assert store.free_slot(60, "2026-03-05", after=8 * 60 + 30)["time"] == "9:45"
+
+            store.cancel_occurrence(series["id"], "2026-03-03")
+            updated = store.update_occurrence(series["id"], "2026-03-04", {"time": "7:30"})
+            assert updated["version"] == store.version() and store.changes(updated["version"] - 1)["events"][0]["id"] == 1
+            titles = [(e["date"], e["time"], e["title"]) for e in store.query("2026-03-03", "2026-03-04")["events"]]
+            assert titles == [("2026-03-03", "8:00", "Review"), ("2026-03-03", "12:00", "Lunch"),
+                              ("2026-03-04", "7:30", "Standup")]
+            try:
+                store.cancel_occurrence(clash["id"], "2026-03-05")
+                assert False, "one-off events have no occurrences"
+            except ValueError:
+                pass
+            store.close()
+
+def test_paging_open_ended_series_ends():
+    print("\n🧪 Testing pages through an open-ended series...")
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in (SQLiteCalendarStore(os.path.join(tmp, "calendar.db")),
+                      JsonCalendarStore(os.path.join(tmp, "calendar.json"))):
+            store.add_event({"title": "Standup", "date": "2026-03-02", "time": "9:00", "recurrence": {"freq": "daily"}})
+            store.add_event({"title": "Lunch", "date": "2026-03-03", "time": "12:00"})
+            for date_from in (None, "2026-06-01"):
+                everything = store.query(date_from)["events"]
+                paged, cursor = [], None
+                # Each page used to push the series' horizon along with it
+                for _ in range(len(everything)):
+                    page = store.query(date_from, cursor=cursor, limit=50)
+                    paged += page["events"]
+                    cursor = page["next_cursor"]
+                    if cursor is None:
+                        break
+                assert cursor is None and paged == everything, date_from
+            assert len(store.query()["events"]) == 368
+            store.close()
+
+def test_series_conflicts_on_every_occurrence():
+    print("\n🧪 Testing conflicts for every occurrence of a series...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteCalendarStore(os.path.join(tmp, "calendar.db"))
+        store.add_event({"title": "Dentist", "date": "2026-03-11", "time": "9:00"})
+        # Expanded (and cached) before the series exists
+        assert store.free_slot(60, "2026-03-12", after=8 * 60)["time"] == "8:00"
+        sync = store.add_event({"title": "Sync", "date": "2026-03-02", "time": "8:30",
+                                "recurrence": {"freq": "weekly"}})
+
+        # Only the second Wednesday clashes, with the one-off
+        try:
+            store.add_event({"title": "Standup", "date": "2026-03-02", "time": "9:00",
+                             "recurrence": {"freq": "weekly", "weekdays": [2], "until": "2026-03-18"}},
+                            on_conflict=REJECT)
+            assert False, "expected the later occurrence to clash"
+        except ConflictError as e:
+            assert [(c["title"], c["date"]) for c in e.conflicts] == [("Dentist", "2026-03-11")]
+            assert "on 2026-03-11" in str(e)
+        clashes = store.conflicts({"title": "Call", "date": "2026-03-05", "time": "8:45",
+                                   "recurrence": {"freq": "weekly", "until": "2026-03-20"}})
+        assert clashes == []
+        clashes = store.conflicts({"title": "Call", "date": "2026-03-02", "time": "8:45",
+                                   "recurrence": {"freq": "daily", "until": "2026-03-16"}})
+        assert [c["date"] for c in clashes] == ["2026-03-02", "2026-03-09", "2026-03-11", "2026-03-16"]
+
+        # Cached days follow new series and exceptions; free slots see both kinds of event
+        assert store.free_slot(60, "2026-03-09", after=8 * 60)["time"] == "9:00"
+        store.update_occurrence(sync["id"], "2026-03-09", {"time": "10:00"})
+        assert store.free_slot(60, "2026-03-09", after=8 * 60)["time"] == "8:00"
+        assert store.free_slot(90, "2026-03-11", after=8 * 60)["time"] == "9:30"
+        store.close()
+
+def test_other_process_sees_exceptions():
+    print("\n🧪 Testing exceptions made through another connection...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calendar.db")
+        reader, writer = SQLiteCalendarStore(path), SQLiteCalendarStore(path)
+        series = writer.add_event({"title": "Standup", "date": "2026-03-02", "time": "9:00", "recurrence": WEEKDAYS})
+        assert len(reader.query("2026-03-02", "2026-03-06")["events"]) == 5
+        writer.cancel_occurrence(series["id"], "2026-03-04")
+        assert "2026-03-04" not in [e["date"] for e in reader.query("2026-03-02", "2026-03-06")["events"]]
+        reader.close()
+        writer.close()
+
+def test_web_occurrence_exceptions():
+    print("\n🧪 Testing /api/calendar/{id}/exceptions...")
+    from fastapi.testclient import TestClient
+    from calendar_store import ShardedCalendarStore
+    import web_app
+
+    agent = web_app.agent
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = (agent.calendars, agent.calendar, agent.check_policies, agent.armoriq)
+        agent.calendars = ShardedCalendarStore(tmp)
+        agent.calendar = agent.calendars.shard()
+        agent.check_policies = lambda action, params: (True, "ok")
+        agent.armoriq = None
+        try:
+            client = TestClient(web_app.app)
+            alice = {"X-User-Id": "alice"}
+            created = client.post("/api/process", json={"text": "Schedule a standup every weekday at 10am"},
+                                  headers=alice).json()["result"]["event"]
+            assert created["recurrence"]["weekdays"] == [0, 1, 2, 3, 4]
+            dates = [e["date"] for e in client.get("/api/calendar", headers=alice).json()["events"][:3]]
+
+            url = f"/api/calendar/{created['id']}/exceptions"
+            assert client.post(url, json={"date": dates[0], "cancel": True}, headers=alice).status_code == 200
+            moved = client.post(url, json={"date": dates[1], "time": "11:00"}, headers=alice).json()
+            assert moved["event"]["exdates"] == [dates[0]] and moved["version"] == 3
+            first = client.get("/api/calendar", headers=alice).json()["events"][0]
+            assert (first["date"], first["time"]) == (dates[1], "11:00")
+            assert client.post(url, json={"date": dates[2]}, headers=alice).status_code == 400
+            assert client.post(url, json={"date": dates[0], "cancel": True}).status_code == 400
+        finally:
+            agent.calendars.close()
+            agent.calendars, agent.calendar, agent.check_policies, agent.armoriq = previous
+
+if __name__ == "__main__":
+    test_parse_recurrence()
+    test_lazy_expansion_and_exceptions()
+    test_store_merges_series_with_one_offs()
+    test_paging_open_ended_series_ends()
+    test_series_conflicts_on_every_occurrence()
+    test_other_process_sees_exceptions()
+    test_web_occurrence_exceptions()
@@ -0,0 +1,256 @@
+﻿import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from calendar_store import ShardedCalendarStore
+from singleflight import (AsyncSingleFlight, IdempotencyConflict, IdempotencyStore, SingleFlight,
+                          flight_key, normalize_command)
+
+def test_normalize_command():
+    print("\n🧪 Testing command normalization...")
+    assert normalize_command("  Schedule a   Meeting\tat 3PM ") == "schedule a meeting at 3pm"
+    assert flight_key("alice", "Add task: x") != flight_key("bob", "Add task: x")
+
+def test_threads_share_one_call():
+    print("\n🧪 Testing single-flight across threads...")
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return {'n': len(calls)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('k', work))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and flights.shared == 7
+    assert all(result == {'n': 1} for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flights.do('k', lambda: 'again') == ('again', False)
+
+    def fail():
+        raise RuntimeError("boom")
+    try:
+        flights.do('k', fail)
+        assert False, "expected the error to propagate"
+    except RuntimeError:
+        pass
+    assert flights.do('k', lambda: 'recovered') == ('recovered', False)
+
+def test_async_share_one_call():
+    print("\n🧪 Testing single-flight on the event loop...")
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        results = await asyncio.gather(*(flights.do('k', work) for _ in range(5)))
+        # A caller that goes away doesn't cancel the call for the others
+        first = asyncio.ensure_future(flights.do('j', work))
+        second = asyncio.ensure_future(flights.do('j', work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return results, await second
+
+    results, (value, shared) = asyncio.run(run())
+    assert [r for r, _ in results] == [1] * 5 and flights.shared == 5
+    assert (value, shared) == (2, True) and len(calls) == 2
+
+def test_idempotency_store():
+    print("\n🧪 Testing idempotency key store...")
+    now = [0.0]
+    store = IdempotencyStore(ttl=10, max_size=2, clock=lambda: now[0])
+    store.put('alice', 'k1', 'Add task: x', {'ok': 1})
+    assert store.get('alice', 'k1', ' add TASK: x') == {'ok': 1}
+    assert store.get('bob', 'k1', 'Add task: x') is None
+    try:
+        store.get('alice', 'k1', 'Add task: y')
+        assert False, "expected a conflict"
+    except IdempotencyConflict:
+        pass
+
+    store.put('alice', 'k2', 'a', {})
+    store.put('alice', 'k3', 'b', {})
+    assert store.get('alice', 'k1', 'Add task: x') is None and store.get('alice', 'k2', 'a') == {}
+    now[0] = 11
+    assert store.get('alice', 'k3', 'b') is None
+
+def test_idempotency_reservation():
+    print("\n🧪 Testing in-flight Idempotency-Key reservations...")
+    store = IdempotencyStore(ttl=10)
+    call, owner = store.begin('alice', 'k', 'Add task: x')
+    assert owner and store.get('alice', 'k', 'Add task: x') is None
+    try:
+        store.begin('alice', 'k', 'Add task: y')
+        assert False, "a different command conflicts while the key is in flight"
+    except IdempotencyConflict:
+        pass
+
+    results = []
+    def retry():
+        waiting, owner = store.begin('alice', 'k', 'add task: x')
+        results.append((owner, store.wait(waiting)))
+    threads = [threading.Thread(target=retry) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    response = {'result': {'ids': [1]}}
+    store.finish('alice', 'k', call, response)
+    for thread in threads:
+        thread.join()
+    assert [owner for owner, _ in results] == [False] * 3
+    # Each caller gets its own copy; the stored response is unaffected by edits
+    response['result']['ids'].append(2)
+    results[0][1]['result']['ids'].append(3)
+    assert store.get('alice', 'k', 'Add task: x') == {'result': {'ids': [1]}}
+    assert results[1][1] == {'result': {'ids': [1]}}
+
+    # A failed owner frees the key and hands its error to the waiters
+    call, owner = store.begin('alice', 'j', 'Add task: z')
+    waiting, _ = store.begin('alice', 'j', 'Add task: z')
+    store.abandon('alice', 'j', call, ValueError("boom"))
+    try:
+        store.wait(waiting)
+        assert False, "expected the owner's error"
+    except ValueError:
+        pass
+    assert store.begin('alice', 'j', 'Add task: z')[1]
+
+def use_temp_calendars(agent, tmp):
+    previous = (agent.calendars, agent.calendar, agent.check_policies, agent.armoriq)
+    agent.calendars = ShardedCalendarStore(tmp)
+    agent.calendar = agent.calendars.shard()
+    agent.check_policies = lambda action, params: (True, "ok")
+    agent.armoriq = None
+    return previous
+
+def restore(agent, previous):
+    agent.calendars.close()
+    agent.calendars, agent.calendar, agent.check_policies, agent.armoriq = previous
+
+def test_web_coalesces_and_replays():
+    print("\n🧪 Testing /api/process coalescing and Idempotency-Key...")
+    import httpx
+    import web_app
+
+    agent = web_app.agent
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = use_temp_calendars(agent, tmp)
+        slow_process = agent.process_async
+
+        async def process_async(text, user_id='anonymous'):
+            await asyncio.sleep(0.05)
+            return await slow_process(text, user_id)
+
+        agent.process_async = process_async
+
+        async def run():
+            transport = httpx.ASGITransport(app=web_app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                post = lambda text, **headers: client.post(
+                    "/api/process", json={"text": text}, headers=dict({"X-User-Id": "alice"}, **headers))
+                duplicates = await asyncio.gather(*(post("Schedule a meeting at 3pm") for _ in range(4)))
+                first = await post("Add task: report", **{"Idempotency-Key": "abc"})
+                replay = await post("Add task: report", **{"Idempotency-Key": "abc"})
+                conflict = await post("Add task: other", **{"Idempotency-Key": "abc"})
+                return duplicates, first, replay, conflict
+
+        try:
+            duplicates, first, replay, conflict = asyncio.run(run())
+            assert agent.calendar_for("alice").count() == 1
+            assert len({r.json()["result"]["event"]["id"] for r in duplicates}) == 1
+            assert sum(r.headers.get("X-Coalesced") == "true" for r in duplicates) == 3
+            assert replay.json() == first.json() and replay.headers["Idempotent-Replayed"] == "true"
+            assert "Idempotent-Replayed" not in first.headers
+            assert conflict.status_code == 422
+        finally:
+            del agent.process_async
+            restore(agent, previous)
+
+def test_web_idempotency_race():
+    print("\n🧪 Testing concurrent retries with one Idempotency-Key...")
+    import httpx
+    import web_app
+
+    agent = web_app.agent
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = use_temp_calendars(agent, tmp)
+        previous_flights, web_app.flights = web_app.flights, None
+        slow_process = agent.process_async
+
+        async def process_async(text, user_id='anonymous'):
+            await asyncio.sleep(0.05)
+            return await slow_process(text, user_id)
+
+        agent.process_async = process_async
+
+        async def run():
+            transport = httpx.ASGITransport(app=web_app.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                post = lambda text: client.post("/api/process", json={"text": text},
+                                                headers={"X-User-Id": "alice", "Idempotency-Key": "race"})
+                racing = asyncio.gather(*(post("Schedule a meeting at 3pm") for _ in range(3)))
+                await asyncio.sleep(0.01)
+                # Same key, different command, while the first is still running
+                conflict = await post("Schedule a meeting at 4pm")
+                return await racing, conflict
+
+        try:
+            responses, conflict = asyncio.run(run())
+            assert agent.calendar_for("alice").count() == 1
+            assert len({json.dumps(r.json(), sort_keys=True) for r in responses}) == 1
+            assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in responses) == 2
+            assert conflict.status_code == 422
+        finally:
+            del agent.process_async
+            web_app.flights = previous_flights
+            restore(agent, previous)
+
+def test_handler_replays_idempotency_key():
+    print("\n🧪 Testing Idempotency-Key in the serverless handler...")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+    import process
+
+    agent = process.get_agent()
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = use_temp_calendars(agent, tmp)
+        event = lambda text: {
+            'requestContext': {'http': {'method': 'POST'}},
+            'headers': {'X-User-Id': 'alice', 'Idempotency-Key': 'retry-1'},
+            'body': json.dumps({'text': text})
+        }
+        try:
+            first = process.handler(event("Schedule a meeting at 4pm"), None)
+            again = process.handler(event("Schedule a meeting at 4pm"), None)
+            assert json.loads(again['body']) == json.loads(first['body'])
+            assert again['headers']['Idempotent-Replayed'] == 'true'
+            assert agent.calendar_for("alice").count() == 1
+            assert process.handler(event("Schedule a meeting at 5pm"), None)['statusCode'] == 422
+        finally:
+            restore(agent, previous)
+
+if __name__ == "__main__":
+    test_normalize_command()
+    test_threads_share_one_call()
+    test_async_share_one_call()
+    test_idempotency_store()
+    test_idempotency_reservation()
+    test_web_coalesces_and_replays()
+    test_web_idempotency_race()
+    test_handler_replays_idempotency_key()
@@ -0,0 +1,50 @@
+﻿from armoriq_integration.armoriq_client import ArmoriqClient
+from armoriq_integration.stub_server import StubArmoriqServer
+from armoriq_integration.verification_cache import VerificationCache
+
+def intent(text, kind='schedule', timestamp='2026-03-02T10:00:00'):
+    return {'raw_input': text, 'type': kind, 'parameters': {}, 'timestamp': timestamp}
+
+def test_cache_hits_skip_remote():
+    print("\n🧪 Testing verification cache...")
+    with StubArmoriqServer() as stub:
+        client = ArmoriqClient(cache=VerificationCache(ttl=60))
+        client.api_endpoint = stub.url
+
+        first = client.verify_intent(intent("schedule a meeting tomorrow at 2pm"))
+        second = client.verify_intent(intent("schedule a  meeting tomorrow at 2pm", timestamp='2026-03-02T11:00:00'))
+        assert stub.requests == 1
+        assert second['cache'] == 'hit' and 'cache' not in first
+        assert second['verification_id'] == first['verification_id']
+
+        # Dangerous intents always go to ARMORIQ
+        client.verify_intent(intent("delete everything", 'dangerous'))
+        client.verify_intent(intent("delete everything", 'dangerous'))
+        assert stub.requests == 3
+        assert client.cache.stats()['hits'] == 1
+
+def test_ttl_and_eviction():
+    print("\n🧪 Testing cache TTL and eviction...")
+    now = [0.0]
+    cache = VerificationCache(ttl=10, max_size=2, fallback_ttl=1, clock=lambda: now[0])
+    remote = {'verified': True, 'risk_score': 0.0, 'verification_id': 'remote'}
+    fallback = dict(remote, verification_id='local', mode='fallback')
+
+    cache.put(intent("a"), remote)
+    cache.put(intent("b"), fallback)
+    now[0] = 2.0
+    assert cache.get(intent("a"))['verification_id'] == 'remote'
+    assert cache.get(intent("b")) is None
+
+    cache.put(intent("c"), remote)
+    cache.put(intent("d"), remote)
+    assert cache.get(intent("a")) is None
+    cache.put(intent("e"), {'verified': False, 'error': 'Verification failed'})
+    assert cache.get(intent("e")) is None
+
+    stats = cache.stats()
+    assert (stats['size'], stats['evictions'], stats['expirations']) == (2, 1, 1)
+
+if __name__ == "__main__":
+    test_cache_hits_skip_remote()
+    test_ttl_and_eviction()
@@ -1,17 +1,88 @@
-﻿from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+﻿import asyncio
+import copy
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from simple_agent import SimpleTaara
 import uvicorn
 import json
-import os
 
-app = FastAPI(title="Taara AI Agent", description="Simple scheduler with policy enforcement")
-agent = SimpleTaara()
+import metrics
+import singleflight
+from broadcast import Broadcaster
+from calendar_store import DEFAULT_DURATION, MINUTES_PER_DAY
+from simple_agent import SimpleTaara, parse_batch
+from singleflight import AsyncSingleFlight, IdempotencyConflict, IdempotencyStore, flight_key
+
+# No banners or colours in server logs
+agent = SimpleTaara(server_mode=True)
+broadcaster = Broadcaster()
+flights = AsyncSingleFlight() if singleflight.enabled() else None
+idempotency = IdempotencyStore.from_env()
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    broadcaster.close()
+    await agent.aclose()
+
+app = FastAPI(title="Taara AI Agent", description="Simple scheduler with policy enforcement", lifespan=lifespan)
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Per-stage Server-Timing header and request latency histogram"""
+    timings = metrics.start_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    
+    route = request.scope.get('route')
+    metrics.REGISTRY.observe('taara_request_seconds', elapsed,
+                             route=route.path if route else 'unmatched', method=request.method)
+    response.headers['Server-Timing'] = metrics.server_timing(timings, elapsed)
+    return response
+
+def agent_metrics():
+    """Verification cache and circuit breaker state, read at scrape time"""
+    armoriq = agent.armoriq
+    if not armoriq:
+        return []
+    samples = []
+    if armoriq.cache:
+        for key, value in armoriq.cache.stats().items():
+            samples.append((f'taara_verification_cache_{key}', 'gauge', {}, value))
+    if armoriq.breaker:
+        snapshot = armoriq.breaker.snapshot()
+        samples.append(('taara_circuit_open', 'gauge', {}, int(snapshot['state'] != 'closed')))
+        samples.append(('taara_circuit_trips', 'gauge', {}, snapshot['trips']))
+        samples.append(('taara_circuit_rejected', 'gauge', {}, snapshot['rejected']))
+    return samples
+
+def stream_metrics():
+    return [('taara_stream_clients', 'gauge', {}, broadcaster.clients())]
+
+metrics.REGISTRY.add_collector(agent_metrics)
+metrics.REGISTRY.add_collector(stream_metrics)
+
+CALENDAR_PAGE_SIZE = 100
+CALENDAR_MAX_PAGE_SIZE = 1000
+AUDIT_PAGE_SIZE = 100
+AUDIT_MAX_PAGE_SIZE = 10000
 
 class Command(BaseModel):
     text: str
 
+def caller_id(x_user_id: Optional[str] = Header(None), user: Optional[str] = Query(None)):
+    """Calendar owner: the X-User-Id header or ?user=, else the anonymous shard
+
+    The id is taken on trust, not authenticated: it only keeps honest
+    clients apart. Put an authenticating proxy in front that sets
+    X-User-Id before exposing the server to untrusted callers.
+    """
+    return x_user_id or user or 'anonymous'
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     return """
@@ -75,47 +146,218 @@ async def root():
     </html>
     """
 
+async def run_command(text, user_id):
+    response = await agent.process_async(text, user_id)
+    broadcaster.publish_response(user_id, response)
+    if response['allowed']:
+        # The new event is already in result; clients catch up with /api/calendar?since=
+        response['calendar_version'] = await asyncio.to_thread(agent.calendar_for(user_id).version)
+    return response
+
 @app.post("/api/process")
-async def process_command(command: Command):
+async def process_command(
+    command: Command,
+    http_response: Response,
+    user_id: str = Depends(caller_id),
+    idempotency_key: Optional[str] = Header(None)
+):
     try:
-        # Parse
-        action, params = agent.parse_input(command.text)
-        
-        # Check policies
-        allowed, reason = agent.check_policies(action, params)
-        
-        if not allowed:
-            return {
-                "allowed": False,
-                "reason": reason,
-                "action": action
-            }
+        call = None
+        if idempotency_key and idempotency:
+            # Reserved before running, so a retry racing this request waits for it
+            call, owner = idempotency.begin(user_id, idempotency_key, command.text)
+            if not owner:
+                if call.done.is_set():
+                    response = idempotency.wait(call)
+                else:
+                    response = await asyncio.to_thread(idempotency.wait, call)
+                metrics.REGISTRY.inc('taara_idempotent_replays_total')
+                http_response.headers['Idempotent-Replayed'] = 'true'
+                return response
         
-        # Execute
-        result = agent.execute_action(action, params)
+        try:
+            # Duplicates of a command still in flight share its result
+            if flights:
+                response, shared = await flights.do(flight_key(user_id, command.text),
+                                                    lambda: run_command(command.text, user_id))
+                if shared:
+                    response = copy.deepcopy(response)
+                    metrics.REGISTRY.inc('taara_coalesced_requests_total')
+                    http_response.headers['X-Coalesced'] = 'true'
+            else:
+                response = await run_command(command.text, user_id)
+        except BaseException as e:
+            if call is not None:
+                idempotency.abandon(user_id, idempotency_key, call, e)
+            raise
         
-        # Read calendar to show
-        calendar_data = {}
-        if os.path.exists(agent.calendar_file):
-            with open(agent.calendar_file, 'r') as f:
-                calendar_data = json.load(f)
-        
-        return {
-            "allowed": True,
-            "message": result['message'],
-            "action": action,
-            "calendar": calendar_data
-        }
+        if call is not None:
+            idempotency.finish(user_id, idempotency_key, call, response)
+        return response
         
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/process/batch")
+async def process_batch(request: Request, user_id: str = Depends(caller_id)):
+    """Run a JSON array or NDJSON body of commands, streaming NDJSON results"""
+    try:
+        texts = parse_batch(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    def results():
+        for result in agent.process_batch(texts, user_id):
+            broadcaster.publish_response(user_id, result)
+            yield json.dumps(result) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/api/stream")
+async def stream(user_id: str = Depends(caller_id)):
+    """Server-Sent Events: 'decision' and 'calendar' updates for the caller's dashboards"""
+    async def frames():
+        # Subscribe once the body streams, so a client gone before then leaves
+        # nothing behind; the first frame (retry:) follows the subscription
+        subscription = broadcaster.subscribe(user_id)
+        try:
+            async for frame in subscription.frames():
+                yield frame
+        finally:
+            broadcaster.unsubscribe(subscription)
+    
+    return StreamingResponse(frames(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+def calendar_etag(version):
+    return f'"v{version}"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or 'W/' + etag in tags
+
+# Plain def: FastAPI runs it in the threadpool, off the event loop
 @app.get("/api/calendar")
-async def get_calendar():
-    if os.path.exists(agent.calendar_file):
-        with open(agent.calendar_file, 'r') as f:
-            return json.load(f)
-    return {"events": []}
+def get_calendar(
+    response: Response,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(CALENDAR_PAGE_SIZE, ge=1, le=CALENDAR_MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    since: Optional[int] = Query(None, ge=0),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(caller_id)
+):
+    calendar = agent.calendar_for(user_id)
+    # Every write (a new event or a change to one occurrence of a series) bumps
+    # the version, so it identifies every view of the calendar. Read it first:
+    # a write racing the query can only make the body newer.
+    version = calendar.version()
+    etag = calendar_etag(version)
+    headers = {"ETag": etag, "Vary": "X-User-Id", "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    if since is not None:
+        changes = calendar.changes(since, limit)
+        if fields:
+            changes["events"] = [{field: event[field] for field in fields.split(',') if field in event}
+                                 for event in changes["events"]]
+        return changes
+    try:
+        page = calendar.query(
+            date_from, date_to, cursor, limit,
+            fields=fields.split(',') if fields else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    page["version"] = version
+    return page
+
+class OccurrenceChange(BaseModel):
+    date: str
+    cancel: bool = False
+    time: Optional[str] = None
+    duration: Optional[int] = None
+    title: Optional[str] = None
+
+# Cancel or change one occurrence of a recurring event
+@app.post("/api/calendar/{event_id}/exceptions")
+def add_occurrence_exception(event_id: int, change: OccurrenceChange, user_id: str = Depends(caller_id)):
+    allowed, reason = agent.check_policies("update_occurrence", {"event_id": event_id, "date": change.date})
+    if not allowed:
+        raise HTTPException(status_code=403, detail=f"Blocked: {reason}")
+    changes = None
+    if not change.cancel:
+        changes = {field: value for field, value in
+                   (("time", change.time), ("duration", change.duration), ("title", change.title)) if value is not None}
+        if not changes:
+            raise HTTPException(status_code=400, detail="Nothing to change: set cancel or time/duration/title")
+    try:
+        event = agent.calendar_for(user_id).update_occurrence(event_id, change.date, changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    broadcaster.publish(user_id, 'calendar', {'event': event, 'version': event['version']})
+    return {"event": event, "version": event["version"]}
+
+@app.get("/api/calendar/free")
+def get_free_slot(
+    minutes: int = Query(DEFAULT_DURATION, ge=1, le=MINUTES_PER_DAY),
+    date: Optional[str] = None,
+    user_id: str = Depends(caller_id)
+):
+    """Next free slot of ``minutes`` within the policy's allowed hours"""
+    params = {"duration": minutes, "user_id": user_id}
+    if date:
+        params["date"] = date
+    try:
+        return agent.find_free_slot(params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def stream_audit_page(items):
+    """Render AuditIndex.query items as one JSON document, entry by entry"""
+    yield '{"entries": ['
+    separator = ''
+    for kind, value in items:
+        if kind == 'entry':
+            yield separator + json.dumps(value)
+            separator = ', '
+        else:
+            yield '], "next_cursor": ' + json.dumps(value) + '}'
+
+@app.get("/api/audit")
+def get_audit(
+    user_id: str = Depends(caller_id),
+    action: Optional[str] = None,
+    outcome: Optional[str] = Query(None, pattern="^(allowed|blocked)$"),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(AUDIT_PAGE_SIZE, ge=1, le=AUDIT_MAX_PAGE_SIZE)
+):
+    if not agent.armoriq or not agent.armoriq.audit_index:
+        raise HTTPException(status_code=503, detail="Audit index not available")
+    
+    # Callers only see their own decisions; include entries still waiting in the writer's queue
+    agent.armoriq.audit_writer.flush(timeout=1.0)
+    try:
+        items = agent.armoriq.audit_index.query(user_id, action, outcome, since, until, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(stream_audit_page(items), media_type="application/json")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)